@@ -0,0 +1,278 @@
+import logging
+from datetime import UTC, datetime, timedelta
+from time import monotonic
+from typing import Any
+
+import numpy as np
+
+from langchain_core.messages import BaseMessage
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import PyMongoError
+
+from .memory.indexes import IndexRegistry, IndexStatus
+from .query_rewrite import WORD, needs_rewrite
+
+logger = logging.getLogger(__name__)
+
+# answers to these depend on when or by whom the question is asked
+TIME_WORDS = frozenset({
+    "now", "today", "tonight", "tomorrow", "yesterday", "currently",
+    "still", "yet", "soon", "later", "weekend",
+})
+PERSONAL_WORDS = frozenset({"my", "mine", "our", "ours"})
+
+
+def is_context_free(question: str, chat_history: list[BaseMessage]) -> bool:
+    """Whether the answer to the question would be the same for any guest
+    at any time: it does not refer to the chat history, to the guest's own
+    stay or to the current time."""
+    words = set(WORD.findall(question.casefold()))
+    return not (
+        needs_rewrite(question, chat_history)
+        or words & TIME_WORDS
+        or words & PERSONAL_WORDS
+    )
+
+
+class SemanticAnswerCache:
+    """Answers to earlier questions, looked up by the similarity of the
+    question embeddings.
+
+    The entries are kept in memory as a matrix of normalized embeddings, so
+    that a lookup is one matrix-vector product, and in a MongoDB collection
+    with a TTL index, so that they outlive restarts. An entry is returned if
+    its question has a cosine similarity of at least `min_similarity` with
+    the question asked and it has not expired.
+
+    Every entry records the version of the business document it was
+    answered from. The ingestion app increments the version in the
+    `versions` collection when the document is ingested again. The version
+    is read at most once every `version_check_interval` seconds; a new
+    version drops the entries of the old ones.
+
+    Instantiate:
+        .. code-block:: python
+
+            cache = SemanticAnswerCache(
+                collection=db["answer_cache"],
+                versions=db["document_versions"],
+                document="Hotel California",
+                min_similarity=0.95,
+                ttl_seconds=24 * 60 * 60,
+                max_entries=1000,
+                version_check_interval=30,
+            )
+            await cache.aload()
+            version = await cache.aget_version()
+            answer = await cache.alookup(embedding)
+            if answer is None:
+                ...     # answer the question
+                await cache.aadd(question, embedding, answer, version=version)  # noqa: E501
+    """
+
+    index_name = "for_expiry"
+
+    def __init__(
+        self,
+        *,
+        collection: AsyncIOMotorCollection,
+        versions: AsyncIOMotorCollection,
+        document: str,
+        min_similarity: float = 0.95,
+        ttl_seconds: float = 24 * 60 * 60,
+        max_entries: int = 1000,
+        version_check_interval: float = 30,
+    ) -> None:
+        self.collection = collection
+        self.versions = versions
+        self.document = document
+        self.min_similarity = min_similarity
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version_check_interval = version_check_interval
+        self._version: int | None = None
+        self._checked_at: float | None = None
+        # oldest first; the rows of the matrix follow the same order
+        self._entries: list[dict] = []
+        self._matrix: np.ndarray | None = None
+        self._expires_at = np.empty(0)
+        # metrics
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._db_errors = 0
+
+    @property
+    def version(self) -> int | None:
+        """The version of the business document last read."""
+        return self._version
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "invalidations": self._invalidations,
+            "document_version": self._version,
+            "db_errors": self._db_errors,
+        }
+
+    async def acreate_index(self, registry: IndexRegistry) -> IndexStatus:
+        """Let MongoDB delete the entries once they expire."""
+        return await registry.aensure(
+            self.collection,
+            keys=[("expires_at", 1)],
+            name=self.index_name,
+            expireAfterSeconds=0,
+        )
+
+    async def aload(self) -> int:
+        """Read the unexpired entries of the current document version.
+        Returns their number."""
+        await self.aget_version()
+        cursor = self.collection.find(
+            {
+                "document_version": self._version,
+                "expires_at": {"$gt": datetime.now(UTC)},
+            },
+            {"_id": 0, "question": 1, "embedding": 1, "answer": 1, "expires_at": 1},  # noqa: E501
+            sort=[("expires_at", -1)],
+            limit=self.max_entries,
+        )
+        self._entries = [
+            self._to_entry(
+                doc["question"],
+                doc["embedding"],
+                doc["answer"],
+                doc["expires_at"],
+            )
+            async for doc in cursor
+        ][::-1]
+        self._matrix = None
+        return len(self._entries)
+
+    async def aget_version(self) -> int:
+        """The version of the business document, dropping the entries of
+        older versions when it changed."""
+        now = monotonic()
+        if (
+            self._checked_at is not None
+            and now - self._checked_at < self.version_check_interval
+        ):
+            return self._version
+        self._checked_at = now
+        doc = await self.versions.find_one({"_id": self.document})
+        version = doc.get("version", 0) if doc else 0
+        if version != self._version:
+            if self._version is not None:
+                self._invalidations += 1
+            self._version = version
+            self._entries = []
+            self._matrix = None
+            await self.collection.delete_many(
+                {"document_version": {"$ne": version}}
+            )
+        return version
+
+    async def alookup(self, embedding: list[float]) -> str | None:
+        """The answer to the most similar question asked before, if it is
+        similar enough."""
+        await self.aget_version()
+        answer = self._lookup(embedding)
+        if answer is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return answer
+
+    async def aadd(
+        self,
+        question: str,
+        embedding: list[float],
+        answer: str,
+        *,
+        version: int,
+    ) -> None:
+        """Cache an answer made from the given version of the document,
+        unless the document has changed since. As it is not waited for,
+        MongoDB errors are logged rather than raised."""
+        try:
+            if version != await self.aget_version():
+                return
+        except PyMongoError as e:
+            self._db_error(e)
+            return
+        expires_at = datetime.now(UTC) + timedelta(seconds=self.ttl_seconds)
+        self._entries.append(
+            self._to_entry(question, embedding, answer, expires_at)
+        )
+        self._matrix = None
+        if len(self._entries) > self.max_entries:
+            self._evict()
+        try:
+            await self.collection.insert_one({
+                "question": question,
+                "embedding": embedding,
+                "answer": answer,
+                "expires_at": expires_at,
+                "document_version": version,
+            })
+        except PyMongoError as e:
+            self._db_error(e)
+
+    def _lookup(self, embedding: list[float]) -> str | None:
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            self._build()
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        scores = self._matrix @ query
+        # expired entries can never win
+        scores[self._expires_at <= datetime.now(UTC).timestamp()] = -1
+        best = int(np.argmax(scores))
+        if scores[best] < self.min_similarity:
+            return None
+        return self._entries[best]["answer"]
+
+    def _build(self) -> None:
+        self._matrix = np.stack([entry["vector"] for entry in self._entries])
+        self._expires_at = np.array(
+            [entry["expires_at"] for entry in self._entries]
+        )
+
+    def _evict(self) -> None:
+        """Drop the expired entries, then the oldest ones, down to
+        `max_entries`."""
+        now = datetime.now(UTC).timestamp()
+        entries = [e for e in self._entries if e["expires_at"] > now]
+        self._entries = entries[len(entries) - self.max_entries:] if (
+            len(entries) > self.max_entries
+        ) else entries
+        self._matrix = None
+
+    def _to_entry(
+        self,
+        question: str,
+        embedding: list[float],
+        answer: str,
+        expires_at: datetime,
+    ) -> dict:
+        # a float32 array takes a sixth of the memory of a list of floats
+        return {
+            "question": question,
+            "vector": self._normalize(np.asarray(embedding, dtype=np.float32)),  # noqa: E501
+            "answer": answer,
+            "expires_at": expires_at.timestamp(),
+        }
+
+    def _db_error(self, error: PyMongoError) -> None:
+        self._db_errors += 1
+        logger.error(error)
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
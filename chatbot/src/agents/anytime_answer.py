@@ -0,0 +1,84 @@
+from asyncio import wait_for
+from typing import Any
+
+from .base import BaseChains, ChatModelWithErrorHandling
+from .prompt_templates import (
+    ANYTIME_ANSWER_HUMAN_PROMPT,
+    ANYTIME_ANSWER_SYSTEM_PROMPT,
+)
+from .typing import LLMOutput
+
+from utils.config import (
+    ANYTIME_ANSWER_MODEL_NAME,
+    ANYTIME_ANSWER_TEMPERATURE,
+    LOCAL_DEBUG,
+)
+
+
+class AnytimeAnswerer(BaseChains):
+    """Answers a question from the progress a graph run made before it was
+    cut short, so that a run that hit its deadline still returns what it
+    found.
+
+    In order of preference, the answer is
+    - the response the run already produced,
+    - a short answer a fast LLM writes from the completed plan steps and
+      the retrieved context, within `timeout` seconds,
+    - the output of the last completed step, if the LLM call fails or
+      does not finish in time.
+
+    Returns None when the run made no usable progress.
+
+    Instantiate:
+        .. code-block:: python
+
+            answerer = AnytimeAnswerer()
+            answer = await answerer.ainvoke(
+                question="When does the pool open?",
+                progress={"past_steps": [("Look up pool hours", "7am")]},
+                timeout=3,
+            )
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._llm = ChatModelWithErrorHandling(
+            model=ANYTIME_ANSWER_MODEL_NAME,
+            temperature=ANYTIME_ANSWER_TEMPERATURE,
+            max_retries=0,
+        )
+        self._chain = self._get_str_output_chain(
+            llm=self._llm,
+            system_prompt=ANYTIME_ANSWER_SYSTEM_PROMPT,
+            human_prompt=ANYTIME_ANSWER_HUMAN_PROMPT,
+        )
+
+    async def ainvoke(
+        self, *, question: str, progress: dict[str, Any], timeout: float
+    ) -> str | None:
+        if progress.get("response"):
+            return progress["response"]
+        past_steps = progress.get("past_steps") or []
+        retrieved_context = progress.get("retrieved_context") or ""
+        if not (past_steps or retrieved_context):
+            return None
+        last_output = past_steps[-1][1] if past_steps else None
+        try:
+            output: LLMOutput = await wait_for(
+                self._chain.ainvoke({
+                    "input": question,
+                    "past_steps": "\n".join(
+                        f"{i}. {step}: {result}"
+                        for i, (step, result) in enumerate(past_steps, 1)
+                    ),
+                    "retrieved_context": retrieved_context,
+                }),
+                timeout=timeout
+            )
+        except TimeoutError:
+            return last_output
+        if LOCAL_DEBUG:
+            print(f"-------ANYTIME ANSWER-------\n{repr(output)}\n")
+        if output["error"]:
+            return last_output
+        return output["output"]
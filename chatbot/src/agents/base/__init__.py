@@ -1,8 +1,18 @@
 from .base import BaseChains, ChatModelWithErrorHandling
+from .deadline import (
+    DEADLINE_KEY,
+    has_time_for,
+    is_past_deadline,
+    time_left,
+)
 from .graph import BaseGraph
 
 __all__ = [
     "BaseChains",
     "BaseGraph",
-    "ChatModelWithErrorHandling"
+    "ChatModelWithErrorHandling",
+    "DEADLINE_KEY",
+    "has_time_for",
+    "is_past_deadline",
+    "time_left",
 ]
@@ -30,8 +30,9 @@ from openai import (
     RateLimitError,
 )
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
+from .deadline import time_left
 from ..typing import LLMOutput
 
 from utils.config import (
@@ -42,10 +43,36 @@ from utils.config import (
 
 
 class ChatModelWithErrorHandling(ChatOpenAI):
+    """A chat model that returns errors as a message instead of raising.
+
+    When the config carries a deadline, the request timeout is shrunk to
+    the time left, and no request is made once the deadline has passed.
+    The timeout applies to every attempt, so the request is not retried
+    unless all attempts fit in the time left.
+    """
+
+    _without_retries: "ChatModelWithErrorHandling | None" = PrivateAttr(
+        default=None
+    )
 
     def __init__(self, **kwargs: Any) -> None:
         super().__init__(**kwargs)
 
+    def without_retries(self) -> "ChatModelWithErrorHandling":
+        """A copy of the model whose client makes a single attempt."""
+        if not self.max_retries:
+            return self
+        if self._without_retries is None:
+            root_async_client = self.root_async_client.with_options(
+                max_retries=0
+            )
+            self._without_retries = self.model_copy(update={
+                "max_retries": 0,
+                "root_async_client": root_async_client,
+                "async_client": root_async_client.chat.completions,
+            })
+        return self._without_retries
+
     async def ainvoke(
         self,
         input: LanguageModelInput,
@@ -54,9 +81,24 @@ class ChatModelWithErrorHandling(ChatOpenAI):
         stop: list[str] | None = None,
         **kwargs: Any
     ) -> LLMOutput:
+        left = time_left(config)
+        model = self
+        if left is not None:
+            if left <= 0:
+                return {
+                    "output": AIMessage(TIMEOUT_ERROR_MESSAGE),
+                    "error": "The deadline of the run has passed."
+                }
+            timeout = self.request_timeout
+            if not isinstance(timeout, (int, float)):
+                timeout = left
+            if timeout * (self.max_retries + 1) > left:
+                # retries would run past the deadline
+                model = self.without_retries()
+            kwargs["timeout"] = min(timeout, left)
         try:
             return {
-                "output": await super().ainvoke(
+                "output": await super(ChatModelWithErrorHandling, model).ainvoke(  # noqa: E501
                     input=input,
                     config=config,
                     stop=stop,
@@ -0,0 +1,25 @@
+from time import monotonic
+
+from langchain_core.runnables import RunnableConfig
+
+# the `time.monotonic()` by which a run has to be answered
+DEADLINE_KEY = "deadline"
+
+
+def time_left(config: RunnableConfig | None) -> float | None:
+    """Seconds left until the deadline in the config, or None if the run
+    has no deadline."""
+    deadline = (config or {}).get("configurable", {}).get(DEADLINE_KEY)
+    if deadline is None:
+        return None
+    return deadline - monotonic()
+
+
+def has_time_for(config: RunnableConfig | None, seconds: float) -> bool:
+    left = time_left(config)
+    return left is None or left >= seconds
+
+
+def is_past_deadline(config: RunnableConfig | None) -> bool:
+    left = time_left(config)
+    return left is not None and left <= 0
@@ -0,0 +1,105 @@
+import re
+from typing import Any, NamedTuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from utils.config import GREETING_RESPONSE, THANKS_RESPONSE
+
+
+class CannedResponse(NamedTuple):
+    name: str
+    pattern: re.Pattern
+    response: str
+
+
+def compile_rule(name: str, pattern: str, response: str) -> CannedResponse:
+    """A rule that answers messages matching the whole of `pattern`,
+    ignoring case and surrounding whitespace."""
+    return CannedResponse(name, re.compile(pattern, re.IGNORECASE), response)
+
+
+# the fixed replies BASE_PROMPT_TEMPLATE asks the LLM for
+DEFAULT_RULES = (
+    compile_rule(
+        "greeting",
+        r"(hi|hello|hey)( there)?( avvi)?[\s!.]*",
+        GREETING_RESPONSE,
+    ),
+    compile_rule(
+        "thanks",
+        r"(thanks|thank you|thx|ty)( so much| very much| a lot)?( avvi)?[\s!.]*",  # noqa: E501
+        THANKS_RESPONSE,
+    ),
+)
+
+
+class CannedResponder:
+    """Answers messages that have a fixed reply, such as greetings and
+    thanks, before any chat history, LLM or checkpoint is involved.
+
+    The default rules can be overridden per business with documents in a
+    collection of its database, such as
+    `{"name": "greeting", "pattern": "hi|hey", "response": "Hello!"}`.
+    A document replaces the default rule of the same name, adds a new rule
+    otherwise, and removes the rule if it has `"enabled": false`. Rules are
+    tried in order, the defaults first.
+
+    Instantiate:
+        .. code-block:: python
+
+            responder = CannedResponder()
+            await responder.aload(motor_db["canned_responses"])
+            answer = responder.match("Thank you!")  # "It's my pleasure"
+    """
+
+    def __init__(self, rules: tuple[CannedResponse, ...] = DEFAULT_RULES) -> None:  # noqa: E501
+        self._rules: dict[str, CannedResponse] = {
+            rule.name: rule for rule in rules
+        }
+        self._hits: dict[str, int] = dict.fromkeys(self._rules, 0)
+        self._misses = 0
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        short_circuited = sum(self._hits.values())
+        messages = short_circuited + self._misses
+        return {
+            "short_circuited": short_circuited,
+            "passed_through": self._misses,
+            "short_circuit_rate": (
+                short_circuited / messages if messages else 0.0
+            ),
+            "rules": dict(self._hits),
+        }
+
+    async def aload(self, collection: AsyncIOMotorCollection) -> int:
+        """Apply the overrides of the collection. Returns the number of
+        rules in use. The rules are left as they are if the collection
+        cannot be read."""
+        overrides = await collection.find({}).to_list(None)
+        for doc in overrides:
+            name = doc.get("name")
+            if not name:
+                continue
+            if not doc.get("enabled", True):
+                self._rules.pop(name, None)
+                continue
+            try:
+                self._rules[name] = compile_rule(
+                    name, doc["pattern"], doc["response"]
+                )
+            except (KeyError, re.error) as e:
+                print(f'Skipped the canned response "{name}": {e!r}')
+                continue
+            self._hits.setdefault(name, 0)
+        return len(self._rules)
+
+    def match(self, question: str) -> str | None:
+        """The canned response to the message, if it has one."""
+        text = question.strip()
+        for rule in self._rules.values():
+            if rule.pattern.fullmatch(text):
+                self._hits[rule.name] += 1
+                return rule.response
+        self._misses += 1
+        return None
@@ -0,0 +1,178 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Literal
+
+import numpy as np
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+Label = Literal["yes", "no"]
+# the decisions of the graph's entry point, as fields of the examples:
+# "relevant" is the ClassifyQuestion score, "request" the RouteQuestion one
+TASKS = ("relevant", "request")
+LABELS: tuple[Label, ...] = ("yes", "no")
+
+
+class IntentClassifier:
+    """A nearest-centroid classifier for the yes/no decisions the entry
+    point of the graph otherwise asks an LLM for.
+
+    Labeled example questions are stored in MongoDB as
+    `{"text": ..., "relevant": "yes" | "no", "request": "yes" | "no"}`,
+    either label being optional. `aload` embeds the examples that have no
+    embedding for the current model yet, stores their embeddings and
+    averages the normalized embeddings of every label into a centroid. A
+    question is scored by its cosine similarity with the centroids of a
+    task; the label is returned only if it wins by at least `min_margin`,
+    otherwise `predict` returns None and the caller asks the LLM.
+    A task with fewer than `min_examples` examples of either label is
+    always left to the LLM.
+
+    Instantiate:
+        .. code-block:: python
+
+            classifier = IntentClassifier(
+                embed=embeddings.aembed_query,
+                embed_documents=embeddings.aembed_documents,
+                embedding_model="text-embedding-3-large",
+                min_margin=0.04,
+                min_examples=5,
+            )
+            await classifier.aload(motor_db["intent_examples"])
+            label = classifier.predict("relevant", await classifier.aembed(question))  # noqa: E501
+    """
+
+    def __init__(
+        self,
+        *,
+        embed: Callable[[str], Awaitable[list[float]]],
+        embed_documents: Callable[[list[str]], Awaitable[list[list[float]]]],  # noqa: E501
+        embedding_model: str,
+        min_margin: float = 0.04,
+        min_examples: int = 5,
+        max_cached_embeddings: int = 256,
+    ) -> None:
+        self.embedding_model = embedding_model
+        self.min_margin = min_margin
+        self.min_examples = min_examples
+        self.max_cached_embeddings = max_cached_embeddings
+        self._embed = embed
+        self._embed_documents = embed_documents
+        # task -> (centroid per row, label per row)
+        self._centroids: dict[str, tuple[np.ndarray, list[Label]]] = {}
+        self._examples = 0
+        self._embeddings: OrderedDict[str, list[float]] = OrderedDict()
+        self._decisions = {
+            task: {"local": 0, "fallback": 0} for task in TASKS
+        }
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "examples": self._examples,
+            **{
+                task: {
+                    **counts,
+                    "local_rate": (
+                        counts["local"] / total
+                        if (total := counts["local"] + counts["fallback"])
+                        else 0.0
+                    ),
+                }
+                for task, counts in self._decisions.items()
+            },
+        }
+
+    async def aload(self, collection: AsyncIOMotorCollection) -> int:
+        """Read the examples, embedding the ones that need it, and fit the
+        centroids. Returns the number of examples. Failing to store the
+        new embeddings only costs embedding them again next time."""
+        docs = await collection.find(
+            {},
+            {"_id": 1, "text": 1, "embedding": 1, "embedding_model": 1, **{task: 1 for task in TASKS}},  # noqa: E501
+        ).to_list(None)
+        missing = [
+            doc for doc in docs
+            if doc.get("embedding_model") != self.embedding_model
+            or not doc.get("embedding")
+        ]
+        if missing:
+            embeddings = await self._embed_documents(
+                [doc["text"] for doc in missing]
+            )
+            for doc, embedding in zip(missing, embeddings):
+                doc["embedding"] = embedding
+            try:
+                await collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {"_id": doc["_id"]},
+                            {"$set": {
+                                "embedding": doc["embedding"],
+                                "embedding_model": self.embedding_model,
+                            }},
+                        )
+                        for doc in missing
+                    ],
+                    ordered=False,
+                )
+            except PyMongoError as e:
+                logger.error(e)
+        self.fit(docs)
+        return len(docs)
+
+    def fit(self, examples: list[dict[str, Any]]) -> None:
+        """Fit the centroids to examples that carry their embedding."""
+        self._centroids = {}
+        self._examples = len(examples)
+        for task in TASKS:
+            labeled = [doc for doc in examples if doc.get(task) in LABELS]
+            if not labeled:
+                continue
+            vectors = self._normalize(
+                np.array([doc["embedding"] for doc in labeled], dtype=np.float32)  # noqa: E501
+            )
+            labels = np.array([doc[task] for doc in labeled])
+            if min((labels == label).sum() for label in LABELS) < self.min_examples:  # noqa: E501
+                continue
+            centroids = self._normalize(
+                np.stack([vectors[labels == label].mean(axis=0) for label in LABELS])  # noqa: E501
+            )
+            self._centroids[task] = (centroids, list(LABELS))
+
+    def predict(self, task: str, embedding: list[float]) -> Label | None:
+        """The label of the question, or None if it is not confident."""
+        label = self._predict(task, embedding)
+        self._decisions[task]["fallback" if label is None else "local"] += 1
+        return label
+
+    async def aembed(self, question: str) -> list[float]:
+        embedding = self._embeddings.get(question)
+        if embedding is None:
+            embedding = await self._embed(question)
+            self._embeddings[question] = embedding
+            while len(self._embeddings) > self.max_cached_embeddings:
+                self._embeddings.popitem(last=False)
+        else:
+            self._embeddings.move_to_end(question)
+        return embedding
+
+    def _predict(self, task: str, embedding: list[float]) -> Label | None:
+        if task not in self._centroids:
+            return None
+        centroids, labels = self._centroids[task]
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        scores = centroids @ query
+        best, second = np.argsort(scores)[::-1][:2]
+        if scores[best] - scores[second] < self.min_margin:
+            return None
+        return labels[best]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
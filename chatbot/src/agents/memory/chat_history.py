@@ -1,27 +1,31 @@
 # from asyncio import gather as async_gather
 # from asyncio import get_running_loop
 # from contextvars import copy_context
-from datetime import datetime, UTC
+from datetime import datetime, timedelta, UTC
 # from functools import partial
-from json import (
-    dumps as json_dumps,
-    loads as json_loads
-)
+from json import loads as json_loads
 import logging
+from typing import AsyncIterator, Callable
 # from typing import Callable, ParamSpec, TypeVar, cast
 
 from langchain_core.messages import (
     BaseMessage,
+    HumanMessage,
     message_to_dict,
     messages_from_dict,
 )
 
 from langchain_mongodb import MongoDBChatMessageHistory
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCursor
 from pymongo.mongo_client import MongoClient
 from pymongo.errors import OperationFailure, WriteError
 
+from .indexes import IndexRegistry, IndexStatus
+from .window_cache import HistoryWindowCache
+from .write_behind import ChatHistoryWriteBuffer
+
 logger = logging.getLogger(__name__)
 
 
@@ -30,6 +34,15 @@ class AsyncChatHistory:
     Use a re-use a single client to take advantage of MongoDB connection
     pooling.
 
+    The messages of all sessions live in one collection, indexed on
+    (`session_id_key`, `created_at_key`). If a `token_counter` is given,
+    each message's token count is computed once when it is written, so
+    that reading a token budget's worth of history needs no tokenization.
+    If a `write_buffer` is given, new messages are written behind by the
+    buffer and reads merge in the ones it has not written yet. If a
+    `window_cache` is given, the newest messages of the session are served
+    from it and kept up to date as messages are added.
+
     Based on `langchain_core.chat_history.BaseChatMessageHistory` and
     `langchain_mongodb.chat_message_histories.MongoDBChatMessageHistory`
     objects.
@@ -42,7 +55,7 @@ class AsyncChatHistory:
             history = ChatMessageHistory(
                 client = "your-AsyncIOMotorClient instance",
                 database_name = "your-database-name",
-                collection_name = "your-collection-name",
+                collection_name = "your-shared-collection-name",
                 session_id = "your-session-id",
             )
 
@@ -74,7 +87,11 @@ class AsyncChatHistory:
         *,
         session_id_key: str = "SessionId",
         history_key: str = "History",
-        create_index: bool = True,
+        created_at_key: str = "created_at",
+        token_count_key: str = "TokenCount",
+        token_counter: Callable[[BaseMessage], int] | None = None,
+        write_buffer: ChatHistoryWriteBuffer | None = None,
+        window_cache: HistoryWindowCache | None = None,
         index_kwargs: dict | None = None,
     ) -> None:
         self.client = client
@@ -83,46 +100,104 @@ class AsyncChatHistory:
         self.collection_name = collection_name
         self.session_id_key = session_id_key
         self.history_key = history_key
+        self.created_at_key = created_at_key
+        self.token_count_key = token_count_key
+        self.token_counter = token_counter
+        self.write_buffer = write_buffer
+        self.window_cache = window_cache
+        self.index_kwargs = index_kwargs or {}
 
         self.db = self.client[database_name]
         self.collection = self.db[collection_name]
 
-        if create_index:
-            index_kwargs = index_kwargs or {}
-            self.collection.create_index(self.session_id_key, **index_kwargs)
+    @property
+    def index_keys(self) -> list[tuple[str, int]]:
+        # all sessions share one collection, so a session's messages are
+        # found and ordered through this compound index
+        return [(self.session_id_key, 1), (self.created_at_key, 1)]
+
+    @property
+    def index_name(self) -> str:
+        return "_".join(f"{key}_{direction}" for key, direction in self.index_keys)  # noqa: E501
+
+    async def acreate_index(self, registry: IndexRegistry) -> IndexStatus:
+        """Create the session index, unless the registry already knows
+        it exists."""
+        return await registry.aensure(
+            self.collection,
+            keys=self.index_keys,
+            name=self.index_name,
+            **self.index_kwargs
+        )
 
     async def aadd_messages(self, messages: list[BaseMessage]) -> None:
         """Async add a list of messages.
         Args:
             messages: A list of BaseMessage objects to store.
         """
-        try:
-            await self.collection.insert_many([
-                {
-                    self.session_id_key: self.session_id,
-                    self.history_key: json_dumps(message_to_dict(message)),
-                    "created_at": datetime.now(UTC)
-                }
-                for message in messages
-            ])
-        except WriteError as err:
-            logger.error(err)
-
-    async def aget_messages(self) -> list[BaseMessage]:
-        """Retrieve the messages from MongoDB"""
-        try:
-            cursor = self.collection.find(
-                {self.session_id_key: self.session_id}
-            )
-        except OperationFailure as error:
-            logger.error(error)
-        messages = []
-        async for doc in cursor:
-            messages.append(json_loads(doc[self.history_key]))
-        return messages_from_dict(messages)
+        # BSON dates have millisecond resolution, so the messages of a batch
+        # are stamped a millisecond apart to keep their order in the index
+        now = datetime.now(UTC)
+        docs = [
+            self._to_document(message, now + timedelta(milliseconds=i))
+            for i, message in enumerate(messages)
+        ]
+        if self.write_buffer is not None:
+            await self.write_buffer.aadd(self.collection, docs)
+        else:
+            try:
+                await self.collection.insert_many(docs)
+            except WriteError as err:
+                logger.error(err)
+                if self.window_cache is not None:
+                    self.window_cache.discard(self._cache_key)
+                return
+        if self.window_cache is not None:
+            self.window_cache.extend(self._cache_key, docs)
+
+    async def aget_messages(
+        self,
+        limit: int | None = None,
+        max_tokens: int | None = None,
+    ) -> list[BaseMessage]:
+        """Retrieve the newest messages from MongoDB, in chronological order.
+
+        With `max_tokens`, messages are walked newest-first and kept while
+        the running sum of their cached token counts fits the budget; like
+        `trim_messages(strategy="last", start_on="human")`, the result then
+        starts on a human message.
+        Args:
+            limit: The maximum number of messages to fetch.
+            max_tokens: The maximum number of tokens of the kept messages.
+        """
+        docs = None
+        if self.window_cache is not None:
+            docs = self.window_cache.get(self._cache_key, limit)
+        if docs is None:
+            docs = await self._aread_window(limit, max_tokens is not None)
+        if max_tokens is not None:
+            total_tokens = 0
+            for i in range(len(docs) - 1, -1, -1):
+                total_tokens += self._get_token_count(docs[i])
+                if total_tokens > max_tokens:
+                    docs = docs[i + 1:]
+                    break
+        messages = messages_from_dict(
+            [self._from_document(doc) for doc in docs]
+        )
+        if max_tokens is not None:
+            while messages and not isinstance(messages[0], HumanMessage):
+                messages.pop(0)
+        return messages
 
     async def aclear(self) -> None:
         """Asynchronously clear session memory from MongoDB."""
+        if self.window_cache is not None:
+            self.window_cache.discard(self._cache_key)
+        if self.write_buffer is not None:
+            await self.write_buffer.adiscard(
+                self.collection, self.session_id_key, self.session_id
+            )
         try:
             await self.collection.delete_many(
                 {self.session_id_key: self.session_id}
@@ -130,6 +205,105 @@ class AsyncChatHistory:
         except WriteError as err:
             logger.error(err)
 
+    async def _aread_window(
+        self, limit: int | None, with_token_counts: bool
+    ) -> list[dict]:
+        """Read the newest `limit` documents, oldest first, and cache
+        them unless messages were added to the session meanwhile."""
+        generation = None
+        if self.window_cache is not None:
+            # messages added during the read may be missing from it
+            generation = self.window_cache.begin_read(self._cache_key)
+        try:
+            pending = self._get_pending_documents()
+            projection = {self.history_key: True}
+            if with_token_counts or self.window_cache is not None:
+                projection[self.token_count_key] = True
+            cursor = self.collection.find(
+                {self.session_id_key: self.session_id},
+                projection=projection,
+                sort=[(self.created_at_key, -1)],
+                limit=limit + len(pending) if limit else 0,
+            )
+            newest_first = self._iter_newest_first(pending, cursor)
+            docs = []
+            try:
+                async for doc in newest_first:
+                    if limit and len(docs) == limit:
+                        break
+                    docs.append(doc)
+            except OperationFailure as error:
+                logger.error(error)
+                return docs[::-1]
+            finally:
+                await newest_first.aclose()
+                await cursor.close()
+            docs.reverse()
+            if self.window_cache is not None:
+                self.window_cache.put(
+                    self._cache_key,
+                    docs,
+                    complete=not limit or len(docs) < limit,
+                    generation=generation,
+                )
+            return docs
+        finally:
+            if self.window_cache is not None:
+                self.window_cache.end_read(self._cache_key)
+
+    @property
+    def _cache_key(self) -> tuple[str, str, str]:
+        return (self.database_name, self.collection_name, self.session_id)
+
+    def _from_document(self, doc: dict) -> dict:
+        history = doc[self.history_key]
+        # messages written before they were stored as BSON are JSON strings
+        if isinstance(history, str):
+            return json_loads(history)
+        return history
+
+    def _get_pending_documents(self) -> list[dict]:
+        if self.write_buffer is None:
+            return []
+        return self.write_buffer.pending(
+            self.collection, self.session_id_key, self.session_id
+        )
+
+    def _get_token_count(self, doc: dict) -> int:
+        if (token_count := doc.get(self.token_count_key)) is not None:
+            return token_count
+        # messages written before token counts were cached
+        if self.token_counter is None:
+            return 0
+        return self.token_counter(
+            messages_from_dict([self._from_document(doc)])[0]
+        )
+
+    async def _iter_newest_first(
+        self, pending: list[dict], cursor: AsyncIOMotorCursor
+    ) -> AsyncIterator[dict]:
+        # messages that are not written yet are newer than any in the db;
+        # one whose insert completes during the read is only yielded once
+        for doc in reversed(pending):
+            yield doc
+        pending_ids = {doc["_id"] for doc in pending}
+        async for doc in cursor:
+            if doc["_id"] not in pending_ids:
+                yield doc
+
+    def _to_document(self, message: BaseMessage, created_at: datetime) -> dict:  # noqa: E501
+        # the id is set here so that a buffered document can be told apart
+        # from its written copy
+        doc = {
+            "_id": ObjectId(),
+            self.session_id_key: self.session_id,
+            self.history_key: message_to_dict(message),
+            self.created_at_key: created_at,
+        }
+        if self.token_counter is not None:
+            doc[self.token_count_key] = self.token_counter(message)
+        return doc
+
 #     def add_messages(self, messages: list[BaseMessage]) -> None:
 #         """Append the message to the record in MongoDB"""
 #         for message in messages:
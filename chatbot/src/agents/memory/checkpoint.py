@@ -1,11 +1,13 @@
 # adapted from langgraph.checkpoint.sqlite.aio.AsyncSqliteSaver and
 # https://langchain-ai.github.io/langgraph/how-tos/persistence_mongodb/
 
-from asyncio import run as async_run
 # from contextlib import asynccontextmanager
+from asyncio import gather
 from datetime import datetime, UTC
+from functools import partial
+import logging
 from types import TracebackType
-from typing import Any, AsyncIterator, Sequence, Self
+from typing import Any, AsyncIterator, Literal, Sequence, Self
 
 from langchain_core.runnables import RunnableConfig
 
@@ -18,13 +20,73 @@ from langgraph.checkpoint.base import (
 )
 
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pymongo.errors import OperationFailure
 from pymongo.operations import UpdateOne
 
+from .checkpoint_codec import CheckpointCodec, LazyCheckpoint
+from .indexes import IndexRegistry, IndexStatus
+
+logger = logging.getLogger(__name__)
+
+CONFIG_KEYS = ("thread_id", "checkpoint_ns", "checkpoint_id")
+CHECKPOINT_PROJECTION = {
+    "_id": False,
+    **{k: True for k in CONFIG_KEYS},
+    "parent_checkpoint_id": True,
+    "type": True,
+    "checkpoint": True,
+    "encoding": True,
+    "snapshot_id": True,
+    "deleted_channels": True,
+    "metadata": True,
+}
+SNAPSHOT_PROJECTION = {
+    "_id": False,
+    "type": True,
+    "checkpoint": True,
+    "encoding": True,
+}
+WRITE_PROJECTION = {
+    "_id": False,
+    "task_id": True,
+    "channel": True,
+    "type": True,
+    "value": True,
+    "encoding": True,
+}
+CHECKPOINTS_INDEX_KEYS = [(k, 1) for k in CONFIG_KEYS]
+CHECKPOINTS_INDEX_NAME = "thread_checkpoints"
+WRITES_INDEX_KEYS = [(k, 1) for k in (*CONFIG_KEYS, "task_id", "idx")]
+WRITES_INDEX_NAME = "checkpoint_writes"
+
+Durability = Literal["step", "superstep", "exit"]
+
 
 class AsyncMongoDBSaver(BaseCheckpointSaver):
     """A checkpoint saver that stores checkpoints in a MongoDB database
     asynchronously.
+
+    The checkpoints and the pending writes of all threads share one
+    collection each, both indexed on (thread_id, checkpoint_ns,
+    checkpoint_id) and both expired by a TTL index. The saver does not
+    create any index itself; call `create_indexes` once at startup so that
+    no index DDL runs on the per-message path.
+
+    `durability` sets when checkpoints and pending writes reach MongoDB:
+    - "step": every `aput` and `aput_writes` call is written right away.
+    - "superstep": the writes of a superstep are buffered and committed
+      together with the checkpoint that closes it, in one unordered bulk
+      write per collection.
+    - "exit": everything of a thread is buffered until `aflush` is called
+      at the end of the run, including runs that end on an interrupt,
+      an error or a timeout.
+    With buffering, call `aflush` once a run is over so that nothing is
+    left behind; reading a thread flushes it first.
+
+    With a `snapshot_interval` above 1, only every so many checkpoints are
+    stored in full; the ones in between store the channels that changed
+    since, see `CheckpointCodec`. A delta refreshes the TTL of its snapshot
+    so that the snapshot lives as long as the deltas that need it. With a
+    `compression_level`, checkpoints, metadata and writes are compressed.
     """
 
     client: AsyncIOMotorClient
@@ -39,20 +101,27 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
         collection_name: str,
         ttl_index_name: str | None = None,
         ttl_index_key: str | None = None,
-        ttl_expire_after_seconds: float = 60
+        ttl_expire_after_seconds: float = 60,
+        durability: Durability = "step",
+        snapshot_interval: int = 1,
+        compression_level: int | None = None,
     ) -> None:
         super().__init__()
         self.client = client
         self.db = self.client[database_name]
         self.collection = self.db[collection_name]
         self.write_collection = self.db[f"{collection_name}_writes"]
+        self.ttl_index_name = ttl_index_name
         self.ttl_index_key = ttl_index_key
-        async_run(
-            self.create_index(
-                name=ttl_index_name,
-                expire_after_seconds=ttl_expire_after_seconds
-            )
+        self.ttl_expire_after_seconds = ttl_expire_after_seconds
+        self.durability = durability
+        self.codec = CheckpointCodec(
+            self.serde,
+            snapshot_interval=snapshot_interval,
+            compression_level=compression_level,
         )
+        # thread_id -> (checkpoint operations, write operations)
+        self._buffers: dict[str, tuple[list, list]] = {}
 
     async def __enter__(self) -> Self:
         return self
@@ -104,21 +173,36 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
     #         if client:
     #             client.close()
 
-    async def create_index(
-        self, *, name: str, expire_after_seconds: float
-    ) -> None:
-        while True:
-            try:
-                await self.collection.create_index(
-                    keys=self.ttl_index_key,
-                    name=name,
-                    background=True,
-                    expireAfterSeconds=expire_after_seconds
+    async def create_indexes(
+        self, registry: IndexRegistry
+    ) -> list[IndexStatus]:
+        """Create the indexes that checkpoints and pending writes are looked
+        up with and the TTL indexes that expire both, unless the registry
+        already knows they exist."""
+        statuses = [
+            await registry.aensure(
+                self.collection,
+                keys=CHECKPOINTS_INDEX_KEYS,
+                name=CHECKPOINTS_INDEX_NAME,
+                unique=True,
+            ),
+            await registry.aensure(
+                self.write_collection,
+                keys=WRITES_INDEX_KEYS,
+                name=WRITES_INDEX_NAME,
+            ),
+        ]
+        if self.ttl_index_name and self.ttl_index_key:
+            for collection in (self.collection, self.write_collection):
+                statuses.append(
+                    await registry.aensure(
+                        collection,
+                        keys=self.ttl_index_key,
+                        name=self.ttl_index_name,
+                        expireAfterSeconds=self.ttl_expire_after_seconds
+                    )
                 )
-            except OperationFailure:
-                await self.collection.drop_index(name)
-                continue
-            break
+        return statuses
 
     async def aget_tuple(
         self, config: RunnableConfig
@@ -139,49 +223,37 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
             Optional[CheckpointTuple]: The retrieved checkpoint tuple, or
                 None if no matching checkpoint was found.
         """
+        await self.aflush(config)
         config_dict = config["configurable"]
         query = {
             k: config_dict.get(k, "") for k in ("thread_id", "checkpoint_ns")
         }
-        if checkpoint_id := (
+        if (checkpoint_id := (
             config_dict.get("checkpoint_id") or config_dict.get("thread_ts")
-        ) is not None:
+        )) is not None:
             query["checkpoint_id"] = checkpoint_id
-        result = (
-            self.collection.find(query).sort("checkpoint_id", -1).limit(1)
-        )
+        # one round-trip: the checkpoint, its snapshot and its pending
+        # writes are read together, with only the fields needed to build
+        # the tuple
+        result = self.collection.aggregate([
+            {"$match": query},
+            {"$sort": {"checkpoint_id": -1}},
+            {"$limit": 1},
+            {"$project": CHECKPOINT_PROJECTION},
+            self._lookup_snapshot_stage(),
+            self._lookup_stage(
+                self.write_collection.name,
+                {k: k for k in CONFIG_KEYS},
+                [
+                    {"$sort": {"task_id": 1, "idx": 1}},
+                    {"$project": WRITE_PROJECTION},
+                ],
+                "pending_writes",
+            ),
+        ])
         async for doc in result:
-            config_values = {
-                k: doc[k]
-                for k in ("thread_id", "checkpoint_ns", "checkpoint_id")
-            }
-            checkpoint = self.serde.loads_typed(
-                (doc["type"], doc["checkpoint"])
-            )
-            serialized_writes = self.write_collection.find(config_values)
-            pending_writes = [
-                (
-                    doc["task_id"],
-                    doc["channel"],
-                    self.serde.loads_typed((doc["type"], doc["value"])),
-                )
-                async for doc in serialized_writes
-            ]
-            if doc.get("parent_checkpoint_id"):
-                parent_config = {
-                    "configurable": {
-                        **query,
-                        "checkpoint_id": doc.get("parent_checkpoint_id")
-                    }
-                }
-            else:
-                parent_config = None
-            return CheckpointTuple(
-                config={"configurable": config_values},
-                checkpoint=checkpoint,
-                metadata=self.serde.loads(doc["metadata"]),
-                parent_config=parent_config,
-                pending_writes=pending_writes
+            return self._to_checkpoint_tuple(
+                doc, doc["pending_writes"], next(iter(doc["snapshot"]), None)
             )
 
     async def alist(
@@ -191,6 +263,8 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
         filter: dict[str, Any] | None = None,
         before: RunnableConfig | None = None,
         limit: int | None = None,
+        lazy: bool = False,
+        page_size: int | None = None,
     ) -> AsyncIterator[CheckpointTuple]:
         """List checkpoints from the database asynchronously.
 
@@ -198,6 +272,12 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
         database based on the provided config. The checkpoints are ordered
         by checkpoint ID in descending order.
 
+        For callers that only need configs or metadata, `lazy` leaves the
+        checkpoint blobs undecoded until the checkpoint is first accessed.
+        With `page_size`, a long thread is read in pages of that many
+        checkpoints, each one a range query that starts below the last
+        checkpoint ID of the previous page, instead of one open cursor.
+
         Args:
             config (RunnableConfig): The config to use for listing the
                 checkpoints.
@@ -207,12 +287,17 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
                 before the specified checkpoint ID are returned. Defaults to
                 None.
             limit (Optional[int]): The maximum number of checkpoints to
-                return. Defaults to None.
+                return. Defaults to None; 0 means no limit too.
+            lazy (bool): Whether to decode the checkpoints on first access
+                only. Defaults to False.
+            page_size (Optional[int]): The number of checkpoints to read per
+                query. Defaults to None, reading all in one query.
 
         Yields:
             AsyncIterator[CheckpointTuple]: An Async iterator of checkpoint
             tuples.
         """
+        await self.aflush(config)
         query = {}
         if config is not None:
             conf_di = config["configurable"]
@@ -222,39 +307,35 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
         if filter:
             for key, value in filter.items():
                 query[f"metadata.{key}"] = value
-        if before is not None:
-            query["checkpoint_id"] = {
-                "$lt": before["configurable"]["checkpoint_id"]
-            }
-        result = self.collection.find(query).sort("checkpoint_id", -1)
-        if limit is not None:
-            result = result.limit(limit)
-        async for doc in result:
-            config = {
-                "configurable": {
-                    k: doc[k]
-                    for k in ("thread_id", "checkpoint_ns", "checkpoint_id")
-                }
-            }
-            checkpoint = self.serde.loads_typed(
-                (doc["type"], doc["checkpoint"])
-            )
-            if doc.get("parent_checkpoint_id"):
-                parent_config = {
-                    "configurable": {
-                        "thread_id": doc["thread_id"],
-                        "checkpoint_ns": doc["checkpoint_ns"],
-                        "checkpoint_id": doc["parent_checkpoint_id"],
-                    }
-                }
-            else:
-                parent_config = None
-            yield CheckpointTuple(
-                config=config,
-                checkpoint=checkpoint,
-                metadata=self.serde.loads(doc["metadata"]),
-                parent_config=parent_config
-            )
+        before_id = before["configurable"]["checkpoint_id"] if before else None
+        # like `cursor.limit(0)`, a limit of 0 means no limit
+        remaining = limit or None
+        while True:
+            if before_id is not None:
+                query["checkpoint_id"] = {"$lt": before_id}
+            page_limit = page_size
+            if remaining is not None:
+                page_limit = min(page_size or remaining, remaining)
+            pipeline = [{"$match": query}, {"$sort": {"checkpoint_id": -1}}]
+            if page_limit:
+                pipeline.append({"$limit": page_limit})
+            pipeline += [
+                {"$project": CHECKPOINT_PROJECTION},
+                self._lookup_snapshot_stage(),
+            ]
+            count = 0
+            async for doc in self.collection.aggregate(pipeline):
+                count += 1
+                before_id = doc["checkpoint_id"]
+                checkpoint_tuple = self._to_checkpoint_tuple(
+                    doc, snapshot=next(iter(doc["snapshot"]), None), lazy=lazy
+                )
+                if checkpoint_tuple is not None:
+                    yield checkpoint_tuple
+            if not page_size or count < page_limit:
+                return
+            if remaining is not None and not (remaining := remaining - count):
+                return
 
     async def aput(
         self,
@@ -281,21 +362,15 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
             RunnableConfig: The updated config containing the saved
             checkpoint.
         """
-        config_dict = config["configurable"]
-        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
-        doc = {
-            "parent_checkpoint_id": config_dict.get("checkpoint_id"),
-            "type": type_,
-            "checkpoint": serialized_checkpoint,
-            "metadata": self.serde.dumps(metadata),
-            self.ttl_index_key: datetime.now(UTC),
-        }
-        filter = {
-            "thread_id": config_dict["thread_id"],
-            "checkpoint_ns": config_dict["checkpoint_ns"],
-            "checkpoint_id": checkpoint["id"],
-        }
-        await self.collection.update_one(filter, {"$set": doc}, upsert=True)
+        filter, doc = self._checkpoint_document(config, checkpoint, metadata)
+        operations = self._checkpoint_operations(filter, doc)
+        if self.durability == "step":
+            await self.collection.bulk_write(operations, ordered=False)
+            return {"configurable": filter}
+        self._get_buffer(filter["thread_id"])[0].extend(operations)
+        if self.durability == "superstep":
+            # the checkpoint closes the superstep; commit it with its writes
+            await self.aflush(config)
         return {"configurable": filter}
 
     async def aput_writes(
@@ -315,32 +390,222 @@ class AsyncMongoDBSaver(BaseCheckpointSaver):
                 as (channel, value) pair.
             task_id (str): Identifier for the task creating the writes.
         """
+        operations = [
+            UpdateOne(upsert_query, {"$set": doc}, upsert=True)
+            for upsert_query, doc in self._write_documents(
+                config, writes, task_id
+            )
+        ]
+        if self.durability == "step":
+            await self.write_collection.bulk_write(operations)
+        else:
+            self._get_buffer(
+                config["configurable"]["thread_id"]
+            )[1].extend(operations)
+
+    async def aflush(self, config: RunnableConfig | None = None) -> None:
+        """Write the buffered checkpoints and writes of the thread in the
+        config, or of every thread, with one unordered bulk write per
+        collection. If a write fails, the operations are put back into the
+        buffers to be written by the next flush; they are upserts, so the
+        ones that made it are written again harmlessly."""
+        if config is None:
+            thread_ids = list(self._buffers)
+        else:
+            thread_ids = [config["configurable"].get("thread_id")]
+        buffers, checkpoints, writes = {}, [], []
+        for thread_id in thread_ids:
+            if (buffer := self._buffers.pop(thread_id, None)) is not None:
+                buffers[thread_id] = buffer
+                checkpoints.extend(buffer[0])
+                writes.extend(buffer[1])
+        try:
+            await gather(
+                *(
+                    collection.bulk_write(operations, ordered=False)
+                    for collection, operations in (
+                        (self.collection, checkpoints),
+                        (self.write_collection, writes),
+                    )
+                    if operations
+                )
+            )
+        except BaseException:
+            # also when cancelled, so that nothing is lost
+            for thread_id, (checkpoints, writes) in buffers.items():
+                # ahead of what was buffered in the meantime
+                buffer = self._get_buffer(thread_id)
+                buffer[0][:0] = checkpoints
+                buffer[1][:0] = writes
+            raise
+
+    def _checkpoint_document(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata | None,
+    ) -> tuple[dict, dict]:
+        """The filter and the fields of a checkpoint document."""
         config_dict = config["configurable"]
-        thread_id = config_dict["thread_id"]
-        checkpoint_ns = config_dict["checkpoint_ns"]
-        checkpoint_id = config_dict["checkpoint_id"]
-        operations = []
-        for idx, (channel, value) in enumerate(writes):
-            upsert_query = {
-                "thread_id": thread_id,
-                "checkpoint_ns": checkpoint_ns,
-                "checkpoint_id": checkpoint_id,
-                "task_id": task_id,
-                "idx": idx,
-            }
-            type_, serialized_value = self.serde.dumps_typed(value)
+        filter = {
+            "thread_id": config_dict["thread_id"],
+            "checkpoint_ns": config_dict["checkpoint_ns"],
+            "checkpoint_id": checkpoint["id"],
+        }
+        doc = {
+            "parent_checkpoint_id": config_dict.get("checkpoint_id"),
+            "snapshot_id": None,
+            **self.codec.encode(
+                filter["thread_id"],
+                filter["checkpoint_ns"],
+                config_dict.get("checkpoint_id"),
+                checkpoint,
+            ),
+            "metadata": self.codec.compress(self.serde.dumps(metadata)),
+            self.ttl_index_key: datetime.now(UTC),
+        }
+        return filter, doc
+
+    def _checkpoint_operations(
+        self, filter: dict, doc: dict
+    ) -> list[UpdateOne]:
+        operations = [UpdateOne(filter, {"$set": doc}, upsert=True)]
+        if doc["snapshot_id"] is not None:
+            # keep the snapshot as long as the delta that needs it
             operations.append(
                 UpdateOne(
-                    upsert_query,
+                    {**filter, "checkpoint_id": doc["snapshot_id"]},
+                    {"$set": {self.ttl_index_key: doc[self.ttl_index_key]}},
+                )
+            )
+        return operations
+
+    def _get_buffer(self, thread_id: str) -> tuple[list, list]:
+        return self._buffers.setdefault(thread_id, ([], []))
+
+    def _load_metadata(self, doc: dict) -> CheckpointMetadata:
+        return self.serde.loads(
+            self.codec.decompress(doc["metadata"], doc.get("encoding"))
+        )
+
+    def _lookup_snapshot_stage(self) -> dict:
+        return self._lookup_stage(
+            self.collection.name,
+            {
+                "thread_id": "thread_id",
+                "checkpoint_ns": "checkpoint_ns",
+                "checkpoint_id": "snapshot_id",
+            },
+            [{"$project": SNAPSHOT_PROJECTION}],
+            "snapshot",
+        )
+
+    def _lookup_stage(
+        self,
+        from_: str,
+        on: dict[str, str],
+        pipeline: list[dict],
+        as_: str,
+    ) -> dict:
+        """A `$lookup` of the documents of `from_` whose fields equal the
+        fields of the input document, given as `{foreign: local}`."""
+        return {
+            "$lookup": {
+                "from": from_,
+                "let": {f"v_{k}": f"${v}" for k, v in on.items()},
+                "pipeline": [
                     {
-                        "$set": {
-                            "channel": channel,
-                            "type": type_,
-                            "value": serialized_value,
-                            "created_at": datetime.now(UTC),
+                        "$match": {
+                            "$expr": {
+                                "$and": [
+                                    {"$eq": [f"${k}", f"$$v_{k}"]}
+                                    for k in on
+                                ]
+                            }
                         }
                     },
-                    upsert=True,
-                )
+                    *pipeline,
+                ],
+                "as": as_,
+            }
+        }
+
+    def _to_checkpoint_tuple(
+        self,
+        doc: dict,
+        pending_writes: list[dict] | None = None,
+        snapshot: dict | None = None,
+        lazy: bool = False,
+    ) -> CheckpointTuple | None:
+        """Build a checkpoint tuple from its stored documents. Returns None
+        for a delta whose snapshot is gone."""
+        if doc.get("snapshot_id") is not None and snapshot is None:
+            checkpoint = None
+        elif lazy:
+            checkpoint = LazyCheckpoint(
+                doc["checkpoint_id"], partial(self.codec.decode, doc, snapshot)
+            )
+        else:
+            checkpoint = self.codec.decode(doc, snapshot)
+        if checkpoint is None:
+            logger.warning(
+                f"Snapshot {doc['snapshot_id']} of checkpoint "
+                f"{doc['checkpoint_id']} is missing."
             )
-        await self.write_collection.bulk_write(operations)
+            return None
+        if doc.get("parent_checkpoint_id"):
+            parent_config = {
+                "configurable": {
+                    "thread_id": doc["thread_id"],
+                    "checkpoint_ns": doc["checkpoint_ns"],
+                    "checkpoint_id": doc["parent_checkpoint_id"],
+                }
+            }
+        else:
+            parent_config = None
+        return CheckpointTuple(
+            config={"configurable": {k: doc[k] for k in CONFIG_KEYS}},
+            checkpoint=checkpoint,
+            metadata=self._load_metadata(doc),
+            parent_config=parent_config,
+            pending_writes=None if pending_writes is None else [
+                (
+                    write["task_id"],
+                    write["channel"],
+                    self.codec.loads(
+                        write["type"], write["value"], write.get("encoding")
+                    ),
+                )
+                for write in pending_writes
+            ],
+        )
+
+    def _write_documents(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+    ) -> list[tuple[dict, dict]]:
+        """The filters and the fields of pending write documents."""
+        config_dict = config["configurable"]
+        documents = []
+        for idx, (channel, value) in enumerate(writes):
+            upsert_query = {
+                "thread_id": config_dict["thread_id"],
+                "checkpoint_ns": config_dict["checkpoint_ns"],
+                "checkpoint_id": config_dict["checkpoint_id"],
+                "task_id": task_id,
+                "idx": idx,
+            }
+            type_, serialized_value = self.codec.dumps(value)
+            documents.append((
+                upsert_query,
+                {
+                    "channel": channel,
+                    "type": type_,
+                    "value": serialized_value,
+                    "encoding": self.codec.encoding,
+                    self.ttl_index_key: datetime.now(UTC),
+                },
+            ))
+        return documents
@@ -0,0 +1,183 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Iterator
+import zlib
+
+from langgraph.checkpoint.base import Checkpoint
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+ZLIB_ENCODING = "zlib"
+
+
+class LazyCheckpoint(Mapping):
+    """A read-only checkpoint that is decoded on first access, apart from
+    its id."""
+
+    def __init__(
+        self, checkpoint_id: str, load: Callable[[], Checkpoint]
+    ) -> None:
+        self._id = checkpoint_id
+        self._load = load
+        self._checkpoint: Checkpoint | None = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._checkpoint is not None
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "id" and self._checkpoint is None:
+            return self._id
+        return self._loaded()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loaded())
+
+    def __len__(self) -> int:
+        return len(self._loaded())
+
+    def _loaded(self) -> Checkpoint:
+        if self._checkpoint is None:
+            self._checkpoint = self._load()
+        return self._checkpoint
+
+
+class _Lineage:
+    __slots__ = ("snapshot_id", "snapshot_versions", "last_id", "deltas")
+
+    def __init__(self, snapshot_id: str, snapshot_versions: dict) -> None:
+        self.snapshot_id = snapshot_id
+        self.snapshot_versions = snapshot_versions
+        self.last_id = snapshot_id
+        self.deltas = 0
+
+
+class CheckpointCodec:
+    """Encodes checkpoints for storage, as full snapshots or as deltas.
+
+    A delta stores the values of the channels whose version changed since
+    the last snapshot of its thread and namespace, the channels that were
+    deleted since, and everything else of the checkpoint (ids, versions)
+    in full. It is decoded with its snapshot only, never with a chain of
+    deltas. A snapshot is written every `snapshot_interval` checkpoints,
+    and whenever the checkpoint does not continue the last one encoded for
+    its thread, e.g. after a restart or when a run forks from an older
+    checkpoint. With a `compression_level`, blobs are compressed with zlib.
+
+    The codec does no I/O; the saver stores the fields it returns.
+
+    Instantiate:
+        .. code-block:: python
+
+            codec = CheckpointCodec(
+                serde,
+                snapshot_interval=10,
+                compression_level=6,
+            )
+            fields = codec.encode(thread_id, checkpoint_ns, parent_id, checkpoint)  # noqa: E501
+            checkpoint = codec.decode(doc, snapshot_doc)
+    """
+
+    def __init__(
+        self,
+        serde: SerializerProtocol,
+        *,
+        snapshot_interval: int = 1,
+        compression_level: int | None = None,
+        max_lineages: int = 10_000,
+    ) -> None:
+        self.serde = serde
+        self.snapshot_interval = snapshot_interval
+        self.compression_level = compression_level
+        self.max_lineages = max_lineages
+        # thread_id -> checkpoint_ns -> lineage
+        self._lineages: OrderedDict[str, dict[str, _Lineage]] = OrderedDict()
+
+    def encode(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        parent_id: str | None,
+        checkpoint: Checkpoint,
+    ) -> dict[str, Any]:
+        """The stored fields of a checkpoint. Deltas carry the id of their
+        snapshot in `snapshot_id`."""
+        lineages = self._lineages.setdefault(thread_id, {})
+        self._lineages.move_to_end(thread_id)
+        lineage = lineages.get(checkpoint_ns)
+        if (
+            lineage is None
+            or parent_id is None
+            or lineage.last_id != parent_id
+            or lineage.deltas + 1 >= self.snapshot_interval
+        ):
+            lineages[checkpoint_ns] = _Lineage(
+                checkpoint["id"], dict(checkpoint["channel_versions"])
+            )
+            while len(self._lineages) > self.max_lineages:
+                self._lineages.popitem(last=False)
+            return self._dumps_fields(checkpoint)
+        lineage.last_id = checkpoint["id"]
+        lineage.deltas += 1
+        versions = lineage.snapshot_versions
+        changed = {
+            channel: value
+            for channel, value in checkpoint["channel_values"].items()
+            if versions.get(channel) != checkpoint["channel_versions"].get(channel)  # noqa: E501
+        }
+        return {
+            **self._dumps_fields({**checkpoint, "channel_values": changed}),
+            "snapshot_id": lineage.snapshot_id,
+            # channels of the snapshot that no longer have a value
+            "deleted_channels": [
+                channel for channel in versions
+                if channel not in checkpoint["channel_values"]
+            ],
+        }
+
+    def reset(self, thread_id: str) -> None:
+        """Start the next checkpoint of the thread with a snapshot."""
+        self._lineages.pop(thread_id, None)
+
+    def decode(
+        self, doc: dict[str, Any], snapshot: dict[str, Any] | None = None
+    ) -> Checkpoint | None:
+        """Rebuild a checkpoint from its stored fields and, for a delta,
+        those of its snapshot. Returns None if the snapshot is missing."""
+        checkpoint = self._loads_fields(doc)
+        if doc.get("snapshot_id") is None:
+            return checkpoint
+        if snapshot is None:
+            return None
+        channel_values = self._loads_fields(snapshot)["channel_values"]
+        for channel in doc.get("deleted_channels", ()):
+            channel_values.pop(channel, None)
+        channel_values.update(checkpoint["channel_values"])
+        return {**checkpoint, "channel_values": channel_values}
+
+    def dumps(self, value: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        return type_, self.compress(data)
+
+    def loads(self, type_: str, data: bytes, encoding: str | None) -> Any:
+        return self.serde.loads_typed((type_, self.decompress(data, encoding)))  # noqa: E501
+
+    @property
+    def encoding(self) -> str | None:
+        return None if self.compression_level is None else ZLIB_ENCODING
+
+    def compress(self, data: bytes) -> bytes:
+        if self.compression_level is None:
+            return data
+        return zlib.compress(data, self.compression_level)
+
+    def decompress(self, data: bytes, encoding: str | None) -> bytes:
+        if encoding == ZLIB_ENCODING:
+            return zlib.decompress(data)
+        return data
+
+    def _dumps_fields(self, checkpoint: Checkpoint) -> dict[str, Any]:
+        type_, data = self.dumps(checkpoint)
+        return {"type": type_, "checkpoint": data, "encoding": self.encoding}
+
+    def _loads_fields(self, doc: dict[str, Any]) -> Checkpoint:
+        return self.loads(doc["type"], doc["checkpoint"], doc.get("encoding"))
@@ -0,0 +1,262 @@
+import logging
+from asyncio import Task, create_task
+from collections import OrderedDict
+from datetime import UTC, datetime
+from hashlib import sha256
+from threading import Lock
+from typing import Any
+
+import numpy as np
+
+from bson import Binary
+from langchain_core.embeddings import Embeddings
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from .indexes import IndexRegistry, IndexStatus
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def pack(embedding: list[float]) -> bytes:
+    """The embedding as little-endian float32, 4 bytes per dimension."""
+    return np.asarray(embedding, dtype="<f4").tobytes()
+
+
+def unpack(data: bytes) -> list[float]:
+    return np.frombuffer(data, dtype="<f4").tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that are looked up in an in-process LRU cache, then in a
+    MongoDB collection, before the wrapped embeddings model is called.
+
+    Texts are cached by the SHA-256 of the model name and the text with
+    its case and whitespace normalized, but embedded as given: the vector
+    of the first spelling seen stands for the others. Vectors are kept as
+    packed float32 in both levels: 12 KiB for 3072 dimensions, against
+    about 100 KiB for a list of Python floats. The LRU cache is bounded by
+    `max_entries` and `max_bytes`.
+
+    The vector store embeds queries from worker threads through the sync
+    methods and the graph through the async ones, so both levels have a
+    sync and an async collection, and the LRU cache is locked. Writes to
+    MongoDB are not waited for on the async path. A failing collection
+    only costs the second level.
+
+    Instantiate:
+        .. code-block:: python
+
+            embeddings = CachedEmbeddings(
+                OpenAIEmbeddings(model="text-embedding-3-large"),
+                model="text-embedding-3-large",
+                collection=db["embedding_cache"],
+                acollection=motor_db["embedding_cache"],
+                max_entries=10_000,
+                max_bytes=64 * 1024 * 1024,
+            )
+            vector = await embeddings.aembed_query("what time is checkout?")
+            embeddings.metrics
+    """
+
+    index_name = "for_expiry"
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        *,
+        model: str,
+        collection: Collection | None = None,
+        acollection: AsyncIOMotorCollection | None = None,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        expire_after_seconds: int = 30 * 24 * 60 * 60,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.collection = collection
+        self.acollection = acollection
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.expire_after_seconds = expire_after_seconds
+        self._lru: OrderedDict[str, bytes] = OrderedDict()
+        self._nbytes = 0
+        self._lock = Lock()
+        self._writes: set[Task] = set()
+        # metrics
+        self._memory_hits = 0
+        self._db_hits = 0
+        self._misses = 0
+        self._db_errors = 0
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        lookups = self._memory_hits + self._db_hits + self._misses
+        return {
+            "entries": len(self._lru),
+            "bytes": self._nbytes,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self._memory_hits,
+            "db_hits": self._db_hits,
+            "misses": self._misses,
+            "hit_rate": (
+                (self._memory_hits + self._db_hits) / lookups
+                if lookups else 0.0
+            ),
+            "db_errors": self._db_errors,
+        }
+
+    async def acreate_index(self, registry: IndexRegistry) -> IndexStatus:
+        """Let MongoDB delete the vectors `expire_after_seconds` after they
+        were stored."""
+        return await registry.aensure(
+            self.acollection,
+            keys=[("created_at", 1)],
+            name=self.index_name,
+            expireAfterSeconds=self.expire_after_seconds,
+        )
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found = self._lookup_memory(texts)
+        missing = [key for key in keys if key not in found]
+        if missing and self.collection is not None:
+            try:
+                docs = self.collection.find(
+                    {"_id": {"$in": missing}}, {"embedding": 1}
+                )
+                found |= self._remember(docs)
+            except PyMongoError as e:
+                self._db_error(e)
+        missing = self._unique_missing(keys, texts, found)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new = self._store(missing, vectors)
+            found |= new
+            if self.collection is not None:
+                try:
+                    self.collection.bulk_write(
+                        self._upserts(new), ordered=False
+                    )
+                except PyMongoError as e:
+                    self._db_error(e)
+        return [unpack(found[key]) for key in keys]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, found = self._lookup_memory(texts)
+        missing = [key for key in keys if key not in found]
+        if missing and self.acollection is not None:
+            try:
+                docs = await self.acollection.find(
+                    {"_id": {"$in": missing}}, {"embedding": 1}
+                ).to_list(None)
+                found |= self._remember(docs)
+            except PyMongoError as e:
+                self._db_error(e)
+        missing = self._unique_missing(keys, texts, found)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(
+                list(missing.values())
+            )
+            new = self._store(missing, vectors)
+            found |= new
+            if self.acollection is not None:
+                task = create_task(self._ainsert(new))
+                self._writes.add(task)
+                task.add_done_callback(self._writes.discard)
+        return [unpack(found[key]) for key in keys]
+
+    def _key(self, text: str) -> str:
+        return sha256(f"{self.model}\n{text}".encode()).hexdigest()
+
+    def _lookup_memory(
+        self, texts: list[str]
+    ) -> tuple[list[str], dict[str, bytes]]:
+        keys = [self._key(normalize_text(text)) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if (data := self._lru.get(key)) is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = data
+                    self._memory_hits += 1
+        return keys, found
+
+    def _remember(self, docs: Any) -> dict[str, bytes]:
+        """Move vectors read from MongoDB into the LRU cache."""
+        found = {doc["_id"]: bytes(doc["embedding"]) for doc in docs}
+        with self._lock:
+            self._db_hits += len(found)
+            for key, data in found.items():
+                self._put(key, data)
+        return found
+
+    def _unique_missing(
+        self, keys: list[str], texts: list[str], found: dict[str, bytes]
+    ) -> dict[str, str]:
+        """The original texts to embed, by key, each only once."""
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self._misses += len(missing)
+        return missing
+
+    def _store(
+        self, missing: dict[str, str], vectors: list[list[float]]
+    ) -> dict[str, bytes]:
+        new = {key: pack(vector) for key, vector in zip(missing, vectors)}
+        with self._lock:
+            for key, data in new.items():
+                self._put(key, data)
+        return new
+
+    def _put(self, key: str, data: bytes) -> None:
+        if (old := self._lru.pop(key, None)) is not None:
+            self._nbytes -= len(old)
+        self._lru[key] = data
+        self._nbytes += len(data)
+        while self._lru and (
+            len(self._lru) > self.max_entries or self._nbytes > self.max_bytes
+        ):
+            _, evicted = self._lru.popitem(last=False)
+            self._nbytes -= len(evicted)
+
+    def _upserts(self, new: dict[str, bytes]) -> list[UpdateOne]:
+        # another process may have stored the same text in the meantime
+        now = datetime.now(UTC)
+        return [
+            UpdateOne(
+                {"_id": key},
+                {"$setOnInsert": {
+                    "model": self.model,
+                    "embedding": Binary(data),
+                    "created_at": now,
+                }},
+                upsert=True,
+            )
+            for key, data in new.items()
+        ]
+
+    async def _ainsert(self, new: dict[str, bytes]) -> None:
+        try:
+            await self.acollection.bulk_write(
+                self._upserts(new), ordered=False
+            )
+        except PyMongoError as e:
+            self._db_error(e)
+
+    def _db_error(self, error: PyMongoError) -> None:
+        self._db_errors += 1
+        logger.error(error)
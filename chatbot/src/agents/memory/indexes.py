@@ -0,0 +1,135 @@
+import logging
+from typing import Any, Literal, NamedTuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+IndexKeys = list[tuple[str, int]]
+
+
+class IndexStatus(NamedTuple):
+    database: str
+    collection: str
+    name: str
+    keys: IndexKeys
+    status: Literal["cached", "verified", "created", "updated", "failed"]
+
+    def __str__(self) -> str:
+        keys = ", ".join(f"{k}: {v}" for k, v in self.keys)
+        return (
+            f"{self.database}.{self.collection} "
+            f"[{self.name}] ({keys}): {self.status}"
+        )
+
+
+class IndexRegistry:
+    """Creates MongoDB indexes once and remembers which ones are known to
+    exist, so that no index DDL has to run on the per-message path.
+
+    Instantiate:
+        .. code-block:: python
+
+            registry = IndexRegistry()
+            status = await registry.aensure(
+                collection,
+                keys=[("created_at", 1)],
+                name="for_deletion",
+                expireAfterSeconds=180,
+            )
+            print(*registry.report, sep="\\n")
+    """
+
+    def __init__(self) -> None:
+        self._known: dict[tuple[str, str, str], IndexStatus] = {}
+
+    @property
+    def report(self) -> list[IndexStatus]:
+        """The status of every index this registry has checked."""
+        return list(self._known.values())
+
+    def is_known(self, collection: AsyncIOMotorCollection, name: str) -> bool:
+        return self._key(collection, name) in self._known
+
+    async def aensure(
+        self,
+        collection: AsyncIOMotorCollection,
+        *,
+        keys: str | IndexKeys,
+        name: str,
+        **kwargs: Any
+    ) -> IndexStatus:
+        """Make sure an index exists with the given keys and options.
+
+        The existing indexes are inspected first so that an index is only
+        created (or, for a changed TTL, modified in place with `collMod`)
+        when it is missing or out of date. The result is cached.
+        """
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        cache_key = self._key(collection, name)
+        if (known := self._known.get(cache_key)) is not None:
+            return known._replace(status="cached")
+        try:
+            status = await self._aensure(
+                collection, keys=keys, name=name, **kwargs
+            )
+        except OperationFailure as err:
+            logger.error(err)
+            return self._status(collection, keys, name, "failed")
+        result = self._status(collection, keys, name, status)
+        self._known[cache_key] = result
+        return result
+
+    async def _aensure(
+        self,
+        collection: AsyncIOMotorCollection,
+        *,
+        keys: IndexKeys,
+        name: str,
+        **kwargs: Any
+    ) -> Literal["verified", "created", "updated"]:
+        existing = await collection.index_information()
+        expire_after_seconds = kwargs.get("expireAfterSeconds")
+        if (index := existing.get(name)) is not None:
+            if [tuple(k) for k in index["key"]] == keys:
+                if index.get("expireAfterSeconds") == expire_after_seconds:
+                    return "verified"
+                if expire_after_seconds is not None:
+                    # only the TTL changed, update it without a rebuild
+                    await collection.database.command(
+                        "collMod",
+                        collection.name,
+                        index={
+                            "name": name,
+                            "expireAfterSeconds": expire_after_seconds
+                        }
+                    )
+                    return "updated"
+            await collection.drop_index(name)
+        else:
+            # the same keys under a different name would conflict
+            for other_name, index in existing.items():
+                if other_name != "_id_" and [
+                    tuple(k) for k in index["key"]
+                ] == keys:
+                    await collection.drop_index(other_name)
+        await collection.create_index(keys, name=name, **kwargs)
+        return "created"
+
+    def _key(
+        self, collection: AsyncIOMotorCollection, name: str
+    ) -> tuple[str, str, str]:
+        return (collection.database.name, collection.name, name)
+
+    def _status(
+        self,
+        collection: AsyncIOMotorCollection,
+        keys: IndexKeys,
+        name: str,
+        status: str
+    ) -> IndexStatus:
+        return IndexStatus(
+            collection.database.name, collection.name, name, keys, status
+        )
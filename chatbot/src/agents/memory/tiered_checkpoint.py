@@ -0,0 +1,440 @@
+from asyncio import Task, create_task, gather
+from collections import OrderedDict
+import logging
+from time import monotonic
+from typing import Any, AsyncIterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+
+from pymongo.errors import PyMongoError
+from pymongo.operations import UpdateOne
+
+from .checkpoint import AsyncMongoDBSaver, Durability
+
+logger = logging.getLogger(__name__)
+
+
+class _ThreadCheckpoints:
+    """The checkpoint and pending write documents of one thread, as they
+    are stored in MongoDB."""
+
+    __slots__ = (
+        "checkpoints",
+        "writes",
+        "nbytes",
+        "touched_at",
+        "complete",
+        "trimmed_up_to",
+    )
+
+    def __init__(self, complete: bool) -> None:
+        # (checkpoint_ns, checkpoint_id) -> checkpoint document
+        self.checkpoints: dict[tuple[str, str], dict] = {}
+        # (checkpoint_ns, checkpoint_id) -> (task_id, idx) -> write document
+        self.writes: dict[tuple[str, str], dict[tuple[str, int], dict]] = {}
+        self.nbytes = 0
+        self.touched_at = monotonic()
+        # True when the thread started in this process and nothing was
+        # trimmed, i.e. MongoDB holds no checkpoint that is not in memory
+        self.complete = complete
+        # the newest trimmed checkpoint id; only the ones after it are all
+        # in memory
+        self.trimmed_up_to: str | None = None
+
+    def latest(self, checkpoint_ns: str) -> dict | None:
+        ids = [id for ns, id in self.checkpoints if ns == checkpoint_ns]
+        return self.checkpoints[(checkpoint_ns, max(ids))] if ids else None
+
+    def pending_writes(self, checkpoint_ns: str, checkpoint_id: str) -> list[dict]:  # noqa: E501
+        writes = self.writes.get((checkpoint_ns, checkpoint_id), {})
+        return [writes[key] for key in sorted(writes)]
+
+    def snapshot(self, doc: dict) -> dict | None:
+        if doc.get("snapshot_id") is None:
+            return None
+        return self.checkpoints.get((doc["checkpoint_ns"], doc["snapshot_id"]))  # noqa: E501
+
+    def trim(self, max_checkpoints: int) -> int:
+        """Drop the oldest checkpoints beyond `max_checkpoints`, except for
+        the snapshots the kept ones need."""
+        keys = sorted(self.checkpoints, key=lambda k: k[1])
+        needed = {
+            (key[0], self.checkpoints[key]["snapshot_id"])
+            for key in keys[-max_checkpoints:]
+        }
+        freed = 0
+        for key in keys[:-max_checkpoints]:
+            if key in needed:
+                continue
+            freed += _size(self.checkpoints.pop(key))
+            freed += sum(map(_size, self.writes.pop(key, {}).values()))
+            self.complete = False
+            self.trimmed_up_to = max(self.trimmed_up_to or "", key[1])
+        self.nbytes -= freed
+        return freed
+
+
+def _size(doc: dict) -> int:
+    return sum(
+        len(value) for value in doc.values() if isinstance(value, bytes)
+    )
+
+
+class TieredMongoDBSaver(AsyncMongoDBSaver):
+    """A checkpoint saver that keeps the checkpoints of recent threads in
+    a bounded in-process store and spills them to MongoDB in the
+    background.
+
+    `aget_tuple` and `alist` are served from memory when the thread is
+    there, and read from MongoDB otherwise, e.g. when another worker ran
+    the previous turn of the session. A thread is dropped from memory when
+    it is the least recently used one beyond `max_threads` or `max_bytes`,
+    or when it was not written to for `ttl` seconds, like its MongoDB
+    documents.
+    Only the newest `max_checkpoints_per_thread` checkpoints of a thread
+    are kept; older ones are read from MongoDB. Reading the latest
+    checkpoint of a thread in memory costs one indexed `find_one` for the
+    newest checkpoint id in MongoDB: if another worker wrote a newer one,
+    e.g. when a session moved to it and back, the stale copy is dropped
+    and the thread is read from MongoDB.
+
+    With the default `durability="exit"`, checkpoints and writes are
+    spilled in the background as they come, and `aflush` at the end of a
+    run waits for what is left. "step" and "superstep" are opt-in: they
+    write to MongoDB before `aput` or `aput_writes` returns, as the
+    base class does.
+
+    Instantiate:
+        .. code-block:: python
+
+            checkpointer = TieredMongoDBSaver(
+                client=client,
+                database_name="your-database-name",
+                collection_name="checkpoints",
+                ttl_index_name="for_deletion",
+                ttl_index_key="created_at",
+                ttl_expire_after_seconds=180,
+                max_threads=1000,
+                max_bytes=128 * 1024 * 1024,
+                max_checkpoints_per_thread=50,
+                durability="exit",
+            )
+            await checkpointer.aflush()     # wait for the spill on shutdown
+    """
+
+    def __init__(
+        self,
+        *,
+        max_threads: int = 1000,
+        max_bytes: int = 128 * 1024 * 1024,
+        max_checkpoints_per_thread: int = 50,
+        durability: Durability = "exit",
+        **kwargs: Any
+    ) -> None:
+        super().__init__(durability=durability, **kwargs)
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.ttl = self.ttl_expire_after_seconds
+        self._threads: OrderedDict[str, _ThreadCheckpoints] = OrderedDict()
+        # the same threads by their last write, which sets when they expire
+        self._written: OrderedDict[str, None] = OrderedDict()
+        self._nbytes = 0
+        self._spill_scheduled: set[str] = set()
+        self._spill_tasks: set[Task] = set()
+        # metrics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._spills = 0
+        self._failed_spills = 0
+        self._stale_threads = 0
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "threads": len(self._threads),
+            "max_threads": self.max_threads,
+            "bytes": self._nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+            "spills": self._spills,
+            "failed_spills": self._failed_spills,
+            "spills_in_flight": len(self._spill_tasks),
+            "stale_threads": self._stale_threads,
+        }
+
+    async def aget_tuple(
+        self, config: RunnableConfig
+    ) -> CheckpointTuple | None:
+        """Get a checkpoint tuple from memory, or from MongoDB if the
+        thread or the checkpoint is not there."""
+        config_dict = config["configurable"]
+        checkpoint_ns = config_dict.get("checkpoint_ns", "")
+        checkpoint_id = (
+            config_dict.get("checkpoint_id") or config_dict.get("thread_ts")
+        )
+        thread_id = config_dict["thread_id"]
+        if (thread := self._get_thread(thread_id)) is not None:
+            if checkpoint_id is None:
+                doc = thread.latest(checkpoint_ns)
+                if doc is not None and await self._is_stale(doc):
+                    self._drop(thread_id)
+                    self._stale_threads += 1
+                    doc = None
+            else:
+                doc = thread.checkpoints.get((checkpoint_ns, checkpoint_id))
+            if doc is not None and (
+                checkpoint_tuple := self._to_checkpoint_tuple(
+                    doc,
+                    thread.pending_writes(checkpoint_ns, doc["checkpoint_id"]),
+                    thread.snapshot(doc),
+                )
+            ) is not None:
+                self._hits += 1
+                return checkpoint_tuple
+        self._misses += 1
+        return await super().aget_tuple(config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+        lazy: bool = False,
+        page_size: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """List checkpoints newest first: those in memory, then the older
+        ones from MongoDB."""
+        # like `cursor.limit(0)`, a limit of 0 means no limit
+        limit = limit or None
+        thread = None
+        if config is not None:
+            thread = self._get_thread(config["configurable"]["thread_id"])
+        if thread is None:
+            async for checkpoint_tuple in super().alist(
+                config,
+                filter=filter,
+                before=before,
+                limit=limit,
+                lazy=lazy,
+                page_size=page_size,
+            ):
+                yield checkpoint_tuple
+            return
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        before_id = before["configurable"]["checkpoint_id"] if before else None
+        ids = sorted(
+            (
+                id for ns, id in thread.checkpoints
+                if ns == checkpoint_ns and id > (thread.trimmed_up_to or "")
+            ),
+            reverse=True,
+        )
+        count = 0
+        for checkpoint_id in ids:
+            if limit is not None and count == limit:
+                return
+            if before_id is not None and checkpoint_id >= before_id:
+                continue
+            doc = thread.checkpoints[(checkpoint_ns, checkpoint_id)]
+            metadata = self._load_metadata(doc) or {}
+            if filter and any(metadata.get(k) != v for k, v in filter.items()):  # noqa: E501
+                continue
+            checkpoint_tuple = self._to_checkpoint_tuple(
+                doc, snapshot=thread.snapshot(doc), lazy=lazy
+            )
+            if checkpoint_tuple is not None:
+                count += 1
+                yield checkpoint_tuple
+        if thread.complete or (limit is not None and count == limit):
+            return
+        if ids:
+            before_id = min(ids[-1], before_id) if before_id else ids[-1]
+        async for checkpoint_tuple in super().alist(
+            config,
+            filter=filter,
+            before=(
+                {"configurable": {"checkpoint_id": before_id}}
+                if before_id else None
+            ),
+            limit=None if limit is None else limit - count,
+            lazy=lazy,
+            page_size=page_size,
+        ):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata | None = None,
+        new_versions: ChannelVersions | None = None,
+    ) -> RunnableConfig:
+        """Save a checkpoint in memory and spill it to MongoDB in the
+        background."""
+        filter, doc = self._checkpoint_document(config, checkpoint, metadata)
+        thread_id = filter["thread_id"]
+        thread = self._get_thread(thread_id)
+        if thread is None:
+            thread = self._threads[thread_id] = _ThreadCheckpoints(
+                complete=doc["parent_checkpoint_id"] is None
+            )
+            if doc["snapshot_id"] is not None:
+                # its snapshot is not in memory; store this one in full
+                self.codec.reset(thread_id)
+                filter, doc = self._checkpoint_document(
+                    config, checkpoint, metadata
+                )
+        # like the TTL index, expire a thread a while after its last write
+        thread.touched_at = monotonic()
+        self._written[thread_id] = None
+        self._written.move_to_end(thread_id)
+        key = (filter["checkpoint_ns"], filter["checkpoint_id"])
+        self._add(thread, thread.checkpoints, key, {**filter, **doc})
+        self._nbytes -= thread.trim(self.max_checkpoints_per_thread)
+        self._get_buffer(thread_id)[0].extend(
+            self._checkpoint_operations(filter, doc)
+        )
+        self._evict()
+        # the checkpoint closes the superstep
+        await self._commit(thread_id, inline=self.durability != "exit")
+        return {"configurable": filter}
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        """Save intermediate writes in memory and spill them to MongoDB in
+        the background."""
+        thread_id = config["configurable"]["thread_id"]
+        documents = self._write_documents(config, writes, task_id)
+        if (thread := self._get_thread(thread_id)) is not None:
+            for upsert_query, doc in documents:
+                key = (upsert_query["checkpoint_ns"], upsert_query["checkpoint_id"])  # noqa: E501
+                self._add(
+                    thread,
+                    thread.writes.setdefault(key, {}),
+                    (task_id, upsert_query["idx"]),
+                    {**upsert_query, **doc},
+                )
+        self._get_buffer(thread_id)[1].extend(
+            UpdateOne(upsert_query, {"$set": doc}, upsert=True)
+            for upsert_query, doc in documents
+        )
+        self._evict()
+        if self.durability != "superstep":
+            await self._commit(thread_id, inline=self.durability == "step")
+
+    async def aflush(self, config: RunnableConfig | None = None) -> None:
+        """Write what is not spilled yet; without a config, also wait for
+        the spills under way, e.g. on shutdown."""
+        await super().aflush(config)
+        if config is None:
+            await gather(*self._spill_tasks, return_exceptions=True)
+
+    def _add(
+        self, thread: _ThreadCheckpoints, store: dict, key: Any, doc: dict
+    ) -> None:
+        size = _size(doc)
+        if (old := store.get(key)) is not None:
+            size -= _size(old)
+        store[key] = doc
+        thread.nbytes += size
+        self._nbytes += size
+
+    def _evict(self) -> None:
+        # reads keep a thread off the head of the LRU order but do not
+        # postpone its expiry, so the expired ones are found by last write
+        while self._written and self._is_expired(
+            self._threads[next(iter(self._written))]
+        ):
+            self._drop(next(iter(self._written)))
+            self._evictions += 1
+        while self._threads and (
+            len(self._threads) > self.max_threads
+            or self._nbytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._threads)))
+            self._evictions += 1
+
+    def _drop(self, thread_id: str) -> None:
+        thread = self._threads.pop(thread_id)
+        self._written.pop(thread_id, None)
+        self._nbytes -= thread.nbytes
+        # the next checkpoint may not follow the last one in memory
+        self.codec.reset(thread_id)
+
+    def _get_thread(self, thread_id: str) -> _ThreadCheckpoints | None:
+        if (thread := self._threads.get(thread_id)) is None:
+            return None
+        if self._is_expired(thread):
+            self._drop(thread_id)
+            self._evictions += 1
+            return None
+        self._threads.move_to_end(thread_id)
+        return thread
+
+    def _is_expired(self, thread: _ThreadCheckpoints) -> bool:
+        return monotonic() - thread.touched_at > self.ttl
+
+    async def _is_stale(self, latest: dict) -> bool:
+        """Whether MongoDB has a newer checkpoint of the thread than the
+        latest one in memory, written by another worker."""
+        try:
+            newest = await self.collection.find_one(
+                {
+                    "thread_id": latest["thread_id"],
+                    "checkpoint_ns": latest["checkpoint_ns"],
+                },
+                {"_id": 0, "checkpoint_id": 1},
+                sort=[("checkpoint_id", -1)],
+            )
+        except PyMongoError as err:
+            # memory is the best there is
+            logger.error(err)
+            return False
+        return (
+            newest is not None
+            and newest["checkpoint_id"] > latest["checkpoint_id"]
+        )
+
+    async def _commit(self, thread_id: str, *, inline: bool) -> None:
+        if inline:
+            await super().aflush({"configurable": {"thread_id": thread_id}})
+        else:
+            self._schedule_spill(thread_id)
+
+    def _schedule_spill(self, thread_id: str) -> None:
+        # the writes of one superstep are spilled together
+        if thread_id in self._spill_scheduled:
+            return
+        self._spill_scheduled.add(thread_id)
+        task = create_task(self._spill(thread_id))
+        self._spill_tasks.add(task)
+        task.add_done_callback(self._spill_tasks.discard)
+
+    async def _spill(self, thread_id: str) -> None:
+        self._spill_scheduled.discard(thread_id)
+        try:
+            await super().aflush({"configurable": {"thread_id": thread_id}})
+            self._spills += 1
+        except PyMongoError as err:
+            # the operations are buffered again for the next spill
+            self._failed_spills += 1
+            logger.error(err)
@@ -6,9 +6,10 @@ from langchain_core.documents import Document
 from langchain_mongodb import MongoDBAtlasVectorSearch
 from langchain_mongodb.utils import make_serializable
 
-# from motor.motor_asyncio import AsyncIOMotorCollection
+from motor.motor_asyncio import AsyncIOMotorCollection
 from pymongo.collection import Collection
-from ...utils.config import (
+
+from utils.config import (
     RUN_EXACT_NEAREST_NEIGHBOR_VECTOR_SEARCH,
     USE_LLAMA_INDEX
 )
@@ -19,7 +20,6 @@ if USE_LLAMA_INDEX:
     from llama_index.vector_stores.mongodb import MongoDBAtlasVectorSearch as LlamaMongoDBAtlasVectorSearch  # noqa: E501
 
 
-
 def vector_search_stage(
     query_vector: list[float],
     search_field: str,
@@ -103,7 +103,30 @@ class MongoDBAtlasVectorSearchWithENN(MongoDBAtlasVectorSearch):
         **kwargs: Any,
     ) -> list[tuple[Document, float]]:
         """Core search routine. See external methods for details."""
+        pipeline = self._search_pipeline(
+            query_vector,
+            k=k,
+            pre_filter=pre_filter,
+            post_filter_pipeline=post_filter_pipeline,
+            oversampling_factor=oversampling_factor,
+            include_embeddings=include_embeddings,
+            **kwargs,
+        )
+        # Execution
+        cursor = self._collection.aggregate(pipeline)  # type: ignore[arg-type]
+        return [self._to_document_and_score(res) for res in cursor]
 
+    def _search_pipeline(
+        self,
+        query_vector: list[float],
+        *,
+        k: int,
+        pre_filter: dict[str, Any] | None,
+        post_filter_pipeline: list[dict] | None,
+        oversampling_factor: int,
+        include_embeddings: bool,
+        **kwargs: Any,
+    ) -> list[dict[str, Any]]:
         # Atlas Vector Search, potentially with filter
         pipeline = [
             vector_search_stage(
@@ -124,18 +147,119 @@ class MongoDBAtlasVectorSearchWithENN(MongoDBAtlasVectorSearch):
         # Post-processing
         if post_filter_pipeline is not None:
             pipeline.extend(post_filter_pipeline)
+        return pipeline
 
-        # Execution
-        cursor = self._collection.aggregate(pipeline)  # type: ignore[arg-type]
-        docs = []
-
-        # Format
-        for res in cursor:
-            text = res.pop(self._text_key)
-            score = res.pop("score")
-            make_serializable(res)
-            docs.append((Document(page_content=text, metadata=res), score))
-        return docs
+    def _to_document_and_score(
+        self, res: dict[str, Any]
+    ) -> tuple[Document, float]:
+        text = res.pop(self._text_key)
+        score = res.pop("score")
+        make_serializable(res)
+        return Document(page_content=text, metadata=res), score
+
+
+class AsyncMongoDBAtlasVectorSearch(MongoDBAtlasVectorSearchWithENN):
+    """A vector store whose async searches run on a Motor collection and
+    embed the query with the async embeddings API, instead of running the
+    sync search in the default thread pool as the base class does. The
+    sync methods keep using the PyMongo collection.
+
+    Instantiate:
+        .. code-block:: python
+
+            vector_store = AsyncMongoDBAtlasVectorSearch(
+                collection=client[db_name][collection_name],
+                acollection=motor_client[db_name][collection_name],
+                embedding=OpenAIEmbeddings(model="text-embedding-3-large"),
+                index_name="business_description",
+            )
+            docs = await vector_store.asimilarity_search(
+                "what time is checkout?", k=3, include_scores=True
+            )
+    """
+
+    def __init__(
+        self,
+        collection: Collection[dict[str, Any]],
+        acollection: AsyncIOMotorCollection,
+        embedding: Embeddings,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            collection=collection, embedding=embedding, **kwargs
+        )
+        self._acollection = acollection
+
+    async def asimilarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        pre_filter: dict[str, Any] | None = None,
+        post_filter_pipeline: list[dict] | None = None,
+        oversampling_factor: int = 10,
+        include_scores: bool = False,
+        include_embeddings: bool = False,
+        **kwargs: Any,
+    ) -> list[Document]:
+        docs_and_scores = await self.asimilarity_search_with_score(
+            query,
+            k=k,
+            pre_filter=pre_filter,
+            post_filter_pipeline=post_filter_pipeline,
+            oversampling_factor=oversampling_factor,
+            include_embeddings=include_embeddings,
+            **kwargs,
+        )
+        if include_scores:
+            for doc, score in docs_and_scores:
+                doc.metadata["score"] = score
+        return [doc for doc, _ in docs_and_scores]
+
+    async def asimilarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        pre_filter: dict[str, Any] | None = None,
+        post_filter_pipeline: list[dict] | None = None,
+        oversampling_factor: int = 10,
+        include_embeddings: bool = False,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return await self._asimilarity_search_with_score(
+            embedding,
+            k=k,
+            pre_filter=pre_filter,
+            post_filter_pipeline=post_filter_pipeline,
+            oversampling_factor=oversampling_factor,
+            include_embeddings=include_embeddings,
+            **kwargs,
+        )
+
+    async def _asimilarity_search_with_score(
+        self,
+        query_vector: list[float],
+        k: int = 4,
+        pre_filter: dict[str, Any] | None = None,
+        post_filter_pipeline: list[dict] | None = None,
+        oversampling_factor: int = 10,
+        include_embeddings: bool = False,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """The core search routine, on the Motor collection."""
+        pipeline = self._search_pipeline(
+            query_vector,
+            k=k,
+            pre_filter=pre_filter,
+            post_filter_pipeline=post_filter_pipeline,
+            oversampling_factor=oversampling_factor,
+            include_embeddings=include_embeddings,
+            **kwargs,
+        )
+        return [
+            self._to_document_and_score(res)
+            async for res in self._acollection.aggregate(pipeline)
+        ]
 
 
 if USE_LLAMA_INDEX:
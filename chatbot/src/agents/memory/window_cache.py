@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from typing import Any
+
+from bson import encode as bson_encode
+
+WindowKey = tuple[str, str, str]
+
+
+class _Window:
+    __slots__ = ("docs", "sizes", "complete")
+
+    def __init__(self, docs: list[dict], complete: bool) -> None:
+        # oldest first
+        self.docs = docs
+        self.sizes = [len(bson_encode(doc)) for doc in docs]
+        # True when `docs` is the whole history of the session
+        self.complete = complete
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes)
+
+
+class HistoryWindowCache:
+    """In-process LRU cache of the newest chat history documents of each
+    session, bounded by the number of sessions and by their BSON size.
+
+    A window is stored after it is read from MongoDB and kept up to date
+    write-through as messages are added, so that a steady conversation needs
+    no history reads. The cache assumes that this process is the only one
+    writing chat history.
+
+    Messages added while a window is being read may be missing from the
+    read and can't be appended to a window that is not stored yet, so a
+    read takes the generation of its key with `begin_read`, and `put` drops
+    the window if `extend` or `discard` changed the key in the meantime.
+
+    Instantiate:
+        .. code-block:: python
+
+            cache = HistoryWindowCache(
+                max_sessions=10_000,
+                max_bytes=64 * 1024 * 1024,
+                max_messages=20,
+            )
+            docs = cache.get(key, limit=20)     # None on a miss
+            generation = cache.begin_read(key)
+            try:
+                ...     # read the docs from MongoDB
+                cache.put(key, docs, complete=len(docs) < 20, generation=generation)  # noqa: E501
+            finally:
+                cache.end_read(key)
+            cache.extend(key, new_docs)
+            cache.discard(key)
+    """
+
+    def __init__(
+        self,
+        *,
+        max_sessions: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_messages: int = 20,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self._windows: OrderedDict[WindowKey, _Window] = OrderedDict()
+        self._nbytes = 0
+        # key -> [generation, reads in flight], only for the keys being read
+        self._reads: dict[WindowKey, list[int]] = {}
+        # metrics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "sessions": len(self._windows),
+            "max_sessions": self.max_sessions,
+            "bytes": self._nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+            "evictions": self._evictions,
+        }
+
+    def get(self, key: WindowKey, limit: int | None = None) -> list[dict] | None:  # noqa: E501
+        """The newest `limit` documents of a session, oldest first, or
+        `None` if the cached window can't answer the read."""
+        window = self._windows.get(key)
+        if window is None or not (
+            window.complete or (limit and len(window.docs) >= limit)
+        ):
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._windows.move_to_end(key)
+        return window.docs[-limit:] if limit else list(window.docs)
+
+    def begin_read(self, key: WindowKey) -> int:
+        """Start reading the window of a session from MongoDB. Returns the
+        generation to pass to `put`; call `end_read` once done."""
+        entry = self._reads.setdefault(key, [0, 0])
+        entry[1] += 1
+        return entry[0]
+
+    def end_read(self, key: WindowKey) -> None:
+        entry = self._reads[key]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._reads[key]
+
+    def put(
+        self,
+        key: WindowKey,
+        docs: list[dict],
+        complete: bool,
+        generation: int | None = None,
+    ) -> None:
+        """Store the newest documents of a session, oldest first, unless
+        they were read before the session's generation changed."""
+        if generation is not None and self._reads[key][0] != generation:
+            return
+        self._remove(key)
+        window = _Window(list(docs), complete)
+        self._windows[key] = window
+        self._nbytes += window.nbytes
+        self._shrink(window)
+
+    def extend(self, key: WindowKey, docs: list[dict]) -> None:
+        """Append newly written documents to a cached window. Nothing is
+        cached for a session whose window is unknown."""
+        self._bump(key)
+        if (window := self._windows.get(key)) is None:
+            return
+        window.docs.extend(docs)
+        sizes = [len(bson_encode(doc)) for doc in docs]
+        window.sizes.extend(sizes)
+        self._nbytes += sum(sizes)
+        self._windows.move_to_end(key)
+        self._shrink(window)
+
+    def discard(self, key: WindowKey) -> None:
+        self._bump(key)
+        self._remove(key)
+
+    def _remove(self, key: WindowKey) -> None:
+        if (window := self._windows.pop(key, None)) is not None:
+            self._nbytes -= window.nbytes
+
+    def _bump(self, key: WindowKey) -> None:
+        if (entry := self._reads.get(key)) is not None:
+            entry[0] += 1
+
+    def _shrink(self, window: _Window) -> None:
+        # drop the oldest messages beyond the window size ...
+        if (excess := len(window.docs) - self.max_messages) > 0:
+            self._nbytes -= sum(window.sizes[:excess])
+            del window.docs[:excess]
+            del window.sizes[:excess]
+            window.complete = False
+        # ... and then the least recently used sessions
+        while self._windows and (
+            len(self._windows) > self.max_sessions
+            or self._nbytes > self.max_bytes
+        ):
+            _, evicted = self._windows.popitem(last=False)
+            self._nbytes -= evicted.nbytes
+            self._evictions += 1
@@ -0,0 +1,207 @@
+from asyncio import (
+    Event,
+    Lock,
+    Task,
+    create_task,
+    gather,
+    wait_for,
+)
+import logging
+from typing import Any
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ChatHistoryWriteBuffer:
+    """Write-behind buffer for chat history inserts.
+
+    Documents are queued in memory and flushed in the background with one
+    unordered `insert_many` per collection, batching the writes of all
+    sessions together. Documents stay visible through `pending` until
+    their insert has completed, so that the next turn of a session still
+    sees its previous exchange (read-your-writes).
+
+    Instantiate:
+        .. code-block:: python
+
+            buffer = ChatHistoryWriteBuffer(
+                max_pending=1000,
+                max_batch_size=100,
+                flush_interval=0.5,
+            )
+            await buffer.aadd(collection, documents)
+            buffer.pending(collection, session_id_key, session_id)
+            await buffer.aclose()           # flush on shutdown
+    """
+
+    def __init__(
+        self,
+        *,
+        max_pending: int = 1000,
+        max_batch_size: int = 100,
+        flush_interval: float = 0.5,
+    ) -> None:
+        self.max_pending = max_pending
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._pending: list[tuple[AsyncIOMotorCollection, dict]] = []
+        self._in_flight: list[tuple[AsyncIOMotorCollection, dict]] = []
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._flusher: Task | None = None
+        self._closing = False
+        # metrics
+        self._written = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._dropped = 0
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "max_pending": self.max_pending,
+            "written": self._written,
+            "batches": self._batches,
+            "failed_batches": self._failed_batches,
+            "dropped": self._dropped,
+        }
+
+    async def aadd(
+        self, collection: AsyncIOMotorCollection, documents: list[dict]
+    ) -> None:
+        """Queue documents for insertion. Only waits when the buffer is
+        full, in which case it is flushed first."""
+        if not self._closing and (
+            self._flusher is None or self._flusher.done()
+        ):
+            self._flusher = create_task(self._run())
+        if len(self._pending) + len(documents) > self.max_pending:
+            await self.aflush()
+        if (overflow := len(self._pending) + len(documents) - self.max_pending) > 0:  # noqa: E501
+            # the database is not keeping up; keep the memory bounded
+            self._dropped += overflow
+            logger.error(f"Dropped {overflow} unwritten chat history messages.")  # noqa: E501
+            del self._pending[:overflow]
+        self._pending.extend((collection, doc) for doc in documents)
+        if len(self._pending) >= self.max_batch_size:
+            self._wakeup.set()
+
+    async def aclose(self) -> None:
+        """Stop the background flusher and write everything still queued."""
+        self._closing = True
+        if self._flusher is not None:
+            # let a flush that is under way finish instead of cancelling it
+            self._wakeup.set()
+            await gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.aflush()
+
+    async def adiscard(
+        self,
+        collection: AsyncIOMotorCollection,
+        session_id_key: str,
+        session_id: str,
+    ) -> None:
+        """Forget the queued documents of a session and wait for the one
+        being written, e.g. before the session's history is deleted."""
+        self._pending = [
+            (coll, doc) for coll, doc in self._pending
+            if not self._matches(coll, doc, collection, session_id_key, session_id)  # noqa: E501
+        ]
+        async with self._flush_lock:
+            pass
+
+    async def aflush(self) -> None:
+        """Write all queued documents, one `insert_many` per collection."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._in_flight, self._pending = self._pending, []
+            try:
+                batches: dict[tuple[str, str], list] = {}
+                for collection, doc in self._in_flight:
+                    key = (collection.database.name, collection.name)
+                    batches.setdefault(key, [collection, []])[1].append(doc)
+                results = await gather(
+                    *(
+                        collection.insert_many(docs, ordered=False)
+                        for collection, docs in batches.values()
+                    ),
+                    return_exceptions=True
+                )
+                for (collection, docs), result in zip(
+                    batches.values(), results
+                ):
+                    self._batches += 1
+                    if not isinstance(result, BaseException):
+                        self._written += len(docs)
+                    elif self._is_duplicate_only(result):
+                        # written by an earlier, partially failed attempt
+                        self._written += len(docs)
+                    else:
+                        self._failed_batches += 1
+                        logger.error(result)
+                        self._requeue(collection, docs)
+            finally:
+                self._in_flight = []
+
+    def pending(
+        self,
+        collection: AsyncIOMotorCollection,
+        session_id_key: str,
+        session_id: str,
+    ) -> list[dict]:
+        """The documents of a session that are not written yet, oldest
+        first."""
+        return [
+            doc for coll, doc in (*self._in_flight, *self._pending)
+            if self._matches(coll, doc, collection, session_id_key, session_id)  # noqa: E501
+        ]
+
+    def _is_duplicate_only(self, error: BaseException) -> bool:
+        return isinstance(error, BulkWriteError) and all(
+            e["code"] == DUPLICATE_KEY_ERROR
+            for e in error.details["writeErrors"]
+        )
+
+    def _matches(
+        self,
+        coll: AsyncIOMotorCollection,
+        doc: dict,
+        collection: AsyncIOMotorCollection,
+        session_id_key: str,
+        session_id: str,
+    ) -> bool:
+        return (
+            doc.get(session_id_key) == session_id
+            and coll.name == collection.name
+            and coll.database.name == collection.database.name
+        )
+
+    def _requeue(
+        self, collection: AsyncIOMotorCollection, documents: list[dict]
+    ) -> None:
+        room = self.max_pending - len(self._pending)
+        if room < len(documents):
+            self._dropped += len(documents) - max(room, 0)
+            documents = documents[len(documents) - max(room, 0):]
+        self._pending[:0] = [(collection, doc) for doc in documents]
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await wait_for(self._wakeup.wait(), timeout=self.flush_interval)  # noqa: E501
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.aflush()
+            except PyMongoError as err:
+                logger.error(err)
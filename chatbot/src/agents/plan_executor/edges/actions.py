@@ -1,8 +1,13 @@
+from asyncio import create_task
 from typing import Any, Literal
 
 from langchain_core.runnables import RunnableConfig
 
+from openai import OpenAIError
+
 from .base import BaseEdgeChains
+from ...base import has_time_for
+from ...speculative_retrieval import SPECULATIVE_RETRIEVAL_KEY
 from ...typing import (
     ClassifyQuestion,
     LLMOutput,
@@ -10,6 +15,7 @@ from ...typing import (
     RouteQuestion,
 )
 # from utils.config import DEBUG
+from utils.config import PLAN_STEP_TIME
 
 
 class EdgeActions(BaseEdgeChains):
@@ -20,18 +26,37 @@ class EdgeActions(BaseEdgeChains):
     async def _classify_input_(
         self, state: State, config: RunnableConfig
     ) -> Literal["answer right away", "process request", "go to help desk"]:
-        output_1: LLMOutput = await self._classifier_llm.ainvoke(
-            state,
-            config=config,
-            stream_mode="value"
-        )
+        """
+        The conditional entry point.
+        The router runs alongside the classifier rather than after it, so
+        that a hotel question waits for one LLM round-trip instead of two.
+        It is cancelled once the classifier shows it is not needed.
+        Neither LLM is called when the local intent classifier is confident.
+        """
+        relevant = await self._predict_intent_("relevant", state, config)
+        if relevant == "no":
+            return "answer right away"
+        elif relevant == "yes":
+            return await self._route_query_(state=state, config=config)
+        route = create_task(self._route_query_(state=state, config=config))
+        try:
+            output_1: LLMOutput = await self._classifier_llm.ainvoke(
+                state,
+                config=config,
+                stream_mode="value"
+            )
+        except BaseException:
+            route.cancel()
+            raise
         response = output_1.pop("output")
         if isinstance(response, ClassifyQuestion):
             if response.binary_score == "no":
+                route.cancel()
                 return "answer right away"
             else:
-                return await self._route_query_(state=state, config=config)
+                return await route
         else:
+            route.cancel()
             # if the LLM result is not ClassifyQuestion object,
             # that means it resulted in error.
             # we need to handle this error differently.
@@ -71,23 +96,30 @@ class EdgeActions(BaseEdgeChains):
     #             return "exit"
 
     def _plan_execution_control_(
-        self, state: State
+        self, state: State, config: RunnableConfig
     ) -> Literal["continue", "exit"]:
         """
         An action taken on the conditional edge.
-        Returns to the agent node if response is still empty.
+        Returns to the agent node if response is still empty and another
+        agent and replanner round fits in the time left.
         Otherwise, end the loop and return the result.
         """
-        if state.get("response") is None:
+        if state.get("response") is not None:
+            # we're done with the entire thing, exit right away
+            return "exit"
+        elif has_time_for(config, PLAN_STEP_TIME):
             # no response is generated yet so continue with more agent calls
             return "continue"
         else:
-            # we're done with the entire thing, exit right away
+            # out of time; the answer is made of the steps done so far
             return "exit"
 
     async def _route_query_(
         self, state: State, config: RunnableConfig
     ) -> Literal["process request", "go to help desk"]:
+        request = await self._predict_intent_("request", state, config)
+        if request is not None:
+            return "process request" if request == "yes" else "go to help desk"
         output: LLMOutput = await self._router.ainvoke(
             state,
             config=config,
@@ -107,3 +139,31 @@ class EdgeActions(BaseEdgeChains):
             # person to look into what's wrong.
             # for now, we just ignore it and go to immediate_answer
             return "go to help desk"
+
+    async def _predict_intent_(
+        self,
+        task: Literal["relevant", "request"],
+        state: State,
+        config: RunnableConfig
+    ) -> Literal["yes", "no"] | None:
+        """
+        The local intent classifier's label for the input, or None if the
+        LLM has to decide.
+        The embedding of the speculative retrieval is reused when there is
+        one, so that the question is embedded only once.
+        """
+        classifier = self.intent_classifier
+        if classifier is None:
+            return None
+        speculation = (
+            config.get("configurable", {}).get(SPECULATIVE_RETRIEVAL_KEY)
+        )
+        try:
+            if speculation is not None and speculation.question == state["input"]:  # noqa: E501
+                embedding = await speculation.aget_embedding()
+            else:
+                embedding = await classifier.aembed(state["input"])
+        except OpenAIError:
+            # the LLM can still classify a question that was not embedded
+            return None
+        return classifier.predict(task, embedding)
@@ -3,6 +3,7 @@ from typing import Any
 from langchain_core.runnables import Runnable
 
 from ...base import BaseChains, ChatModelWithErrorHandling
+from ...intent_classifier import IntentClassifier
 from ...typing import RouteQuestion, ClassifyQuestion
 from ...prompt_templates import (
     # IMMEDIATE_ANSWER_EVALUATOR_HUMAN_PROMPT,
@@ -24,6 +25,8 @@ class BaseEdgeChains(BaseChains):
     ) -> None:
         self._classifier_llm = self._get_classifier(llm=evaluator_llm)
         self._router = self._get_router(llm=evaluator_llm)
+        # answers the classifier and the router locally when it is confident
+        self.intent_classifier: IntentClassifier | None = None
         # self._answer_grader = self._get_evaluator(llm=evaluator_llm)
         super().__init__(**kwargs)
 
@@ -1,9 +1,13 @@
+from time import perf_counter
 from typing import Any
 
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
 
 from .base import BaseNodeChains
+from ...base import has_time_for, is_past_deadline
+from ...query_rewrite import QueryRewriteGate
+from ...speculative_retrieval import SPECULATIVE_RETRIEVAL_KEY
 from ...prompt_templates import (
     BASE_PROMPT_TEMPLATE,
     TASK_FORMAT_FOR_HUMAN_PROMPT
@@ -15,7 +19,13 @@ from ...typing import (
     PlanExecute as State,
     Response,
 )
-from utils.config import DEBUG, LOCAL_DEBUG, USE_LLAMA_INDEX
+from utils.config import (
+    DEBUG,
+    LOCAL_DEBUG,
+    MIN_LLM_CALL_TIME,
+    USE_CONDITIONAL_QUERY_REWRITE,
+    USE_LLAMA_INDEX,
+)
 
 
 class NodeActions(BaseNodeChains):
@@ -27,6 +37,9 @@ class NodeActions(BaseNodeChains):
     def __init__(self, **kwargs: Any) -> None:
         # if DEBUG:
         #     self.counter = next(self.planner_call_counter_generator)
+        self.query_rewrite_gate = (
+            QueryRewriteGate() if USE_CONDITIONAL_QUERY_REWRITE else None
+        )
         super().__init__(**kwargs)
 
     async def _agent_entry_(
@@ -104,7 +117,12 @@ class NodeActions(BaseNodeChains):
         """
         use llm to generate an answer right away
         by looking at past chat history
+
+        Without the time for the call, leaves the response empty so that
+        the answer is made of the steps done so far.
         """
+        if not has_time_for(config, MIN_LLM_CALL_TIME):
+            return {"response": None}
         output: LLMOutput = await self._answerer.ainvoke(
             state,
             config=config,
@@ -113,17 +131,30 @@ class NodeActions(BaseNodeChains):
         if LOCAL_DEBUG:
             print("----- IMMEDIATE ANSWER -----\n")
             print(f"{repr(output)}\n\n")
-        return {"response": output.pop("output"), **output}
+        response = output.pop("output")
+        if output["error"] and is_past_deadline(config):
+            # the call was cut short by the deadline
+            response = None
+        return {"response": response, **output}
 
     async def _call_o1_(
         self, state: State, config: RunnableConfig
     ) -> dict[str, str]:
+        """
+        Without the time for the call, or when the call is cut short by
+        the deadline, leaves the response empty so that the answer is made
+        of the context retrieved so far.
+        """
+        if not has_time_for(config, MIN_LLM_CALL_TIME):
+            return {"response": None}
         output: LLMOutput = await self._agent_llm.ainvoke(
             state,
             config=config,
             stream_mode="values"
         )
         response = output.pop("output")
+        if output["error"] and is_past_deadline(config):
+            response = None
         if LOCAL_DEBUG:
             print(f"-------AGENT OUTPUT-------\n{repr(response)}\n")
         return {"response": response, **output}
@@ -165,11 +196,23 @@ class NodeActions(BaseNodeChains):
         self, state: State, config: RunnableConfig
     ) -> dict[str, str]:
         """use llm to make the question better if possible"""
+        if not has_time_for(config, MIN_LLM_CALL_TIME):
+            # the question is answered as asked rather than not at all
+            return {"input": state["input"], "past_steps": None}
+        gate = self.query_rewrite_gate
+        if gate is not None and not gate.should_rewrite(
+            state["input"], state.get("chat_history") or []
+        ):
+            # nothing in the history the question could be completed with
+            return {"input": state["input"], "past_steps": None}
+        start = perf_counter()
         output: LLMOutput = await self._query_processor.ainvoke(
             state,
             config=config,
             stream_mode="values"
         )
+        if gate is not None:
+            gate.record_rewrite(perf_counter() - start)
         if LOCAL_DEBUG:
             # print(f"----- PLAN EXECUTOR #{self.counter} -----")
             print(f"-------ENTRY-------\n-----State------\n{repr(state)}\n")
@@ -186,7 +229,12 @@ class NodeActions(BaseNodeChains):
         If the LLM response is Response, then updates the response
         variable of the state. Otherwise, updates the state with
         detailed action steps to take to fully answer the question.
+
+        Without the time for the call, leaves the response empty so that
+        the answer is made of the steps done so far.
         """
+        if not has_time_for(config, MIN_LLM_CALL_TIME):
+            return {"response": None}
         output: LLMOutput = await self._replanner.ainvoke(
             state,
             config=config,
@@ -212,8 +260,17 @@ class NodeActions(BaseNodeChains):
             # if it's a string. in what case can this happen?
             return {"response": act, **output}
 
-    async def _retriever_(self, state: State) -> dict[str, str | None]:
-        documents = await self._retriever.ainvoke(state["input"])
+    async def _retriever_(
+        self, state: State, config: RunnableConfig
+    ) -> dict[str, str | None]:
+        speculation = (
+            config.get("configurable", {}).get(SPECULATIVE_RETRIEVAL_KEY)
+        )
+        if speculation is not None:
+            # reuse the search started when the message arrived
+            documents = await speculation.aget_documents(state["input"])
+        else:
+            documents = await self._retriever.ainvoke(state["input"])
         formatted_docs = await self._format_docs(documents)
         # input = self._format_template(state["input"], formatted_docs)
         if DEBUG:
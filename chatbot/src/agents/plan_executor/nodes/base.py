@@ -10,6 +10,7 @@ from langchain_core.tools import Tool
 from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
 
 from ...base import BaseChains, ChatModelWithErrorHandling
+from ...speculative_retrieval import SpeculativeRetrieval
 from ...prompt_templates import (
     IMMEDIATE_ANSWERER_HUMAN_PROMPT,
     IMMEDIATE_ANSWERER_SYSTEM_PROMPT,
@@ -29,6 +30,7 @@ from ...typing import (
 from utils.config import (
     TIMEZONE,
     RETRIEVER_POST_FILTER_MIN_SIMILARITY_SCORE,
+    SPECULATIVE_RETRIEVAL_MIN_SIMILARITY,
     USE_LLAMA_INDEX,
     USE_PLAN_EXECUTE
 )
@@ -149,6 +151,32 @@ class BaseNodeChains(BaseChains):
         )
         return retriever
 
+    def speculate_retrieval(self, question: str) -> SpeculativeRetrieval:
+        """Start retrieving documents for the question before the graph
+        has looked at it."""
+        return SpeculativeRetrieval(
+            question,
+            embed=self._retriever.vectorstore.embeddings.aembed_query,
+            search=self._asearch_by_vector,
+            min_similarity=SPECULATIVE_RETRIEVAL_MIN_SIMILARITY,
+        )
+
+    async def _asearch_by_vector(
+        self, embedding: list[float]
+    ) -> list[Document]:
+        """Search like the retriever does, for a query already embedded."""
+        search_kwargs = dict(self._retriever.search_kwargs)
+        include_scores = search_kwargs.pop("include_scores", False)
+        docs_and_scores = (
+            await self._retriever.vectorstore._asimilarity_search_with_score(
+                embedding, **search_kwargs
+            )
+        )
+        if include_scores:
+            for doc, score in docs_and_scores:
+                doc.metadata["score"] = score
+        return [doc for doc, _ in docs_and_scores]
+
     async def _get_relevant_docs(
         self,
         input: str,
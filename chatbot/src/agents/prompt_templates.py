@@ -12,6 +12,15 @@ When someone responda with "Thanks" or "thank you", you must respond with \
 "It's my pleasure" with nothing additional added.\n
 """
 
+ANYTIME_ANSWER_SYSTEM_PROMPT = f"""{BASE_PROMPT_TEMPLATE}
+There was no time to finish researching the question. Answer it based only \
+on the research done so far. If it doesn't provide enough information to \
+answer the question, say I DON'T KNOW. Try to answer in 10 words or less.
+----------------\nCompleted steps:\n{{past_steps}}\n
+----------------\nContext:\n{{retrieved_context}}"""
+
+ANYTIME_ANSWER_HUMAN_PROMPT = "Question: {input}\nAnswer:"
+
 HOTEL_QUESTION_ROUTER_SYSTEM_PROMPT = """You are a question \
 classifier that makes a binary classification to identify which question \
 is a request for an item / object and which is not. Give a binary score \
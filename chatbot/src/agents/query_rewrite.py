@@ -0,0 +1,95 @@
+import re
+from typing import Any
+
+from langchain_core.messages import BaseMessage
+
+# words that point back to something said in an earlier turn
+REFERRING_WORDS = frozenset({
+    "it", "its", "it's", "that", "this", "these", "those", "they", "them",
+    "their", "theirs", "there", "he", "him", "his", "she", "her", "hers",
+    "one", "ones", "same", "else", "other", "another", "former", "latter",
+    "also", "too", "instead", "then",
+})
+# openings of a question that continues the previous one
+ELLIPTIC_OPENINGS = (
+    "and ", "but ", "or ", "so ", "what about", "how about", "what if",
+    "why not", "any other", "anything else", "more ",
+)
+# "there" after these is existential ("is there a spa?"), not a place
+EXISTENTIAL_VERBS = frozenset({"is", "are", "was", "were", "be"})
+# questions this short rarely stand on their own once there is a history
+MAX_ELLIPTIC_WORDS = 3
+WORD = re.compile(r"[a-z']+")
+
+
+def refers_to_history(question: str) -> bool:
+    """Whether the question refers back to earlier turns with a pronoun,
+    an elliptic opening or by being a fragment."""
+    text = question.casefold().strip()
+    words = WORD.findall(text)
+    return (
+        len(words) <= MAX_ELLIPTIC_WORDS
+        or text.startswith(ELLIPTIC_OPENINGS)
+        or text.endswith(("...", "…"))
+        or any(
+            word in REFERRING_WORDS
+            and not (word == "there" and previous in EXISTENTIAL_VERBS)
+            for previous, word in zip(["", *words], words)
+        )
+    )
+
+
+def needs_rewrite(question: str, chat_history: list[BaseMessage]) -> bool:
+    """Whether rewriting the question with the chat history can add to it:
+    there is a history, and the question refers back to it."""
+    return bool(chat_history) and refers_to_history(question)
+
+
+class QueryRewriteGate:
+    """Sends a question to the query rewrite LLM only if `needs_rewrite`
+    says the rewrite can add context, and counts the calls it saved.
+
+    The latency saved is estimated with the mean latency of the rewrites
+    that were made.
+
+    Instantiate:
+        .. code-block:: python
+
+            gate = QueryRewriteGate()
+            if gate.should_rewrite(question, chat_history):
+                start = perf_counter()
+                ...     # call the rewrite LLM
+                gate.record_rewrite(perf_counter() - start)
+            gate.metrics
+    """
+
+    def __init__(self) -> None:
+        self._rewrites = 0
+        self._skips = 0
+        self._rewrite_seconds = 0.0
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        questions = self._rewrites + self._skips
+        mean_seconds = (
+            self._rewrite_seconds / self._rewrites if self._rewrites else 0.0
+        )
+        return {
+            "rewrites": self._rewrites,
+            "skips": self._skips,
+            "skip_rate": self._skips / questions if questions else 0.0,
+            "mean_rewrite_seconds": mean_seconds,
+            "estimated_seconds_saved": mean_seconds * self._skips,
+        }
+
+    def should_rewrite(
+        self, question: str, chat_history: list[BaseMessage]
+    ) -> bool:
+        if needs_rewrite(question, chat_history):
+            return True
+        self._skips += 1
+        return False
+
+    def record_rewrite(self, seconds: float) -> None:
+        self._rewrites += 1
+        self._rewrite_seconds += seconds
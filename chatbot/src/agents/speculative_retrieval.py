@@ -0,0 +1,86 @@
+from asyncio import Task, create_task, gather, shield
+from math import sqrt
+from typing import Awaitable, Callable
+
+from langchain_core.documents import Document
+
+# the config key the speculative retrieval of a run is passed to nodes with
+SPECULATIVE_RETRIEVAL_KEY = "speculative_retrieval"
+
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = sqrt(sum(x * x for x in a)) * sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SpeculativeRetrieval:
+    """A vector search on the question as it arrived, started before the
+    graph classifies and rewrites it, so that its latency hides behind
+    those LLM calls.
+
+    The retriever node asks for the documents of the query it ended up
+    with. The speculative result is used if that query is the question
+    itself, or if the cosine similarity of their embeddings is at least
+    `min_similarity`. Otherwise the speculative search is cancelled
+    and the query is searched with the embedding already computed for the
+    comparison.
+
+    Instantiate:
+        .. code-block:: python
+
+            speculation = SpeculativeRetrieval(
+                "what time does the pool open",
+                embed=embeddings.aembed_query,
+                search=search_by_vector,
+                min_similarity=0.9,
+            )
+            documents = await speculation.aget_documents(rewritten_query)
+            speculation.cancel()    # once the run is over
+    """
+
+    def __init__(
+        self,
+        question: str,
+        *,
+        embed: Callable[[str], Awaitable[list[float]]],
+        search: Callable[[list[float]], Awaitable[list[Document]]],
+        min_similarity: float,
+    ) -> None:
+        self.question = question
+        self.min_similarity = min_similarity
+        self._embed = embed
+        self._search = search
+        self._embedding: Task = create_task(embed(question))
+        self._documents: Task = create_task(self._asearch_question())
+
+    async def aget_embedding(self) -> list[float]:
+        """The embedding of the question, for others who need it too."""
+        return await shield(self._embedding)
+
+    async def aget_documents(self, query: str) -> list[Document]:
+        if self._same_text(query, self.question):
+            return await self._documents
+        embedding, query_embedding = await gather(
+            self._embedding, self._embed(query)
+        )
+        if cosine_similarity(embedding, query_embedding) >= self.min_similarity:  # noqa: E501
+            return await self._documents
+        self._documents.cancel()
+        return await self._search(query_embedding)
+
+    def cancel(self) -> None:
+        """Stop the speculative work the run did not need."""
+        for task in (self._embedding, self._documents):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # a failure nobody asked for is not worth reporting
+                task.exception()
+
+    async def _asearch_question(self) -> list[Document]:
+        return await self._search(await self._embedding)
+
+    @staticmethod
+    def _same_text(a: str, b: str) -> bool:
+        return " ".join(a.casefold().split()) == " ".join(b.casefold().split())  # noqa: E501
@@ -29,6 +29,7 @@ def manage_messages(left: Messages, right: Messages | None) -> Messages:
 
 class ConfigSchema(TypedDict):
     thread_id: str
+    deadline: float | None = None
     forget: bool = False
     trim_intermediate_steps: bool = True
 
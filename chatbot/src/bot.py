@@ -1,22 +1,105 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
 from chainlit.server import app
 from chainlit.context import init_http_context
 
-from fastapi import Request
+from fastapi import FastAPI, Request, Response
+
+from twilio.request_validator import RequestValidator
+from twilio.twiml.messaging_response import MessagingResponse
 
-from utils.connection import AnswerGenerator
-from utils.config import DEBUG, LOCAL
+from agents.typing import TwilioResponseMessage
+from utils.connection import AnswerGenerator, TWILIO_AUTH_TOKEN
+from utils.config import (
+    API_ERROR_MESSAGE,
+    DEBUG,
+    LOCAL,
+    SMS_WORKER_POOL_SIZE,
+    SMS_WORKER_QUEUE_SIZE,
+    SMS_WORKER_SHUTDOWN_TIMEOUT,
+    USE_BACKGROUND_SMS_WORKERS,
+    VALIDATE_TWILIO_SIGNATURE,
+)
+from utils.workers import SMSWorkerPool
 
 
 conn = AnswerGenerator()
 
 
-@app.post("/sms")
-async def chat(request: Request) -> dict[str, str]:
+async def answer_sms(*, input_message: str, to: str) -> TwilioResponseMessage:
+    """Generate an answer and send it back; run by the SMS workers."""
+    # set http context
+    init_http_context(user=to)
+    response = await conn.send_sms(input_message=input_message, to=to)
+    if DEBUG:
+        print(f"Question: {input_message}\nAnswer: {response.body}")
+        print(f"Message status: {response.status}, SID: {response.sid}\n")
+    return response
+
+
+sms_workers = SMSWorkerPool(
+    handler=answer_sms,
+    size=SMS_WORKER_POOL_SIZE,
+    max_queue_size=SMS_WORKER_QUEUE_SIZE,
+)
+chainlit_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # chainlit's lifespan force exits the process when it is done,
+    # so our startup and shutdown must happen inside of it
+    async with chainlit_lifespan(app):
+        await conn.astartup()
+        if USE_BACKGROUND_SMS_WORKERS:
+            sms_workers.start()
+        try:
+            yield
+        finally:
+            await sms_workers.aclose(timeout=SMS_WORKER_SHUTDOWN_TIMEOUT)
+            await conn.ashutdown()
+
+
+app.router.lifespan_context = lifespan
+
+
+def is_valid_twilio_request(request: Request, form: dict[str, str]) -> bool:
+    """Check that the SMS webhook was called by Twilio."""
+    if not (form.get("From") and form.get("Body") is not None):
+        return False
+    if VALIDATE_TWILIO_SIGNATURE:
+        validator = RequestValidator(TWILIO_AUTH_TOKEN)
+        return validator.validate(
+            str(request.url),
+            form,
+            request.headers.get("X-Twilio-Signature", "")
+        )
+    return True
+
+
+def twiml_response(message: str | None = None) -> Response:
+    """An (empty by default) TwiML reply to the Twilio webhook."""
+    twiml = MessagingResponse()
+    if message is not None:
+        twiml.message(message)
+    return Response(content=str(twiml), media_type="application/xml")
+
+
+@app.post("/sms", response_model=None)
+async def chat(request: Request) -> dict[str, str] | Response:
     """Respond to incoming text messages with a text message."""
     # receive question in SMS
-    form = await request.form()
+    form = dict(await request.form())
     to = form.get("From")
     question = form.get("Body")
+    if USE_BACKGROUND_SMS_WORKERS:
+        if not is_valid_twilio_request(request, form):
+            return Response(status_code=403)
+        # acknowledge twilio right away, a worker answers the question
+        if not sms_workers.enqueue(input_message=question, to=to):
+            return twiml_response(API_ERROR_MESSAGE)
+        return twiml_response()
     # set http context
     init_http_context(user=to)
     # get answers and send SMS back
@@ -43,6 +126,18 @@ async def chat_query(
     return {"question": question, "answer": answer}
 
 
+@app.get("/health")
+async def health() -> dict[str, list[str]]:
+    """Report the indexes verified at startup."""
+    return {"indexes": [str(status) for status in conn.index_registry.report]}
+
+
+@app.get("/metrics")
+async def metrics() -> dict[str, dict]:
+    """Report runtime metrics of the chatbot."""
+    return {"sms_workers": sms_workers.metrics, **conn.get_metrics()}
+
+
 if LOCAL:
     import chainlit as cl
 
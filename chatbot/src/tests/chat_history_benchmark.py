@@ -0,0 +1,120 @@
+"""Benchmark of chat history reads on long sessions.
+
+Compares the old read path (fetch every document of the session, unsorted
+and unprojected, `json_loads` each message and keep the newest ones) with
+the bounded, projected, index-sorted read of BSON messages done by
+`AsyncChatHistory.aget_messages(limit=...)`.
+
+Run from the `./chatbot/src` directory against a disposable MongoDB:
+
+    BENCHMARK_MONGO_URI=mongodb://localhost:27017 \\
+        python -m tests.chat_history_benchmark --messages 10000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import datetime, timedelta, UTC
+from json import dumps as json_dumps, loads as json_loads
+from os import getenv
+from statistics import mean, median
+from time import perf_counter
+
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from agents.memory.chat_history import AsyncChatHistory
+from agents.memory.indexes import IndexRegistry
+from utils.config import MAX_HISTORY_MESSAGES
+
+MONGO_URI = getenv("BENCHMARK_MONGO_URI", "mongodb://localhost:27017")
+DATABASE_NAME = "chat_history_benchmark"
+SESSION = "+12025550100"
+
+
+def make_messages(n: int) -> list:
+    return [
+        HumanMessage(f"Question {i}: what time does the pool open on day {i}?")
+        if i % 2 == 0 else
+        AIMessage(f"Answer {i}: the pool opens at 7am and closes at 10pm.")
+        for i in range(n)
+    ]
+
+
+async def seed(client: AsyncIOMotorClient, n: int) -> AsyncChatHistory:
+    db = client[DATABASE_NAME]
+    await client.drop_database(DATABASE_NAME)
+    messages = make_messages(n)
+    start = datetime.now(UTC)
+    # the old layout: one collection per session, JSON strings, no sort key
+    await db[SESSION].insert_many([
+        {
+            "SessionId": SESSION,
+            "History": json_dumps(message_to_dict(message)),
+            "created_at": start + timedelta(milliseconds=i),
+        }
+        for i, message in enumerate(messages)
+    ])
+    await db[SESSION].create_index("SessionId")
+    # the new layout: shared collection, BSON messages, compound index
+    history = AsyncChatHistory(
+        client=client,
+        database_name=DATABASE_NAME,
+        collection_name="chat_history",
+        session_id=SESSION,
+    )
+    await history.acreate_index(IndexRegistry())
+    for i in range(0, n, 1000):
+        await history.aadd_messages(messages[i:i + 1000])
+    return history
+
+
+async def old_read(client: AsyncIOMotorClient) -> list:
+    cursor = client[DATABASE_NAME][SESSION].find({"SessionId": SESSION})
+    messages = []
+    async for doc in cursor:
+        messages.append(json_loads(doc["History"]))
+    return messages_from_dict(messages)[-MAX_HISTORY_MESSAGES:]
+
+
+async def time_it(coro_fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        await coro_fn()
+        timings.append(perf_counter() - start)
+    return timings
+
+
+async def main(n: int, repeat: int) -> None:
+    client = AsyncIOMotorClient(MONGO_URI)
+    try:
+        history = await seed(client, n)
+        old = await time_it(lambda: old_read(client), repeat)
+        new = await time_it(
+            lambda: history.aget_messages(limit=MAX_HISTORY_MESSAGES), repeat
+        )
+        assert [m.content for m in await old_read(client)] == [
+            m.content
+            for m in await history.aget_messages(limit=MAX_HISTORY_MESSAGES)
+        ]
+        print(f"{n} messages in the session, newest {MAX_HISTORY_MESSAGES} "
+              f"kept, {repeat} reads each")
+        for name, timings in (("full read", old), ("bounded read", new)):
+            print(f"{name:<14} mean {mean(timings) * 1e3:9.2f} ms   "
+                  f"median {median(timings) * 1e3:9.2f} ms")
+    finally:
+        await client.drop_database(DATABASE_NAME)
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Benchmark chat history reads.")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    run(main(args.messages, args.repeat))
@@ -0,0 +1,130 @@
+"""Benchmark of checkpoint reads per superstep.
+
+Compares the old read path of `AsyncMongoDBSaver.aget_tuple` (a `find` on
+the checkpoint collection, then a second `find` for the pending writes)
+with the single `$lookup` aggregation that reads both in one round-trip.
+Each superstep writes the pending writes of its tasks and a checkpoint,
+then reads the latest checkpoint tuple back, like a resumed graph run does.
+
+Run from the `./chatbot/src` directory against a disposable MongoDB:
+
+    BENCHMARK_MONGO_URI=mongodb://localhost:27017 \\
+        python -m tests.checkpoint_benchmark --steps 200 --writes 4
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from os import getenv
+from statistics import mean, median, quantiles
+from time import perf_counter
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import CheckpointTuple, empty_checkpoint
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from agents.memory.checkpoint import AsyncMongoDBSaver
+from agents.memory.indexes import IndexRegistry
+from utils.config import (
+    CHECKPOINT_INDEX_NAME,
+    TTL_EXPIRE_AFTER_SECONDS,
+    TTL_INDEX_KEY,
+)
+
+MONGO_URI = getenv("BENCHMARK_MONGO_URI", "mongodb://localhost:27017")
+DATABASE_NAME = "checkpoint_benchmark"
+THREAD_CONFIG = {
+    "configurable": {"thread_id": "benchmark_+1202555", "checkpoint_ns": ""}
+}
+
+
+async def old_get_tuple(
+    saver: AsyncMongoDBSaver, config: dict
+) -> CheckpointTuple | None:
+    """The read path before the aggregation: two sequential round-trips."""
+    query = {k: config["configurable"][k] for k in ("thread_id", "checkpoint_ns")}  # noqa: E501
+    cursor = saver.collection.find(query).sort("checkpoint_id", -1).limit(1)
+    async for doc in cursor:
+        config_values = {
+            k: doc[k] for k in ("thread_id", "checkpoint_ns", "checkpoint_id")
+        }
+        pending_writes = [
+            (
+                write["task_id"],
+                write["channel"],
+                saver.serde.loads_typed((write["type"], write["value"])),
+            )
+            async for write in saver.write_collection.find(config_values)
+        ]
+        return CheckpointTuple(
+            config={"configurable": config_values},
+            checkpoint=saver.serde.loads_typed(
+                (doc["type"], doc["checkpoint"])
+            ),
+            metadata=saver.serde.loads(doc["metadata"]),
+            pending_writes=pending_writes,
+        )
+
+
+async def superstep(
+    saver: AsyncMongoDBSaver, config: dict, step: int, n_writes: int
+) -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {
+        "messages": [
+            HumanMessage(f"Question {i}: when does the spa open?")
+            if i % 2 == 0 else
+            AIMessage(f"Answer {i}: the spa opens at 9am.")
+            for i in range(step % 20)
+        ]
+    }
+    config = await saver.aput(config, checkpoint, {"step": step}, {})
+    for task in range(n_writes):
+        await saver.aput_writes(
+            config, [("messages", AIMessage(f"step {step} task {task}"))],
+            task_id=f"task_{task}",
+        )
+    return config
+
+
+async def main(steps: int, n_writes: int) -> None:
+    client = AsyncIOMotorClient(MONGO_URI)
+    try:
+        await client.drop_database(DATABASE_NAME)
+        saver = AsyncMongoDBSaver(
+            client=client,
+            database_name=DATABASE_NAME,
+            collection_name="checkpoints",
+            ttl_index_name=CHECKPOINT_INDEX_NAME,
+            ttl_index_key=TTL_INDEX_KEY,
+            ttl_expire_after_seconds=TTL_EXPIRE_AFTER_SECONDS,
+        )
+        await saver.create_indexes(IndexRegistry())
+        old, new = [], []
+        config = THREAD_CONFIG
+        for step in range(steps):
+            config = await superstep(saver, config, step, n_writes)
+            for get_tuple, timings in (
+                (lambda c: old_get_tuple(saver, c), old),
+                (saver.aget_tuple, new),
+            ):
+                start = perf_counter()
+                result = await get_tuple(THREAD_CONFIG)
+                timings.append(perf_counter() - start)
+                assert len(result.pending_writes) == n_writes
+        print(f"{steps} supersteps, {n_writes} pending writes each")
+        for name, timings in (("find + find", old), ("$lookup", new)):
+            p95 = quantiles(timings, n=20)[-1]
+            print(f"{name:<12} mean {mean(timings) * 1e3:8.2f} ms   "
+                  f"median {median(timings) * 1e3:8.2f} ms   "
+                  f"p95 {p95 * 1e3:8.2f} ms")
+    finally:
+        await client.drop_database(DATABASE_NAME)
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Benchmark checkpoint reads.")
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=4)
+    args = parser.parse_args()
+    run(main(args.steps, args.writes))
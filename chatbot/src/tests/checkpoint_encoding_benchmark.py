@@ -0,0 +1,196 @@
+"""Bytes written per message by the checkpointer, before and after delta and
+compressed checkpoint encoding.
+
+A recorded hotel conversation is replayed through a graph with the
+`PlanExecute` state and the node sequence of the plan-execute workflow
+(process query, retriever, planner, agent entry, agent, tools, agent exit,
+replanner), whose nodes return canned outputs. The checkpoints LangGraph
+creates are then encoded by `AsyncMongoDBSaver` exactly as they would be
+stored, once in the full format and once as zlib-compressed deltas, and
+the BSON size of every document is summed per message.
+
+Run from the `./chatbot/src` directory; no OpenAI or MongoDB connection is
+needed, nothing is written:
+
+    python -m tests.checkpoint_encoding_benchmark --snapshot-interval 10
+"""
+from argparse import ArgumentParser
+from asyncio import run
+
+from bson import encode as bson_encode
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from agents.memory.checkpoint import AsyncMongoDBSaver
+from agents.typing import PlanExecute
+from utils.config import TTL_INDEX_KEY
+
+THREAD_CONFIG = {"configurable": {"thread_id": "benchmark_+1202555"}}
+
+# recorded guest questions, retrieved context and answers
+CONVERSATION = [
+    (
+        "What time does the pool open?",
+        "The rooftop pool is open daily from 7am to 10pm. " * 40,
+        "The rooftop pool opens at 7am and closes at 10pm.",
+    ),
+    (
+        "Is breakfast included in my rate?",
+        "Breakfast is served in the Garden Room from 6:30am to 10:30am. "
+        "It is included in Bed & Breakfast rates only. " * 30,
+        "Breakfast is included with Bed & Breakfast rates.",
+    ),
+    (
+        "Can I get a late checkout tomorrow?",
+        "Late checkout until 2pm can be requested at the front desk, "
+        "subject to availability, for a fee of $30. " * 30,
+        "Late checkout until 2pm is $30, subject to availability.",
+    ),
+    (
+        "Where can I park my car?",
+        "Valet parking is available at the main entrance for $45 per night. "
+        "Self parking is two blocks away on 5th Street. " * 30,
+        "Valet parking is $45 per night at the main entrance.",
+    ),
+    (
+        "Are there any good restaurants nearby?",
+        "Nearby restaurants: Osteria Nonna (Italian, 3 min walk), Sakura "
+        "(sushi, 5 min walk), The Grill House (steaks, 8 min walk). " * 30,
+        "Osteria Nonna, Sakura and The Grill House are a short walk away.",
+    ),
+    (
+        "Does the gym have a sauna?",
+        "The fitness center on level 2 is open 24 hours and has a dry "
+        "sauna and a steam room, free for hotel guests. " * 30,
+        "Yes, the gym on level 2 has a dry sauna and a steam room.",
+    ),
+]
+
+
+def build_graph(turn: int) -> StateGraph:
+    question, context, answer = CONVERSATION[turn]
+    plan = [f"Look up: {question}", "Answer the guest"]
+    nodes = {
+        "process query": lambda state: {"input": question, "error": ""},
+        "retriever": lambda state: {"retrieved_context": context},
+        "planner": lambda state: {"plan": plan},
+        "agent entry": lambda state: {"messages": [HumanMessage(plan[0])]},
+        "agent": lambda state: {
+            "messages": [
+                AIMessage(
+                    "",
+                    tool_calls=[{
+                        "name": "hotel_search",
+                        "args": {"query": question},
+                        "id": f"call_{turn}",
+                    }],
+                )
+            ]
+        },
+        "tools": lambda state: {
+            "messages": [
+                ToolMessage(context[:1000], tool_call_id=f"call_{turn}")
+            ]
+        },
+        "agent exit": lambda state: {
+            "messages": [AIMessage(answer)],
+            "past_steps": [(plan[0], answer)],
+        },
+        "replanner": lambda state: {
+            "response": answer,
+            "chat_history": [
+                *state.get("chat_history", []),
+                HumanMessage(question),
+                AIMessage(answer),
+            ],
+        },
+    }
+    workflow = StateGraph(PlanExecute)
+    previous = START
+    for name, node in nodes.items():
+        workflow.add_node(name, node)
+        workflow.add_edge(previous, name)
+        previous = name
+    workflow.add_edge(previous, END)
+    return workflow
+
+
+async def record() -> list[list[tuple]]:
+    """Replay the conversation and return, per message, the checkpoints
+    and metadata LangGraph created, oldest first."""
+    saver = MemorySaver()
+    turns, seen = [], set()
+    for turn in range(len(CONVERSATION)):
+        graph = build_graph(turn).compile(checkpointer=saver)
+        await graph.ainvoke({"past_steps": None}, THREAD_CONFIG)
+        created = [
+            (t.parent_config, t.checkpoint, t.metadata)
+            async for t in saver.alist(THREAD_CONFIG)
+            if t.checkpoint["id"] not in seen
+        ]
+        seen.update(checkpoint["id"] for _, checkpoint, _ in created)
+        turns.append(created[::-1])
+    return turns
+
+
+def bytes_written(saver: AsyncMongoDBSaver, checkpoints: list[tuple]) -> int:
+    total = 0
+    for parent_config, checkpoint, metadata in checkpoints:
+        config = {
+            "configurable": {
+                **THREAD_CONFIG["configurable"],
+                "checkpoint_ns": "",
+                **(parent_config or {}).get("configurable", {}),
+            }
+        }
+        filter, doc = saver._checkpoint_document(config, checkpoint, metadata)
+        total += len(bson_encode({**filter, **doc}))
+    return total
+
+
+async def main(snapshot_interval: int, compression_level: int) -> None:
+    turns = await record()
+    # the client is only needed to build the savers, nothing is written
+    client = AsyncIOMotorClient(connect=False)
+    kwargs = dict(
+        client=client,
+        database_name="checkpoint_encoding_benchmark",
+        collection_name="checkpoints",
+        ttl_index_key=TTL_INDEX_KEY,
+    )
+    full = AsyncMongoDBSaver(**kwargs)
+    delta = AsyncMongoDBSaver(
+        snapshot_interval=snapshot_interval,
+        compression_level=compression_level,
+        **kwargs
+    )
+    print(f"snapshot every {snapshot_interval} checkpoints, "
+          f"zlib level {compression_level}")
+    print(f"{'message':>7} {'checkpoints':>11} {'full (B)':>10} "
+          f"{'delta+zlib (B)':>15} {'ratio':>6}")
+    totals = [0, 0]
+    for i, checkpoints in enumerate(turns, 1):
+        before = bytes_written(full, checkpoints)
+        after = bytes_written(delta, checkpoints)
+        totals[0] += before
+        totals[1] += after
+        print(f"{i:>7} {len(checkpoints):>11} {before:>10} {after:>15} "
+              f"{after / before:>6.2f}")
+    print(f"{'total':>7} {'':>11} {totals[0]:>10} {totals[1]:>15} "
+          f"{totals[1] / totals[0]:>6.2f}")
+    client.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Measure checkpoint bytes written per message."
+    )
+    parser.add_argument("--snapshot-interval", type=int, default=10)
+    parser.add_argument("--compression-level", type=int, default=6)
+    args = parser.parse_args()
+    run(main(args.snapshot_interval, args.compression_level))
@@ -0,0 +1,204 @@
+"""Storage growth of checkpoints with per-session and shared collections.
+
+Simulates `--sessions` SMS sessions arriving over `--hours` of simulated
+time, each with `--turns` turns that store `--steps` checkpoints and
+`--writes` pending writes per checkpoint, in two layouts:
+
+- per-session: one checkpoint collection per phone number with its own TTL
+  index, and a `{phone number}_writes` collection without one, as the bot
+  stored them before the collections were shared;
+- shared: one checkpoint and one writes collection for all sessions,
+  indexed on (thread_id, checkpoint_ns, checkpoint_id) and both with a TTL
+  index, as `AsyncMongoDBSaver.create_indexes` creates them.
+
+Documents are encoded by `AsyncMongoDBSaver` and stamped with the simulated
+time. The TTL monitor is emulated by deleting expired documents from the
+collections with a TTL index every simulated minute. The collection count,
+document count, data, storage and index sizes are reported per layout.
+
+Run from the `./chatbot/src` directory against a disposable MongoDB:
+
+    BENCHMARK_MONGO_URI=mongodb://localhost:27017 \\
+        python -m tests.checkpoint_storage_benchmark --sessions 50000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import UTC, datetime, timedelta
+from os import getenv
+from time import perf_counter
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from agents.memory.checkpoint import AsyncMongoDBSaver
+from agents.memory.indexes import IndexRegistry
+from utils.config import (
+    CHECKPOINT_COLLECTION_NAME,
+    CHECKPOINT_COMPRESSION_LEVEL,
+    CHECKPOINT_INDEX_NAME,
+    CHECKPOINT_SNAPSHOT_INTERVAL,
+    TTL_EXPIRE_AFTER_SECONDS,
+    TTL_INDEX_KEY,
+)
+
+MONGO_URI = getenv("BENCHMARK_MONGO_URI", "mongodb://localhost:27017")
+DATABASE_NAME = "checkpoint_storage_benchmark"
+TTL_MONITOR_INTERVAL = 60      # seconds, like mongod's TTL monitor
+TURN_INTERVAL = 90             # seconds between the turns of a session
+
+
+def schedule(sessions: int, hours: float, turns: int) -> list[tuple]:
+    """(simulated seconds, session, turn) of every turn, in time order."""
+    spacing = hours * 3600 / sessions
+    return sorted(
+        (i * spacing + turn * TURN_INTERVAL, f"+1202{i:07d}", turn)
+        for i in range(sessions)
+        for turn in range(turns)
+    )
+
+
+def turn_documents(
+    saver: AsyncMongoDBSaver,
+    session: str,
+    turn: int,
+    steps: int,
+    n_writes: int,
+    now: datetime,
+) -> tuple[list[dict], list[dict]]:
+    """The checkpoint and pending write documents one turn stores."""
+    config = {"configurable": {"thread_id": session, "checkpoint_ns": ""}}
+    checkpoints, writes = [], []
+    for step in range(steps):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {
+            "messages": [
+                HumanMessage(f"Question {i}: when does the spa open?")
+                if i % 2 == 0 else
+                AIMessage(f"Answer {i}: the spa opens at 9am.")
+                for i in range(2 * turn + step % 4)
+            ]
+        }
+        filter, doc = saver._checkpoint_document(
+            config, checkpoint, {"step": step}
+        )
+        checkpoints.append({**filter, **doc, TTL_INDEX_KEY: now})
+        config = {"configurable": filter}
+        for task in range(n_writes):
+            for filter, doc in saver._write_documents(
+                config,
+                [("messages", AIMessage(f"step {step} task {task}"))],
+                f"task_{task}",
+            ):
+                writes.append({**filter, **doc, TTL_INDEX_KEY: now})
+    return checkpoints, writes
+
+
+async def simulate(
+    saver: AsyncMongoDBSaver,
+    *,
+    shared: bool,
+    events: list[tuple],
+    steps: int,
+    n_writes: int,
+) -> dict:
+    db = saver.db
+    # simulated time starts now, so that mongod's own TTL monitor does not
+    # delete documents the emulated one would keep
+    start = datetime.now(UTC)
+    if shared:
+        await saver.create_indexes(IndexRegistry())
+    ttl = timedelta(seconds=TTL_EXPIRE_AFTER_SECONDS)
+    # collections with a TTL index that may still hold documents, with the
+    # time they were last written to
+    live: dict[str, datetime] = {}
+    next_sweep = TTL_MONITOR_INTERVAL
+    for seconds, session, turn in events:
+        now = start + timedelta(seconds=seconds)
+        while next_sweep <= seconds:
+            swept_at = start + timedelta(seconds=next_sweep)
+            for name, written_at in list(live.items()):
+                await db[name].delete_many(
+                    {TTL_INDEX_KEY: {"$lt": swept_at - ttl}}
+                )
+                if written_at < swept_at - ttl:
+                    del live[name]
+            next_sweep += TTL_MONITOR_INTERVAL
+        checkpoints, writes = turn_documents(
+            saver, session, turn, steps, n_writes, now
+        )
+        if shared:
+            targets = (saver.collection, saver.write_collection)
+            live.update((c.name, now) for c in targets)
+        else:
+            targets = (db[session], db[f"{session}_writes"])
+            if turn == 0:
+                # the TTL index the old per-session saver created
+                await targets[0].create_index(
+                    TTL_INDEX_KEY,
+                    name=CHECKPOINT_INDEX_NAME,
+                    expireAfterSeconds=TTL_EXPIRE_AFTER_SECONDS,
+                )
+            live[session] = now
+        await targets[0].insert_many(checkpoints, ordered=False)
+        await targets[1].insert_many(writes, ordered=False)
+    return await db.command("dbStats")
+
+
+async def main(
+    sessions: int, hours: float, turns: int, steps: int, n_writes: int
+) -> None:
+    client = AsyncIOMotorClient(MONGO_URI)
+    events = schedule(sessions, hours, turns)
+    print(f"{sessions} sessions over {hours} h, {turns} turns each, "
+          f"{steps} checkpoints and {steps * n_writes} pending writes per "
+          f"turn, TTL {TTL_EXPIRE_AFTER_SECONDS} s")
+    print(f"{'layout':<12} {'collections':>11} {'documents':>10} "
+          f"{'data (MB)':>10} {'storage (MB)':>12} {'indexes':>8} "
+          f"{'index (MB)':>10} {'time (s)':>9}")
+    try:
+        for shared in (False, True):
+            database_name = f"{DATABASE_NAME}_{'shared' if shared else 'per_session'}"  # noqa: E501
+            await client.drop_database(database_name)
+            saver = AsyncMongoDBSaver(
+                client=client,
+                database_name=database_name,
+                collection_name=CHECKPOINT_COLLECTION_NAME,
+                ttl_index_name=CHECKPOINT_INDEX_NAME,
+                ttl_index_key=TTL_INDEX_KEY,
+                ttl_expire_after_seconds=TTL_EXPIRE_AFTER_SECONDS,
+                snapshot_interval=CHECKPOINT_SNAPSHOT_INTERVAL,
+                compression_level=CHECKPOINT_COMPRESSION_LEVEL,
+            )
+            started = perf_counter()
+            stats = await simulate(
+                saver,
+                shared=shared,
+                events=events,
+                steps=steps,
+                n_writes=n_writes,
+            )
+            elapsed = perf_counter() - started
+            print(f"{'shared' if shared else 'per-session':<12} "
+                  f"{stats['collections']:>11} {stats['objects']:>10} "
+                  f"{stats['dataSize'] / 2**20:>10.1f} "
+                  f"{stats['storageSize'] / 2**20:>12.1f} "
+                  f"{stats['indexes']:>8} "
+                  f"{stats['indexSize'] / 2**20:>10.1f} {elapsed:>9.1f}")
+            await client.drop_database(database_name)
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Compare checkpoint storage growth per collection layout."
+    )
+    parser.add_argument("--sessions", type=int, default=50_000)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=2)
+    args = parser.parse_args()
+    run(main(args.sessions, args.hours, args.turns, args.steps, args.writes))
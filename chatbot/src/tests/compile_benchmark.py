@@ -0,0 +1,75 @@
+"""Micro-benchmark of the per-request overhead of compiling the LangGraph
+workflow on every message versus reusing a graph compiled at startup.
+
+Run from the `./chatbot/src` directory:
+
+    python -m tests.compile_benchmark
+
+No OpenAI or MongoDB connection is needed; the graph is only compiled and
+configured, never invoked. An in-memory checkpointer stands in for
+AsyncMongoDBSaver so that only the graph-building cost is measured.
+"""
+from os import environ
+from statistics import mean, quantiles
+from time import perf_counter
+
+# the agents only read these when they are instantiated
+environ.setdefault("OPENAI_API_KEY", "benchmark")
+environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from langchain_core.embeddings import FakeEmbeddings  # noqa: E402
+from langchain_core.vectorstores import InMemoryVectorStore  # noqa: E402
+
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from agents.main_agent import MainAgent, MainAgentUsingO1  # noqa: E402
+from utils.config import RECURSION_LIMIT, USE_PLAN_EXECUTE  # noqa: E402
+
+N_REQUESTS = 200
+
+
+def get_config(session: str) -> dict:
+    return {
+        "recursion_limit": RECURSION_LIMIT,
+        "configurable": {
+            "thread_id": f"benchmark_{session}",
+            "agent_forget_short_memory": True
+        },
+    }
+
+
+def report(name: str, timings: list[float]) -> None:
+    p50, p95 = (quantiles(timings, n=100)[i] for i in (49, 94))
+    print(
+        f"{name:<24} mean {mean(timings) * 1e3:8.3f} ms   "
+        f"p50 {p50 * 1e3:8.3f} ms   p95 {p95 * 1e3:8.3f} ms"
+    )
+
+
+def main() -> None:
+    vector_store = InMemoryVectorStore(embedding=FakeEmbeddings(size=8))
+    agent_class = MainAgent if USE_PLAN_EXECUTE else MainAgentUsingO1
+    agent = agent_class(vector_store=vector_store, checkpointer=MemorySaver())
+
+    # before: a new checkpointer and a freshly compiled graph per message
+    before = []
+    for i in range(N_REQUESTS):
+        start = perf_counter()
+        executor = agent.compile(checkpointer=MemorySaver())
+        executor.with_config(get_config(str(i)))
+        before.append(perf_counter() - start)
+
+    # after: the graph compiled at startup is reused, only the config changes
+    after = []
+    for i in range(N_REQUESTS):
+        start = perf_counter()
+        agent.executor.with_config(get_config(str(i)))
+        after.append(perf_counter() - start)
+
+    print(f"{agent_class.__name__}, {N_REQUESTS} simulated requests")
+    report("compile per request", before)
+    report("compile once at startup", after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Time to first node of the plan-execute graph, with the relevancy
+classifier and the request router called one after the other and
+concurrently.
+
+`EdgeActions._classify_input_` decides which node runs first. Its two
+structured-output LLM calls are replaced with fakes that sleep for a
+latency drawn from a log-normal distribution (median `--latency` seconds),
+and answer "yes" to the classifier for a `--hotel-share` of the questions.
+Both versions of the entry point see the same latencies and answers.
+
+Run from the `./chatbot/src` directory; no OpenAI connection is needed:
+
+    python -m tests.entry_point_benchmark --questions 500 --latency 0.6
+"""
+from argparse import ArgumentParser
+from asyncio import gather, run, sleep
+from random import Random
+from statistics import mean, median, quantiles
+from time import perf_counter
+
+from agents.plan_executor.edges.actions import EdgeActions
+from agents.typing import ClassifyQuestion, RouteQuestion
+
+
+class FakeChain:
+
+    def __init__(self, schema: type, answers: dict[str, tuple]) -> None:
+        self.schema = schema
+        # question -> (latency, binary score)
+        self.answers = answers
+        self.cancelled = 0
+
+    async def ainvoke(self, state: dict, **kwargs) -> dict:
+        latency, score = self.answers[state["input"]]
+        try:
+            await sleep(latency)
+        except BaseException:
+            self.cancelled += 1
+            raise
+        return {"output": self.schema(binary_score=score), "error": None}
+
+
+async def sequential_classify_input(self: EdgeActions, state, config) -> str:
+    """The entry point before the calls were made concurrent."""
+    output_1 = await self._classifier_llm.ainvoke(
+        state,
+        config=config,
+        stream_mode="value"
+    )
+    response = output_1.pop("output")
+    if isinstance(response, ClassifyQuestion):
+        if response.binary_score == "no":
+            return "answer right away"
+        else:
+            return await self._route_query_(state=state, config=config)
+    else:
+        return "answer right away"
+
+
+async def time_to_first_node(edges: EdgeActions, classify, question: str):
+    start = perf_counter()
+    await classify(edges, {"input": question}, {})
+    return perf_counter() - start
+
+
+async def main(
+    questions: int, latency: float, hotel_share: float, seed: int
+) -> None:
+    rand = Random(seed)
+
+    def draw() -> float:
+        return rand.lognormvariate(0, 0.35) * latency
+
+    classifier, router = {}, {}
+    for i in range(questions):
+        question = f"question {i}"
+        is_hotel = rand.random() < hotel_share
+        classifier[question] = (draw(), "yes" if is_hotel else "no")
+        router[question] = (draw(), "yes" if rand.random() < 0.2 else "no")
+    print(f"{questions} questions, {hotel_share:.0%} about the hotel, "
+          f"median LLM latency {latency * 1e3:.0f} ms")
+    for name, classify in (
+        ("sequential", sequential_classify_input),
+        ("concurrent", EdgeActions._classify_input_),
+    ):
+        # the chains are all the entry point needs of the edges object
+        edges = EdgeActions.__new__(EdgeActions)
+        edges._classifier_llm = FakeChain(ClassifyQuestion, classifier)
+        edges._router = FakeChain(RouteQuestion, router)
+        edges.intent_classifier = None
+        # the questions are independent, so they are timed all at once
+        timings = await gather(*(
+            time_to_first_node(edges, classify, question)
+            for question in classifier
+        ))
+        p50 = median(timings)
+        p95 = quantiles(timings, n=20)[-1]
+        print(f"{name:<11} mean {mean(timings) * 1e3:7.1f} ms   "
+              f"p50 {p50 * 1e3:7.1f} ms   p95 {p95 * 1e3:7.1f} ms   "
+              f"router calls cancelled {edges._router.cancelled}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Measure the time to the first node of the graph."
+    )
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.6)
+    parser.add_argument("--hotel-share", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(main(args.questions, args.latency, args.hotel_share, args.seed))
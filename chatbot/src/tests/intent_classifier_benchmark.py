@@ -0,0 +1,207 @@
+"""Accuracy and latency of the local intent classifier against the LLM
+relevancy classifier and request router.
+
+The labeled examples are read from the `INTENT_EXAMPLES_COLLECTION_NAME`
+collection when `BENCHMARK_MONGO_URI` is set, and taken from a small seed
+set otherwise. They are embedded once, and the classifier is scored with
+`--folds`-fold cross-validation: it is fitted to all folds but one and
+asked to label the questions of the remaining one. Every question is also
+sent to the LLM chains of the graph's entry point.
+
+For each decision the report has
+- the accuracy of the LLM;
+- the share of questions the classifier is confident about (coverage) and
+  its accuracy on them;
+- the accuracy of the hybrid, which asks the LLM about the rest;
+- p50 and p95 latencies of the LLM, of the local prediction and of the
+  hybrid. The local latency leaves out the embedding, as the retriever
+  computes it anyway; the mean embedding latency is reported on its own.
+
+Run from the `./chatbot/src` directory with an OpenAI key:
+
+    python -m tests.intent_classifier_benchmark --folds 5 --min-margin 0.04
+"""
+from argparse import ArgumentParser
+from asyncio import Semaphore, gather, run
+from os import getenv
+from random import Random
+from statistics import mean, median, quantiles
+from time import perf_counter
+
+from langchain_openai import OpenAIEmbeddings
+
+from pymongo import MongoClient
+
+from agents.base import ChatModelWithErrorHandling
+from agents.intent_classifier import TASKS, IntentClassifier
+from agents.plan_executor.edges.base import BaseEdgeChains
+from utils.config import (
+    EMBEDDING_MODEL_NAME,
+    EVALUATOR_MODEL_NAME,
+    EVALUATOR_TEMPERATURE,
+    INTENT_CLASSIFIER_MIN_EXAMPLES,
+    INTENT_EXAMPLES_COLLECTION_NAME,
+)
+
+# (question, relevant, request); request is only labeled for hotel questions
+SEED_EXAMPLES = [
+    ("What time does the pool open?", "yes", "no"),
+    ("Is breakfast included in my room rate?", "yes", "no"),
+    ("When is checkout?", "yes", "no"),
+    ("Do you have a gym?", "yes", "no"),
+    ("What is the wifi password?", "yes", "no"),
+    ("Can you recommend a restaurant nearby?", "yes", "no"),
+    ("How far is the airport from the hotel?", "yes", "no"),
+    ("Is there parking at the hotel and how much is it?", "yes", "no"),
+    ("Can I get a late checkout?", "yes", "no"),
+    ("Where is the closest pharmacy?", "yes", "no"),
+    ("Is the spa open on Sundays?", "yes", "no"),
+    ("What museums are within walking distance?", "yes", "no"),
+    ("Can I get extra towels?", "yes", "yes"),
+    ("Please bring two more pillows to my room.", "yes", "yes"),
+    ("Could I have a toothbrush and toothpaste?", "yes", "yes"),
+    ("I need a phone charger.", "yes", "yes"),
+    ("Can you send up an iron and an ironing board?", "yes", "yes"),
+    ("We need a crib for the baby.", "yes", "yes"),
+    ("Can I get some more shampoo?", "yes", "yes"),
+    ("Could someone bring a blanket?", "yes", "yes"),
+    ("Do you have an umbrella I can borrow?", "yes", "yes"),
+    ("I'd like a hair dryer please.", "yes", "yes"),
+    ("What is the capital of Australia?", "no", None),
+    ("Write me a poem about the sea.", "no", None),
+    ("Who won the world cup in 2018?", "no", None),
+    ("How do I reverse a linked list in Python?", "no", None),
+    ("What is 17 times 23?", "no", None),
+    ("Explain quantum entanglement.", "no", None),
+    ("Can you help me with my math homework?", "no", None),
+    ("What's your favorite movie?", "no", None),
+    ("Translate 'good morning' into Japanese.", "no", None),
+    ("How many moons does Jupiter have?", "no", None),
+    ("Tell me a joke about cats.", "no", None),
+    ("What's the best way to invest in stocks?", "no", None),
+]
+
+
+def load_examples() -> list[dict]:
+    uri = getenv("BENCHMARK_MONGO_URI")
+    if uri is None:
+        return [
+            {"text": text, "relevant": relevant, "request": request}
+            for text, relevant, request in SEED_EXAMPLES
+        ]
+    client = MongoClient(uri)
+    db = client[getenv("BUSINESS_NAME", "").replace(" ", "")]
+    return list(db[INTENT_EXAMPLES_COLLECTION_NAME].find({}, {"_id": 0}))
+
+
+def percentiles(timings: list[float]) -> str:
+    p95 = quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+    return f"p50 {median(timings) * 1e3:8.1f} ms   p95 {p95 * 1e3:8.1f} ms"
+
+
+async def ask_llm(chain, text: str, limit: Semaphore) -> tuple:
+    async with limit:
+        start = perf_counter()
+        output = await chain.ainvoke({"input": text, "chat_history": []})
+        seconds = perf_counter() - start
+    response = output["output"]
+    return getattr(response, "binary_score", None), seconds
+
+
+async def main(folds: int, min_margin: float, concurrency: int, seed: int):
+    examples = load_examples()
+    Random(seed).shuffle(examples)
+    embeddings = OpenAIEmbeddings(
+        disallowed_special=(), model=EMBEDDING_MODEL_NAME
+    )
+    start = perf_counter()
+    vectors = await embeddings.aembed_documents(
+        [example["text"] for example in examples]
+    )
+    embedding_seconds = (perf_counter() - start) / len(examples)
+    for example, vector in zip(examples, vectors):
+        example["embedding"] = vector
+
+    llm = ChatModelWithErrorHandling(
+        model=EVALUATOR_MODEL_NAME, temperature=EVALUATOR_TEMPERATURE
+    )
+    edges = BaseEdgeChains(evaluator_llm=llm)
+    chains = {"relevant": edges._classifier_llm, "request": edges._router}
+    limit = Semaphore(concurrency)
+
+    print(f"{len(examples)} examples, {folds} folds, "
+          f"min margin {min_margin}, embedding model {EMBEDDING_MODEL_NAME}")
+    print(f"mean embedding latency {embedding_seconds * 1e3:.1f} ms "
+          "(batched; shared with the retriever)")
+    for task in TASKS:
+        labeled = [example for example in examples if example.get(task)]
+        llm_results = await gather(*(
+            ask_llm(chains[task], example["text"], limit)
+            for example in labeled
+        ))
+        local_labels, local_timings = [], []
+        for fold in range(folds):
+            test = labeled[fold::folds]
+            train = [
+                example for example in examples
+                if not any(example is other for other in test)
+            ]
+            classifier = IntentClassifier(
+                embed=embeddings.aembed_query,
+                embed_documents=embeddings.aembed_documents,
+                embedding_model=EMBEDDING_MODEL_NAME,
+                min_margin=min_margin,
+                min_examples=INTENT_CLASSIFIER_MIN_EXAMPLES,
+            )
+            classifier.fit(train)
+            for example in test:
+                start = perf_counter()
+                local_labels.append(
+                    classifier.predict(task, example["embedding"])
+                )
+                local_timings.append(perf_counter() - start)
+        # the folds were visited in strides; put the answers back in order
+        order = [i for fold in range(folds) for i in range(fold, len(labeled), folds)]  # noqa: E501
+        local = dict(zip(order, zip(local_labels, local_timings)))
+
+        truth = [example[task] for example in labeled]
+        llm_labels = [label for label, _ in llm_results]
+        llm_timings = [seconds for _, seconds in llm_results]
+        covered = [i for i in range(len(labeled)) if local[i][0] is not None]
+        hybrid_labels = [
+            local[i][0] if local[i][0] is not None else llm_labels[i]
+            for i in range(len(labeled))
+        ]
+        hybrid_timings = [
+            local[i][1] if local[i][0] is not None
+            else local[i][1] + llm_timings[i]
+            for i in range(len(labeled))
+        ]
+
+        def accuracy(labels: list, indices: list[int]) -> float:
+            if not indices:
+                return 0.0
+            return mean(labels[i] == truth[i] for i in indices)
+
+        everything = list(range(len(labeled)))
+        local_accuracy = accuracy([local[i][0] for i in everything], covered)
+        print(f"\n{task} ({len(labeled)} questions)")
+        print(f"  llm      accuracy {accuracy(llm_labels, everything):6.1%}"
+              f"   {percentiles(llm_timings)}")
+        print(f"  local    accuracy {local_accuracy:6.1%}"
+              f"   {percentiles([local[i][1] for i in everything])}"
+              f"   coverage {len(covered) / len(labeled):6.1%}")
+        print(f"  hybrid   accuracy {accuracy(hybrid_labels, everything):6.1%}"  # noqa: E501
+              f"   {percentiles(hybrid_timings)}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Compare the local intent classifier with the LLM."
+    )
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--min-margin", type=float, default=0.04)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(main(args.folds, args.min_margin, args.concurrency, args.seed))
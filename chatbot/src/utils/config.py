@@ -10,9 +10,28 @@ DEBUG = True  # False
 LOCAL = getenv("LOCAL")
 LOCAL_DEBUG = DEBUG and LOCAL
 MAX_GRAPH_EXECUTION_TIME = 25
+USE_ANYTIME_ANSWERS = True                     # answer from partial progress
+ANYTIME_ANSWER_TIME = 3                        # seconds kept of the above
+MIN_LLM_CALL_TIME = 1.5                        # skip optional calls below it
+USE_CONDITIONAL_QUERY_REWRITE = True           # rewrite only if it can help
+PLAN_STEP_TIME = 6                             # agent + replanner round
+MAX_HISTORY_MESSAGES = 20                      # newest messages to fetch
+USE_HISTORY_WRITE_BEHIND = True                # don't wait for history db
+HISTORY_WRITE_BUFFER_MAX_PENDING = 1000        # messages kept in memory
+HISTORY_WRITE_BUFFER_BATCH_SIZE = 100          # flush early at this size
+HISTORY_WRITE_BUFFER_FLUSH_INTERVAL = 0.5      # seconds
+USE_HISTORY_WINDOW_CACHE = True                # keep recent history in memory
+HISTORY_CACHE_MAX_SESSIONS = 10_000
+HISTORY_CACHE_MAX_BYTES = 64 * 1024 * 1024     # 64 MiB
 MAX_TOKENS_AFTER_TRIMMING = 100                # used trim chat history
 OPENAI_CLIENT_TIMEOUT = 5
 RECURSION_LIMIT = 50                           # langgraph recursion limit
+RESUME_TIMED_OUT_RUNS = True                   # continue from last checkpoint
+USE_BACKGROUND_SMS_WORKERS = False             # ack twilio, answer later
+SMS_WORKER_POOL_SIZE = 4
+SMS_WORKER_QUEUE_SIZE = 100
+SMS_WORKER_SHUTDOWN_TIMEOUT = MAX_GRAPH_EXECUTION_TIME + 5
+VALIDATE_TWILIO_SIGNATURE = False
 USE_LEGACY_AGENT = False
 USE_LLAMA_INDEX = False
 USE_PLAN_EXECUTE = False
@@ -20,6 +39,10 @@ WELCOME_PAGE_VALUE = """Welcome to Chattabot!\n
 I'm your personal assistant, ready to answer your questions. I'm still \
 a work-in-progress, but will get better over time the more I learn."""
 TWILIO_ERROR_MESSAGE = """The message was not sent due to an error: {}"""
+USE_CANNED_RESPONSES = True                    # answer greetings without LLM
+GREETING_RESPONSE = """Hello, I am Avvi, your personal assistant. \
+How can I assist you?"""
+THANKS_RESPONSE = """It's my pleasure"""
 
 
 # error handling
@@ -35,10 +58,41 @@ I will connect you to my colleague."""
 
 
 # DB config vars
+CHAT_HISTORY_COLLECTION_NAME = "chat_history"  # shared by all sessions
+CHECKPOINT_COLLECTION_NAME = "checkpoints"     # shared by all sessions
 CHECKPOINT_INDEX_NAME = "for_deletion"
+CHECKPOINT_DURABILITY = "superstep"            # "step", "superstep" or "exit"
+USE_TIERED_CHECKPOINTER = True                 # serve checkpoints from memory
+# "exit" spills in the background; "step" and "superstep" write inline
+TIERED_CHECKPOINT_DURABILITY = "exit"
+CHECKPOINT_CACHE_MAX_THREADS = 1000
+CHECKPOINT_CACHE_MAX_BYTES = 128 * 1024 * 1024  # 128 MiB
+CHECKPOINT_CACHE_MAX_CHECKPOINTS_PER_THREAD = 50
+CHECKPOINT_SNAPSHOT_INTERVAL = 10              # 1 stores all in full
+CHECKPOINT_COMPRESSION_LEVEL = 6               # zlib level, None to disable
 INDEX_NAME = "business_description"
-RUN_EXACT_NEAREST_NEIGHBOR_VECTOR_SEARCH = True
+RUN_EXACT_NEAREST_NEIGHBOR_VECTOR_SEARCH = False  # approximate by default
 RETRIEVER_POST_FILTER_MIN_SIMILARITY_SCORE = 0.60
+USE_SPECULATIVE_RETRIEVAL = True               # search before the rewrite
+SPECULATIVE_RETRIEVAL_MIN_SIMILARITY = 0.90    # reuse it above this cosine
+USE_LOCAL_INTENT_CLASSIFIER = False            # classify without the LLM
+INTENT_EXAMPLES_COLLECTION_NAME = "intent_examples"
+INTENT_CLASSIFIER_MIN_MARGIN = 0.04            # ask the LLM below this
+INTENT_CLASSIFIER_MIN_EXAMPLES = 5             # per label and decision
+CANNED_RESPONSES_COLLECTION_NAME = "canned_responses"  # per-business rules
+USE_ANSWER_CACHE = True                        # reuse grounded answers
+ANSWER_CACHE_COLLECTION_NAME = "answer_cache"
+ANSWER_CACHE_MIN_SIMILARITY = 0.95             # cosine of the questions
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60        # 1 day
+ANSWER_CACHE_MAX_ENTRIES = 1000                # 12 MiB of 3072-d vectors
+ANSWER_CACHE_VERSION_CHECK_INTERVAL = 30       # seconds
+ANSWER_CACHE_MAX_WAIT = 0.2                    # seconds, then a miss
+DOCUMENT_VERSIONS_COLLECTION_NAME = "document_versions"  # set by ingestion
+USE_EMBEDDING_CACHE = True                     # embed a query only once
+EMBEDDING_CACHE_COLLECTION_NAME = "embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = 10_000
+EMBEDDING_CACHE_MAX_BYTES = 64 * 1024 * 1024   # 64 MiB
+EMBEDDING_CACHE_EXPIRE_AFTER_SECONDS = 30 * 24 * 60 * 60   # 30 days
 TTL_INDEX_KEY = "created_at"
 TTL_EXPIRE_AFTER_SECONDS = 180
 
@@ -56,5 +110,7 @@ PLANNER_TEMPERATURE = 0.0
 NODE_ACTION_MODEL_NAME = "gpt-4o-2024-08-06"   # "gpt-4o-mini"
 NODE_ACTION_TEMPERATURE = 0.1
 CHAT_HISTORY_TRIMMER_MODEL_NAME = AGENT_MODEL_NAME
+ANYTIME_ANSWER_MODEL_NAME = "gpt-4o-mini"
+ANYTIME_ANSWER_TEMPERATURE = 0.1
 # TIMEZONE = ZoneInfo("US/Eastern")                # for datetime tool
 TIMEZONE = None
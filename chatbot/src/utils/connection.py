@@ -1,53 +1,117 @@
-from asyncio import create_task, Task, wait_for
+from asyncio import create_task, shield, Task, wait_for
 from datetime import datetime, UTC
+from functools import cached_property
 from os import getenv
-from typing import Callable, Literal, overload
+from time import monotonic
+from typing import Callable, Coroutine, Literal, overload
 
 from langchain_core.messages import (
     AIMessage,
+    BaseMessage,
     HumanMessage,
     trim_messages
 )
 
-from langchain_mongodb import MongoDBAtlasVectorSearch
 # from langchain_mongodb import MongoDBChatMessageHistory
 
 from langchain_openai import OpenAIEmbeddings
 
+from langgraph.constants import START
 from langgraph.pregel import GraphRecursionError
 
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import ConnectionFailure
+
+from openai import OpenAIError
+
+from pymongo.errors import ConnectionFailure, PyMongoError
 from pymongo.mongo_client import MongoClient
 
 from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.rest import Client
 from twilio.rest.api.v2010.account.message import MessageInstance
 
-from agents.base import ChatModelWithErrorHandling
+from agents.answer_cache import SemanticAnswerCache, is_context_free
+from agents.anytime_answer import AnytimeAnswerer
+from agents.base import DEADLINE_KEY, ChatModelWithErrorHandling
+from agents.canned_responses import CannedResponder
+from agents.intent_classifier import IntentClassifier
 from agents.main_agent import MainAgent, MainAgentUsingO1
 from agents.memory.checkpoint import AsyncMongoDBSaver
+from agents.memory.embedding_cache import CachedEmbeddings
 from agents.memory.chat_history import AsyncChatHistory, ChatHistory
+from agents.memory.indexes import IndexRegistry, IndexStatus
+from agents.memory.tiered_checkpoint import TieredMongoDBSaver
+from agents.memory.vector_search import AsyncMongoDBAtlasVectorSearch
+from agents.memory.window_cache import HistoryWindowCache
+from agents.memory.write_behind import ChatHistoryWriteBuffer
+from agents.speculative_retrieval import (
+    SPECULATIVE_RETRIEVAL_KEY,
+    SpeculativeRetrieval,
+)
 from agents.typing import TwilioResponseMessage
 
 from .config import (
+    ANSWER_CACHE_COLLECTION_NAME,
+    ANSWER_CACHE_MAX_WAIT,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_MIN_SIMILARITY,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_VERSION_CHECK_INTERVAL,
+    ANYTIME_ANSWER_TIME,
+    API_ERROR_MESSAGE,
+    CANNED_RESPONSES_COLLECTION_NAME,
+    CHAT_HISTORY_COLLECTION_NAME,
     CHAT_HISTORY_TRIMMER_MODEL_NAME,
+    CHECKPOINT_CACHE_MAX_BYTES,
+    CHECKPOINT_CACHE_MAX_CHECKPOINTS_PER_THREAD,
+    CHECKPOINT_CACHE_MAX_THREADS,
+    CHECKPOINT_COLLECTION_NAME,
+    CHECKPOINT_COMPRESSION_LEVEL,
+    CHECKPOINT_DURABILITY,
     CHECKPOINT_INDEX_NAME,
+    CHECKPOINT_SNAPSHOT_INTERVAL,
     DEBUG,
+    DOCUMENT_VERSIONS_COLLECTION_NAME,
+    EMBEDDING_CACHE_COLLECTION_NAME,
+    EMBEDDING_CACHE_EXPIRE_AFTER_SECONDS,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_CACHE_MAX_ENTRIES,
     EMBEDDING_MODEL_NAME,
+    HISTORY_CACHE_MAX_BYTES,
+    HISTORY_CACHE_MAX_SESSIONS,
+    HISTORY_WRITE_BUFFER_BATCH_SIZE,
+    HISTORY_WRITE_BUFFER_FLUSH_INTERVAL,
+    HISTORY_WRITE_BUFFER_MAX_PENDING,
     INDEX_NAME,
+    INTENT_CLASSIFIER_MIN_EXAMPLES,
+    INTENT_CLASSIFIER_MIN_MARGIN,
+    INTENT_EXAMPLES_COLLECTION_NAME,
     LOCAL,
+    MAX_HISTORY_MESSAGES,
     MAX_TOKENS_AFTER_TRIMMING,
+    OTHER_ERROR_MESSAGE,
     RECURSION_LIMIT,
+    TIERED_CHECKPOINT_DURABILITY,
     TTL_INDEX_KEY,
     TTL_EXPIRE_AFTER_SECONDS,
     MAX_GRAPH_EXECUTION_TIME as MAX_EXECUTION_TIME,
     RESPONSE_AT_MAX_EXECUTION_TIME,
     RESPONSE_AT_RECURSION_ERROR,
+    RESUME_TIMED_OUT_RUNS,
+    TIMEOUT_ERROR_MESSAGE,
     TWILIO_ERROR_MESSAGE,
+    USE_ANSWER_CACHE,
+    USE_ANYTIME_ANSWERS,
+    USE_CANNED_RESPONSES,
+    USE_EMBEDDING_CACHE,
+    USE_HISTORY_WINDOW_CACHE,
+    USE_HISTORY_WRITE_BEHIND,
     USE_LEGACY_AGENT,
     USE_LLAMA_INDEX,
-    USE_PLAN_EXECUTE
+    USE_LOCAL_INTENT_CLASSIFIER,
+    USE_PLAN_EXECUTE,
+    USE_SPECULATIVE_RETRIEVAL,
+    USE_TIERED_CHECKPOINTER,
 )
 
 
@@ -63,6 +127,14 @@ SHORT_TERM_MEMORY_URI = getenv("SHORT_TERM_MEMORY_URI")
 TWILIO_ACCOUNT_SID = getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = getenv("TWILIO_AUTH_TOKEN")
 TWILIO_FROM_PHONE = getenv("TWILIO_PHONE")
+# what the graph answers with when a call failed or the run was cut short
+UNCACHEABLE_ANSWERS = frozenset({
+    API_ERROR_MESSAGE,
+    OTHER_ERROR_MESSAGE,
+    RESPONSE_AT_MAX_EXECUTION_TIME,
+    RESPONSE_AT_RECURSION_ERROR,
+    TIMEOUT_ERROR_MESSAGE,
+})
 
 
 class MongoDBConnection:
@@ -91,8 +163,12 @@ class MongoDBConnection:
         self.vector_store_client = self.init_connection(
             MONGO_GROUND_TRUTH_URI, name="vector store"
         )
+        self.async_vector_store_client = self.ainit_connection(
+            MONGO_GROUND_TRUTH_URI, name="async vector store"
+        )
         if "Connection Error" in (
             self.vector_store_client,
+            self.async_vector_store_client,
             self.chat_history_client,
             self.checkpoint_client
         ):
@@ -101,6 +177,18 @@ class MongoDBConnection:
             model=CHAT_HISTORY_TRIMMER_MODEL_NAME
         )
         self.vector_store = self.get_vector_store()
+        self.index_registry = IndexRegistry()
+        self.history_write_buffer = ChatHistoryWriteBuffer(
+            max_pending=HISTORY_WRITE_BUFFER_MAX_PENDING,
+            max_batch_size=HISTORY_WRITE_BUFFER_BATCH_SIZE,
+            flush_interval=HISTORY_WRITE_BUFFER_FLUSH_INTERVAL,
+        ) if USE_HISTORY_WRITE_BEHIND else None
+        self.history_cache = HistoryWindowCache(
+            max_sessions=HISTORY_CACHE_MAX_SESSIONS,
+            max_bytes=HISTORY_CACHE_MAX_BYTES,
+            max_messages=MAX_HISTORY_MESSAGES,
+        ) if USE_HISTORY_WINDOW_CACHE else None
+        self._background_tasks: set[Task] = set()
         super().__init__()
 
     @overload
@@ -122,9 +210,20 @@ class MongoDBConnection:
         history = AsyncChatHistory(
             client=self.chat_history_client,
             database_name=self.db_name,
-            collection_name=session,
+            collection_name=CHAT_HISTORY_COLLECTION_NAME,
             session_id=session,
+            token_counter=self.count_tokens,
+            write_buffer=self.history_write_buffer,
+            window_cache=self.history_cache,
         )
+        if not self.index_registry.is_known(
+            history.collection, history.index_name
+        ):
+            # the startup bootstrap did not run or failed;
+            # index the collection without blocking the answer
+            self.run_in_background(
+                history.acreate_index(self.index_registry)
+            )
         if question == "Delete chat history.":
             await history.aclear()
             return "Chat history deleted."
@@ -177,7 +276,7 @@ class MongoDBConnection:
         history = ChatHistory(
             client=self.chat_history_client,
             database_name=self.db_name,
-            collection_name=session,
+            collection_name=CHAT_HISTORY_COLLECTION_NAME,
             session_id=session,
         )
         if question == "Delete chat history.":
@@ -189,19 +288,62 @@ class MongoDBConnection:
     def get_checkpointer(
         self,
         *,
-        collection_name: str | None = None
+        collection_name: str = CHECKPOINT_COLLECTION_NAME
     ) -> AsyncMongoDBSaver:
-        checkpointer = AsyncMongoDBSaver(
+        kwargs = dict(
             client=self.checkpoint_client,
             database_name=self.db_name,
             collection_name=collection_name,
             ttl_index_name=CHECKPOINT_INDEX_NAME,
             ttl_index_key=TTL_INDEX_KEY,
             ttl_expire_after_seconds=TTL_EXPIRE_AFTER_SECONDS,
+            snapshot_interval=CHECKPOINT_SNAPSHOT_INTERVAL,
+            compression_level=CHECKPOINT_COMPRESSION_LEVEL,
         )
+        if USE_TIERED_CHECKPOINTER:
+            checkpointer = TieredMongoDBSaver(
+                max_threads=CHECKPOINT_CACHE_MAX_THREADS,
+                max_bytes=CHECKPOINT_CACHE_MAX_BYTES,
+                max_checkpoints_per_thread=CHECKPOINT_CACHE_MAX_CHECKPOINTS_PER_THREAD,  # noqa: E501
+                durability=TIERED_CHECKPOINT_DURABILITY,
+                **kwargs
+            )
+        else:
+            checkpointer = AsyncMongoDBSaver(
+                durability=CHECKPOINT_DURABILITY, **kwargs
+            )
         return checkpointer
 
-    def get_vector_store(self) -> MongoDBAtlasVectorSearch:
+    def count_tokens(self, message: BaseMessage) -> int:
+        """Number of tokens a message adds to a prompt of the trimmer LLM."""
+        return (
+            self.trimmer_llm.get_num_tokens_from_messages([message])
+            - self._prompt_overhead_tokens
+        )
+
+    @cached_property
+    def _prompt_overhead_tokens(self) -> int:
+        # tokens counted once per prompt rather than per message
+        return self.trimmer_llm.get_num_tokens_from_messages([])
+
+    async def create_indexes(self) -> list[IndexStatus]:
+        """Create every TTL and session index once, at startup."""
+        report = await self.get_checkpointer().create_indexes(
+            self.index_registry
+        )
+        history = AsyncChatHistory(
+            client=self.chat_history_client,
+            database_name=self.db_name,
+            collection_name=CHAT_HISTORY_COLLECTION_NAME,
+            session_id="",
+        )
+        report.append(await history.acreate_index(self.index_registry))
+        embeddings = getattr(self.vector_store, "embeddings", None)
+        if isinstance(embeddings, CachedEmbeddings):
+            report.append(await embeddings.acreate_index(self.index_registry))
+        return report
+
+    def get_vector_store(self) -> AsyncMongoDBAtlasVectorSearch:
         if USE_LLAMA_INDEX:
             # Instantiate the vector store
             atlas_vector_store = MongoDBAtlasVectorSearch(
@@ -217,13 +359,30 @@ class MongoDBConnection:
         # connect to mongodb collection
         db = self.vector_store_client[self.db_name]
         collection = db[BUSINESS_NAME]
-        # get vector store
-        vector_store = MongoDBAtlasVectorSearch(
+        embeddings = OpenAIEmbeddings(
+            disallowed_special=(),
+            model=EMBEDDING_MODEL_NAME
+        )
+        if USE_EMBEDDING_CACHE:
+            # repeated questions are embedded only once
+            embeddings = CachedEmbeddings(
+                embeddings,
+                model=EMBEDDING_MODEL_NAME,
+                collection=db[EMBEDDING_CACHE_COLLECTION_NAME],
+                acollection=self.async_vector_store_client[self.db_name][
+                    EMBEDDING_CACHE_COLLECTION_NAME
+                ],
+                max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+                expire_after_seconds=EMBEDDING_CACHE_EXPIRE_AFTER_SECONDS,
+            )
+        # get vector store; its async searches run on motor
+        vector_store = AsyncMongoDBAtlasVectorSearch(
             collection=collection,
-            embedding=OpenAIEmbeddings(
-                disallowed_special=(),
-                model=EMBEDDING_MODEL_NAME
-            ),
+            acollection=self.async_vector_store_client[self.db_name][
+                BUSINESS_NAME
+            ],
+            embedding=embeddings,
             index_name=INDEX_NAME,
             relevance_score_fn="cosine",
         )
@@ -250,15 +409,135 @@ class MongoDBConnection:
             return "Connection Error"
         return client
 
+    def run_in_background(self, coro: Coroutine) -> Task:
+        """Schedule a coroutine off the request path, keeping a reference
+        to the task until it is done."""
+        task = create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
 
 class AnswerGenerator(MongoDBConnection):
 
     def __init__(self) -> None:
         super().__init__()
+        # a single long-lived checkpointer and a graph compiled only once;
+        # sessions are kept apart by the thread_id in the config
+        self.checkpointer = self.get_checkpointer()
         if USE_PLAN_EXECUTE:
-            self.agent = MainAgent(vector_store=self.vector_store)
+            self.agent = MainAgent(
+                vector_store=self.vector_store,
+                checkpointer=self.checkpointer
+            )
         else:
-            self.agent = MainAgentUsingO1(vector_store=self.vector_store)
+            self.agent = MainAgentUsingO1(
+                vector_store=self.vector_store,
+                checkpointer=self.checkpointer
+            )
+        self.anytime_answerer = (
+            AnytimeAnswerer() if USE_ANYTIME_ANSWERS else None
+        )
+        self.canned_responder = (
+            CannedResponder() if USE_CANNED_RESPONSES else None
+        )
+        self.intent_classifier = IntentClassifier(
+            embed=self.vector_store.embeddings.aembed_query,
+            embed_documents=self.vector_store.embeddings.aembed_documents,
+            embedding_model=EMBEDDING_MODEL_NAME,
+            min_margin=INTENT_CLASSIFIER_MIN_MARGIN,
+            min_examples=INTENT_CLASSIFIER_MIN_EXAMPLES,
+        ) if (
+            USE_LOCAL_INTENT_CLASSIFIER
+            and not USE_LEGACY_AGENT
+            and not USE_LLAMA_INDEX
+        ) else None
+        business_db = self.async_vector_store_client[self.db_name]
+        self.answer_cache = SemanticAnswerCache(
+            collection=business_db[ANSWER_CACHE_COLLECTION_NAME],
+            versions=business_db[DOCUMENT_VERSIONS_COLLECTION_NAME],
+            document=BUSINESS_NAME,
+            min_similarity=ANSWER_CACHE_MIN_SIMILARITY,
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+            max_entries=ANSWER_CACHE_MAX_ENTRIES,
+            version_check_interval=ANSWER_CACHE_VERSION_CHECK_INTERVAL,
+        ) if (
+            USE_ANSWER_CACHE
+            and not USE_LEGACY_AGENT
+            and not USE_LLAMA_INDEX
+        ) else None
+
+    async def astartup(self) -> list[IndexStatus]:
+        """One-time startup stage that runs inside the server's event loop:
+        bootstraps the indexes and prints a health report."""
+        report = await self.create_indexes()
+        if self.answer_cache is not None:
+            report.append(
+                await self.answer_cache.acreate_index(self.index_registry)
+            )
+        if DEBUG:
+            print("============ INDEX HEALTH REPORT ============")
+            print(*report, sep="\n")
+        if self.answer_cache is not None:
+            try:
+                entries = await self.answer_cache.aload()
+                if DEBUG:
+                    print(f"Loaded {entries} cached answers.")
+            except PyMongoError as e:
+                # questions are answered without the cache
+                print(f"Answer cache load failed: {e}")
+                self.answer_cache = None
+        if self.canned_responder is not None:
+            try:
+                rules = await self.canned_responder.aload(
+                    self.async_vector_store_client[self.db_name][CANNED_RESPONSES_COLLECTION_NAME]  # noqa: E501
+                )
+                if DEBUG:
+                    print(f"Loaded {rules} canned response rules.")
+            except PyMongoError as e:
+                # the default rules still apply
+                print(f"Canned response rules read failed: {e}")
+        if self.intent_classifier is not None:
+            try:
+                examples = await self.intent_classifier.aload(
+                    self.async_vector_store_client[self.db_name][INTENT_EXAMPLES_COLLECTION_NAME]  # noqa: E501
+                )
+                # handed to the graph only once it has its centroids
+                self.agent.intent_classifier = self.intent_classifier
+                if DEBUG:
+                    print(f"Loaded {examples} intent classifier examples.")
+            except (OpenAIError, PyMongoError) as e:
+                # the graph keeps asking the LLM
+                print(f"Intent classifier load failed: {e}")
+                self.intent_classifier = None
+        return report
+
+    async def ashutdown(self) -> None:
+        """Write out everything still buffered before the server exits."""
+        await self.checkpointer.aflush()
+        if self.history_write_buffer is not None:
+            await self.history_write_buffer.aclose()
+
+    def get_metrics(self) -> dict[str, dict]:
+        metrics = {}
+        if self.history_write_buffer is not None:
+            metrics["chat_history_writes"] = self.history_write_buffer.metrics
+        if self.history_cache is not None:
+            metrics["chat_history_cache"] = self.history_cache.metrics
+        if isinstance(self.checkpointer, TieredMongoDBSaver):
+            metrics["checkpoint_cache"] = self.checkpointer.metrics
+        if self.agent.query_rewrite_gate is not None:
+            metrics["query_rewrite"] = self.agent.query_rewrite_gate.metrics
+        embeddings = getattr(self.vector_store, "embeddings", None)
+        if isinstance(embeddings, CachedEmbeddings):
+            metrics["embedding_cache"] = embeddings.metrics
+        if self.answer_cache is not None:
+            metrics["answer_cache"] = self.answer_cache.metrics
+        if self.canned_responder is not None:
+            metrics["canned_responses"] = self.canned_responder.metrics
+        if self.intent_classifier is not None:
+            metrics["intent_classifier"] = self.intent_classifier.metrics
+        return metrics
 
     async def create_answer(self, *, question: str, session: str) -> str:
         """
@@ -266,6 +545,14 @@ class AnswerGenerator(MongoDBConnection):
         - previous chat history
         - a new question
         """
+        if self.canned_responder is not None:
+            answer = self.canned_responder.match(question)
+            if answer is not None:
+                # nothing to look up; the exchange is only recorded
+                await self.arecord_canned_answer(
+                    question=question, answer=answer, session=session
+                )
+                return answer
         history = await self.aget_chat_history(
             question=question, session=session
         )
@@ -273,41 +560,254 @@ class AnswerGenerator(MongoDBConnection):
         # this means history is just chat history deleted
         if isinstance(history, str):
             return history
+        # search the documents for the question as it arrived while the
+        # graph classifies and rewrites it
+        speculation = self.agent.speculate_retrieval(question) if (
+            USE_SPECULATIVE_RETRIEVAL
+            and not USE_LEGACY_AGENT
+            and not USE_LLAMA_INDEX
+        ) else None
         # construct the agent and generate answer
-        messages = await history.aget_messages()
+        # the history is trimmed as it is read, using cached token counts
+        messages = await history.aget_messages(
+            limit=MAX_HISTORY_MESSAGES,
+            max_tokens=MAX_TOKENS_AFTER_TRIMMING
+        )
         # messages = history.messages
-        if USE_LEGACY_AGENT:
+        cached_answer = embedding_task = None
+        if self.answer_cache is not None and is_context_free(
+            question, messages
+        ):
+            # the answer is cached under the embedding, so it is computed
+            # to the end even when the lookup stops waiting for it
+            embedding_task = self.run_in_background(self.aembed_question(
+                question=question, speculation=speculation
+            ))
+            cached_answer = await self.alookup_answer(embedding_task)
+            # what the graph answers is cached for the version looked up
+            version = self.answer_cache.version
+        if cached_answer is not None:
+            if speculation is not None:
+                speculation.cancel()
+            result = {"response": cached_answer}
+            answer = cached_answer
+        elif USE_LEGACY_AGENT:
             result = await self.agent.executor.ainvoke(
                 {"input": question, "chat_history": messages},
                 stream_mode="values"
             )
             answer = result["output"]
         else:
+            deadline = monotonic() + MAX_EXECUTION_TIME
+            # the state values this run produced, kept up to date while it
+            # runs so that an answer can be made of them if it is cut short
+            progress = {}
+            resume = RESUME_TIMED_OUT_RUNS and await self.ais_resumable(
+                question=question, session=session
+            )
+            if resume and speculation is not None:
+                # the run may be past its retrieval already
+                speculation.cancel()
+                speculation = None
+            # the graph has to finish early enough to leave time for an
+            # anytime answer
+            graph_deadline = deadline - (
+                ANYTIME_ANSWER_TIME if USE_ANYTIME_ANSWERS else 0
+            )
             try:
                 task = self.create_executor_task(
                     question=question,
                     chat_history=messages,
                     session=session,
+                    trim_history=None,
+                    resume=resume,
+                    progress=progress,
+                    deadline=graph_deadline,
+                    speculation=speculation,
                 )
-                result = await wait_for(task, timeout=MAX_EXECUTION_TIME)
+                result = await wait_for(
+                    task, timeout=graph_deadline - monotonic()
+                )
+                if result.get("response") is None:
+                    # the graph ran out of time for another plan step
+                    result = await self.aget_anytime_result(
+                        question=question,
+                        progress=progress,
+                        deadline=deadline,
+                        fallback=RESPONSE_AT_MAX_EXECUTION_TIME,
+                    )
+                elif (
+                    embedding_task is not None
+                    and embedding_task.done()
+                    # it waits for the speculation, which may be cancelled
+                    and not embedding_task.cancelled()
+                    and (embedding := embedding_task.result()) is not None
+                    and self.is_cacheable(result, progress)
+                ):
+                    self.run_in_background(self.answer_cache.aadd(
+                        question,
+                        embedding,
+                        result["response"],
+                        version=version,
+                    ))
             except TimeoutError:
                 # we need to aput to the _writes collection
                 # even when there is an error
-                result = {"response": RESPONSE_AT_MAX_EXECUTION_TIME}
+                result = await self.aget_anytime_result(
+                    question=question,
+                    progress=progress,
+                    deadline=deadline,
+                    fallback=RESPONSE_AT_MAX_EXECUTION_TIME,
+                )
             except GraphRecursionError:
                 # we need to aput to the _writes collection
                 # even when there is an error
-                result = {"response": RESPONSE_AT_RECURSION_ERROR}
+                result = await self.aget_anytime_result(
+                    question=question,
+                    progress=progress,
+                    deadline=deadline,
+                    fallback=RESPONSE_AT_RECURSION_ERROR,
+                )
+            finally:
+                if speculation is not None:
+                    speculation.cancel()
+                # commit what the checkpointer buffered during the run,
+                # also when it was cut short
+                try:
+                    await self.checkpointer.aflush(
+                        self.get_thread_config(session)
+                    )
+                except PyMongoError as e:
+                    print(f"Checkpoint flush failed: {e}")
             answer = result["response"]
         # print the result to console
         if DEBUG:
             print(f"=============== APP RESULT ==============\n{result}\n")
-        # add the most recent message exchange to db
+        # add the most recent message exchange to db; with the write-behind
+        # buffer this only queues it and the answer goes out right away
         await history.aadd_messages(
             [HumanMessage(content=question), AIMessage(content=answer)]
         )
         return answer
 
+    def is_cacheable(self, result: dict, progress: dict) -> bool:
+        """Whether the answer of a completed run can be cached: it was made
+        from the business document, as only such answers are invalidated
+        with it, and it is not an error message."""
+        response = result.get("response")
+        return (
+            bool(progress.get("retrieved_context"))
+            and not result.get("error")
+            and isinstance(response, str)
+            and response not in UNCACHEABLE_ANSWERS
+        )
+
+    async def aembed_question(
+        self,
+        *,
+        question: str,
+        speculation: SpeculativeRetrieval | None
+    ) -> list[float] | None:
+        """The embedding of the question, from the speculative retrieval
+        when there is one."""
+        try:
+            if speculation is not None:
+                return await speculation.aget_embedding()
+            return await self.vector_store.embeddings.aembed_query(question)
+        except OpenAIError as e:
+            print(f"Question embedding failed: {e}")
+            return None
+
+    async def alookup_answer(
+        self, embedding_task: Task
+    ) -> str | None:
+        """The cached answer to the question, if there is one. The graph
+        waits at most ANSWER_CACHE_MAX_WAIT seconds for the embedding of
+        the question, then counts the lookup as a miss."""
+        try:
+            embedding = await wait_for(
+                shield(embedding_task), timeout=ANSWER_CACHE_MAX_WAIT
+            )
+        except TimeoutError:
+            return None
+        if embedding is None:
+            return None
+        try:
+            return await self.answer_cache.alookup(embedding)
+        except PyMongoError as e:
+            print(f"Answer cache lookup failed: {e}")
+            return None
+
+    async def arecord_canned_answer(
+        self, *, question: str, answer: str, session: str
+    ) -> None:
+        """Add an exchange answered without the graph to the chat history,
+        off the request path."""
+        history = await self.aget_chat_history(
+            question=question, session=session
+        )
+        coro = history.aadd_messages(
+            [HumanMessage(content=question), AIMessage(content=answer)]
+        )
+        if self.history_write_buffer is not None:
+            # the buffer only queues the messages
+            await coro
+        else:
+            self.run_in_background(coro)
+
+    async def aget_anytime_result(
+        self,
+        *,
+        question: str,
+        progress: dict,
+        deadline: float,
+        fallback: str,
+    ) -> dict:
+        """The result of a run that was cut short: an answer made of the
+        progress it made, within the time left until the deadline, or the
+        fallback message."""
+        answer = None
+        if self.anytime_answerer is not None:
+            answer = await self.anytime_answerer.ainvoke(
+                question=question,
+                progress=progress,
+                timeout=max(deadline - monotonic(), 0),
+            )
+        return {**progress, "response": answer or fallback}
+
+    def get_thread_config(self, session: str) -> dict:
+        return {"configurable": {"thread_id": f"{BUSINESS_NAME}_{session}"}}
+
+    async def ais_resumable(self, *, question: str, session: str) -> bool:
+        """Whether the last run of the session was cut short while answering
+        the same question, so that it can continue from its last checkpoint
+        instead of starting over. Checkpoints expire after the TTL, and so
+        does the chance to resume. A run is not resumed once its steps,
+        over all attempts, reach the recursion limit."""
+        config = self.get_thread_config(session)
+        try:
+            state = await self.agent.executor.aget_state(config)
+            if not state.next:
+                return False
+            latest_step = state.metadata["step"]
+            # walk back to the checkpoint the question was put in with,
+            # reading only the metadata of the checkpoints on the way
+            async for checkpoint in self.checkpointer.alist(
+                config, limit=RECURSION_LIMIT + 1, lazy=True
+            ):
+                metadata = checkpoint.metadata
+                if metadata.get("source") != "input":
+                    continue
+                writes = (metadata.get("writes") or {}).get(START) or {}
+                asked = writes.get("input") or ""
+                return (
+                    latest_step - metadata["step"] < RECURSION_LIMIT
+                    and asked.strip().casefold() == question.strip().casefold()
+                )
+        except PyMongoError as e:
+            print(f"Checkpoint read failed: {e}")
+        return False
+
     def create_executor_task(
         self,
         *,
@@ -315,6 +815,10 @@ class AnswerGenerator(MongoDBConnection):
         chat_history: list[dict],
         session: str,
         trim_history: int | Callable | None = trim_messages,
+        resume: bool = False,
+        progress: dict | None = None,
+        deadline: float | None = None,
+        speculation: SpeculativeRetrieval | None = None,
     ) -> Task:
         if isinstance(trim_history, Callable):
             trimmed_chat_history = trim_history(
@@ -329,24 +833,54 @@ class AnswerGenerator(MongoDBConnection):
             trimmed_chat_history = chat_history[-trim_history:]
         else:
             trimmed_chat_history = chat_history
-        checkpointer = self.get_checkpointer(collection_name=session)
+        # without input, the graph continues from the last checkpoint of the
+        # thread
+        inputs = None if resume else {
+            "input": question, "chat_history": trimmed_chat_history
+        }
         task = create_task(
-            self.agent
-            .compile(checkpointer=checkpointer)
-            .ainvoke(
-                {"input": question, "chat_history": trimmed_chat_history},
+            self._arun_executor(
+                inputs,
                 config={
                     "recursion_limit": RECURSION_LIMIT,
                     "configurable": {
-                        "thread_id": f"{BUSINESS_NAME}_{session}",
-                        "agent_forget_short_memory": True
+                        **self.get_thread_config(session)["configurable"],
+                        "agent_forget_short_memory": True,
+                        # nodes and LLM calls fit into the time left
+                        DEADLINE_KEY: deadline,
+                        SPECULATIVE_RETRIEVAL_KEY: speculation,
                     },
                 },
-                stream_mode="values"
+                progress=progress,
             )
         )
         return task
 
+    async def _arun_executor(
+        self,
+        inputs: dict | None,
+        *,
+        config: dict,
+        progress: dict | None = None,
+    ) -> dict:
+        """Run the executor like `ainvoke` with the "values" stream mode
+        does, and keep the state values the run changed in `progress`."""
+        state = baseline = None
+        async for state in self.agent.executor.astream(
+            inputs, config=config, stream_mode="values"
+        ):
+            if baseline is None:
+                # values left over from the previous turns of the thread
+                # are no progress, unless the run resumes this question
+                baseline = {} if inputs is None else state
+            if progress is not None:
+                progress.clear()
+                progress.update(
+                    (key, value) for key, value in state.items()
+                    if baseline.get(key) != value
+                )
+        return state
+
     # def get_agent_executor(
     #     self,
     #     *,
@@ -0,0 +1,111 @@
+##############################################################################
+##############################################################################
+# ###### ONE-OFF SCRIPT TO MERGE PER-SESSION CHAT HISTORY COLLECTIONS ###### #
+##############################################################################
+##############################################################################
+
+# Chat history used to be stored in one collection per phone number. This
+# script streams every such collection into the shared chat history
+# collection in batches and drops the old collection once it is copied.
+# Documents keep their _id, so the script can be re-run safely after an
+# interruption.
+#
+# Run from the `./chatbot/src` directory:
+#     python -m utils.migrate_chat_history [--batch-size 1000] [--keep-source]
+
+from argparse import ArgumentParser
+from os import getenv
+
+from dotenv import load_dotenv
+
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
+from pymongo.mongo_client import MongoClient
+
+from .config import CHAT_HISTORY_COLLECTION_NAME
+
+load_dotenv()
+
+DATABASE_NAME = getenv("BUSINESS_NAME", "").replace(" ", "")
+MONGO_URI = getenv("CHAT_HISTORY_MONGO_URI")
+SESSION_ID_KEY = "SessionId"
+HISTORY_KEY = "History"
+CREATED_AT_KEY = "created_at"
+DUPLICATE_KEY_ERROR = 11000
+
+
+def is_session_collection(db: Database, name: str) -> bool:
+    """A per-session chat history collection holds documents with both
+    the session id and the history keys."""
+    if name == CHAT_HISTORY_COLLECTION_NAME or name.startswith("system."):
+        return False
+    doc = db[name].find_one(
+        {SESSION_ID_KEY: {"$exists": True}, HISTORY_KEY: {"$exists": True}},
+        projection={"_id": 1}
+    )
+    return doc is not None
+
+
+def insert_batch(target: Collection, batch: list[dict]) -> int:
+    """Insert a batch, ignoring documents copied by a previous run."""
+    try:
+        return len(target.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as err:
+        errors = err.details["writeErrors"]
+        if any(e["code"] != DUPLICATE_KEY_ERROR for e in errors):
+            raise
+        return err.details["nInserted"]
+
+
+def migrate_collection(
+    source: Collection, target: Collection, *, batch_size: int
+) -> int:
+    inserted = 0
+    batch = []
+    cursor = source.find(
+        {}, sort=[(CREATED_AT_KEY, 1)], batch_size=batch_size
+    )
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            inserted += insert_batch(target, batch)
+            batch = []
+    if batch:
+        inserted += insert_batch(target, batch)
+    return inserted
+
+
+def migrate(*, batch_size: int = 1000, keep_source: bool = False) -> None:
+    client = MongoClient(MONGO_URI)
+    db = client[DATABASE_NAME]
+    target = db[CHAT_HISTORY_COLLECTION_NAME]
+    target.create_index([(SESSION_ID_KEY, 1), (CREATED_AT_KEY, 1)])
+    names = [
+        name for name in db.list_collection_names()
+        if is_session_collection(db, name)
+    ]
+    print(f"Migrating {len(names)} session collections to "
+          f'"{CHAT_HISTORY_COLLECTION_NAME}".')
+    total = 0
+    for i, name in enumerate(names, 1):
+        source = db[name]
+        inserted = migrate_collection(source, target, batch_size=batch_size)
+        total += inserted
+        # every batch either got inserted or was already there, otherwise
+        # insert_batch would have raised before the source is dropped
+        if not keep_source:
+            source.drop()
+        print(f"[{i}/{len(names)}] {name}: {inserted} messages moved")
+    print(f"Done. {total} messages moved.")
+    client.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Move per-session chat history to a shared collection."
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--keep-source", action="store_true")
+    args = parser.parse_args()
+    migrate(batch_size=args.batch_size, keep_source=args.keep_source)
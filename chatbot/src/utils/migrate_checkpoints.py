@@ -0,0 +1,156 @@
+##############################################################################
+##############################################################################
+# ####### ONE-OFF SCRIPT TO MERGE PER-SESSION CHECKPOINT COLLECTIONS ####### #
+##############################################################################
+##############################################################################
+
+# LangGraph checkpoints used to be stored in one collection per phone number,
+# with the pending writes in a `{phone number}_writes` collection that had
+# no TTL index and was never cleaned up. This script copies the checkpoints
+# and pending writes that have not expired yet into the shared collections,
+# creates their indexes, and drops the old collections once they are copied.
+# Documents keep their _id, so the script can be re-run safely after an
+# interruption; checkpoints already written to the shared collection by the
+# running bot win over their copies.
+#
+# Run from the `./chatbot/src` directory:
+#     python -m utils.migrate_checkpoints [--batch-size 1000] [--keep-source]
+
+from argparse import ArgumentParser
+from datetime import UTC, datetime, timedelta
+from os import getenv
+
+from dotenv import load_dotenv
+
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.mongo_client import MongoClient
+
+from agents.memory.checkpoint import (
+    CHECKPOINTS_INDEX_KEYS,
+    CHECKPOINTS_INDEX_NAME,
+    CONFIG_KEYS,
+    WRITES_INDEX_KEYS,
+    WRITES_INDEX_NAME,
+)
+
+from .config import (
+    CHECKPOINT_COLLECTION_NAME,
+    CHECKPOINT_INDEX_NAME,
+    TTL_EXPIRE_AFTER_SECONDS,
+    TTL_INDEX_KEY,
+)
+from .migrate_chat_history import insert_batch
+
+load_dotenv()
+
+DATABASE_NAME = getenv("BUSINESS_NAME", "").replace(" ", "")
+MONGO_URI = getenv("SHORT_TERM_MEMORY_URI")
+CHECKPOINT_KEYS = (*CONFIG_KEYS, "checkpoint")
+WRITE_KEYS = (*CONFIG_KEYS, "task_id", "channel")
+WRITES_SUFFIX = "_writes"
+
+
+def holds(db: Database, name: str, keys: tuple[str, ...]) -> bool:
+    doc = db[name].find_one(
+        {key: {"$exists": True} for key in keys}, projection={"_id": 1}
+    )
+    return doc is not None
+
+
+def session_collections(db: Database) -> list[tuple[str, str | None]]:
+    """The per-session checkpoint collections, each with the name of its
+    writes collection if there is one."""
+    shared = {
+        CHECKPOINT_COLLECTION_NAME,
+        f"{CHECKPOINT_COLLECTION_NAME}{WRITES_SUFFIX}",
+    }
+    names = set(db.list_collection_names()) - shared
+    pairs = []
+    for name in sorted(names):
+        if name.startswith("system.") or not holds(db, name, CHECKPOINT_KEYS):
+            continue
+        writes = f"{name}{WRITES_SUFFIX}"
+        pairs.append(
+            (name, writes if writes in names and holds(db, writes, WRITE_KEYS) else None)  # noqa: E501
+        )
+    return pairs
+
+
+def migrate_collection(
+    source: Collection,
+    target: Collection,
+    *,
+    since: datetime,
+    batch_size: int
+) -> int:
+    inserted = 0
+    batch = []
+    cursor = source.find(
+        {TTL_INDEX_KEY: {"$gte": since}}, batch_size=batch_size
+    )
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            inserted += insert_batch(target, batch)
+            batch = []
+    if batch:
+        inserted += insert_batch(target, batch)
+    return inserted
+
+
+def create_indexes(checkpoints: Collection, writes: Collection) -> None:
+    """The indexes `AsyncMongoDBSaver.create_indexes` creates at startup."""
+    checkpoints.create_index(
+        CHECKPOINTS_INDEX_KEYS, name=CHECKPOINTS_INDEX_NAME, unique=True
+    )
+    writes.create_index(WRITES_INDEX_KEYS, name=WRITES_INDEX_NAME)
+    for collection in (checkpoints, writes):
+        collection.create_index(
+            TTL_INDEX_KEY,
+            name=CHECKPOINT_INDEX_NAME,
+            expireAfterSeconds=TTL_EXPIRE_AFTER_SECONDS,
+        )
+
+
+def migrate(*, batch_size: int = 1000, keep_source: bool = False) -> None:
+    client = MongoClient(MONGO_URI)
+    db = client[DATABASE_NAME]
+    checkpoints = db[CHECKPOINT_COLLECTION_NAME]
+    writes = db[f"{CHECKPOINT_COLLECTION_NAME}{WRITES_SUFFIX}"]
+    create_indexes(checkpoints, writes)
+    pairs = session_collections(db)
+    print(f"Migrating {len(pairs)} session checkpoint collections to "
+          f'"{CHECKPOINT_COLLECTION_NAME}".')
+    # older documents would be deleted by the TTL index right away
+    since = datetime.now(UTC) - timedelta(seconds=TTL_EXPIRE_AFTER_SECONDS)
+    totals = [0, 0]
+    for i, (name, writes_name) in enumerate(pairs, 1):
+        moved = [
+            migrate_collection(
+                db[source], target, since=since, batch_size=batch_size
+            ) if source else 0
+            for source, target in ((name, checkpoints), (writes_name, writes))
+        ]
+        totals = [total + n for total, n in zip(totals, moved)]
+        # every batch either got inserted or was already there, otherwise
+        # insert_batch would have raised before the sources are dropped
+        if not keep_source:
+            db[name].drop()
+            if writes_name:
+                db[writes_name].drop()
+        print(f"[{i}/{len(pairs)}] {name}: {moved[0]} checkpoints and "
+              f"{moved[1]} pending writes moved")
+    print(f"Done. {totals[0]} checkpoints and {totals[1]} pending writes "
+          "moved.")
+    client.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description="Move per-session checkpoints to shared collections."
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--keep-source", action="store_true")
+    args = parser.parse_args()
+    migrate(batch_size=args.batch_size, keep_source=args.keep_source)
@@ -0,0 +1,164 @@
+from asyncio import (
+    CancelledError,
+    Queue,
+    QueueEmpty,
+    QueueFull,
+    Task,
+    create_task,
+    gather,
+    wait_for,
+)
+import logging
+from time import perf_counter
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from agents.typing import TwilioResponseMessage
+
+logger = logging.getLogger(__name__)
+
+
+class InboundSMS(NamedTuple):
+    input_message: str
+    to: str
+    enqueued_at: float
+
+
+class SMSWorkerPool:
+    """A bounded pool of asyncio workers that answers inbound SMS messages
+    in the background.
+
+    The webhook only has to validate and enqueue the message so that Twilio
+    gets its response right away; a worker picks the message up, runs the
+    (potentially slow) answer generation and sends the reply through the
+    Twilio REST client.
+
+    Instantiate:
+        .. code-block:: python
+
+            pool = SMSWorkerPool(
+                handler=conn.send_sms,
+                size=4,
+                max_queue_size=100,
+            )
+            pool.start()                 # inside a running event loop
+            pool.enqueue(input_message="what time is checkout?", to="+1...")
+            await pool.aclose()          # drain the queue on shutdown
+    """
+
+    def __init__(
+        self,
+        *,
+        handler: Callable[..., Awaitable[TwilioResponseMessage]],
+        size: int = 4,
+        max_queue_size: int = 100,
+    ) -> None:
+        self.handler = handler
+        self.size = size
+        self.max_queue_size = max_queue_size
+        self._queue: Queue[InboundSMS] = Queue(maxsize=max_queue_size)
+        self._workers: list[Task] = []
+        # metrics
+        self._enqueued = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._in_flight = 0
+        self._queue_high_water_mark = 0
+        self._total_wait_time = 0.0
+        self._total_handle_time = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return any(not worker.done() for worker in self._workers)
+
+    @property
+    def metrics(self) -> dict[str, Any]:
+        handled = self._completed + self._failed
+        return {
+            "workers": self.size,
+            "running": self.is_running,
+            "queue_depth": self._queue.qsize(),
+            "queue_max_size": self.max_queue_size,
+            "queue_high_water_mark": self._queue_high_water_mark,
+            "in_flight": self._in_flight,
+            "enqueued": self._enqueued,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_wait_seconds": self._total_wait_time / handled if handled else 0.0,  # noqa: E501
+            "avg_handle_seconds": self._total_handle_time / handled if handled else 0.0,  # noqa: E501
+        }
+
+    def start(self) -> None:
+        """Spawn the workers. Must be called from a running event loop."""
+        if self.is_running:
+            return
+        self._workers = [
+            create_task(self._worker(), name=f"sms-worker-{i}")
+            for i in range(self.size)
+        ]
+
+    def enqueue(self, *, input_message: str, to: str) -> bool:
+        """Put an inbound message on the queue without waiting.
+        Returns False if the queue is full and the message was rejected."""
+        try:
+            self._queue.put_nowait(
+                InboundSMS(input_message, to, perf_counter())
+            )
+        except QueueFull:
+            self._rejected += 1
+            return False
+        self._enqueued += 1
+        self._queue_high_water_mark = max(
+            self._queue_high_water_mark, self._queue.qsize()
+        )
+        return True
+
+    async def aclose(self, timeout: float | None = None) -> None:
+        """Wait (at most `timeout` seconds) for the queued messages to be
+        answered, then stop the workers."""
+        if self._workers:
+            try:
+                await wait_for(self._queue.join(), timeout=timeout)
+            except TimeoutError:
+                logger.error(
+                    "SMS worker pool closed with %d unanswered messages.",
+                    self._queue.qsize() + self._in_flight
+                )
+            for worker in self._workers:
+                worker.cancel()
+            await gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        # anything still on the queue at this point will never be answered
+        while True:
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+            except QueueEmpty:
+                break
+
+    async def _worker(self) -> None:
+        while True:
+            message = await self._queue.get()
+            started_at = perf_counter()
+            self._total_wait_time += started_at - message.enqueued_at
+            self._in_flight += 1
+            try:
+                response = await self.handler(
+                    input_message=message.input_message, to=message.to
+                )
+                if response.sid is None:
+                    # the answer was generated but Twilio did not send it
+                    self._failed += 1
+                    logger.error(response.body)
+                else:
+                    self._completed += 1
+            except CancelledError:
+                raise
+            except Exception as err:
+                self._failed += 1
+                logger.exception(err)
+            finally:
+                self._in_flight -= 1
+                self._total_handle_time += perf_counter() - started_at
+                self._queue.task_done()
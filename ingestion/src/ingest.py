@@ -15,6 +15,7 @@ from .config import (
     CHUNK_OVERLAP,
     CHUNK_SIZE,
     CHUNK_SEPARATOR,
+    DOCUMENT_VERSIONS_COLLECTION_NAME,
     INDEX_NAME,
     MODEL_NAME,
     DEBUG,
@@ -186,5 +187,18 @@ class IngestData:
                     sleep(2)
                     continue
             break
+        self.bump_document_version()
         if DEBUG:
             print("Ingestion complete!")
+
+    def bump_document_version(self) -> None:
+        """
+        Record that the business document changed, so that the chatbot
+        drops the answers it cached from the previous one
+        """
+        versions = self.collection.database[DOCUMENT_VERSIONS_COLLECTION_NAME]
+        versions.update_one(
+            {"_id": self.collection.name},
+            {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}},
+            upsert=True
+        )